@@ -0,0 +1,213 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAMEWORK_DIR = os.path.dirname(BENCHMARK_DIR)
+SRC_DIR = os.path.join(FRAMEWORK_DIR, 'src')
+sys.path.insert(0, SRC_DIR)
+
+import numpy as np
+import catalog
+import derate_curve
+from batch_model import evaluate_grid
+from carbon_model import (ServerCarbon, index_cpu_data, index_memory_data, index_ssd_data, index_nic_data,
+                          index_dc_data, index_rack_data, index_server_data, index_cxl_controller_data)
+from maintenance_model import ServerMaintenance
+from synthetic_catalog import make_synthetic_catalog
+
+DATA_DIR = os.path.join(FRAMEWORK_DIR, 'data', 'carbon_data')
+AFR_FILE = os.path.join(FRAMEWORK_DIR, 'data', 'AFR_data', 'afr_data.yaml')
+CONFIG_FILES = sorted(glob.glob(os.path.join(FRAMEWORK_DIR, 'server_configs', 'Eval-Configs', '*.yaml')))
+THRESHOLDS_FILE = os.path.join(BENCHMARK_DIR, 'thresholds.json')
+# thresholds are never set below this, so microsecond-scale benchmarks do not flake on noisy machines
+THRESHOLD_FLOOR_MS = 0.05
+# modules timed by import_cold, and the optional dependencies that importing them must not load
+IMPORT_MODULES = ['carbon_model', 'batch_model', 'maintenance_model', 'sweep']
+LAZY_DEPENDENCIES = ['pandas', 'scipy', 'matplotlib', 'pyarrow']
+
+def measure(func: Callable[[], Any], setup: Optional[Callable[[], Any]]=None, repeat: int=5,
+            number: Optional[int]=None, min_time: float=0.05) -> Dict[str, float]:
+    """Time a function.
+
+    Args:
+        func: The function to time.
+        setup: A function run (untimed) before every timed call, e.g. to clear caches.
+        repeat: The number of timing runs.
+        number: Calls per run (default: enough calls for min_time seconds,
+                or 1 if there is a setup function).
+        min_time: The minimum time of a run when number is not given.
+
+    Returns:
+        The best and median time per call in ms, and the calls per run.
+    """
+    if setup is not None:
+        number = 1
+    if number is None:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            if time.perf_counter() - start >= min_time:
+                break
+            number *= 2
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) * 1000 / number)
+    return {'best_ms': min(times), 'median_ms': statistics.median(times), 'number': number}
+
+def measure_import(module: str, repeat: int=5) -> Dict[str, Any]:
+    """Time importing a module in fresh interpreters.
+
+    Returns:
+        The best and median import time in ms, and the lazy dependencies
+        (LAZY_DEPENDENCIES) that the import loaded.
+    """
+    code = ('import json, sys, time\n'
+            'start = time.perf_counter()\n'
+            f'import {module}\n'
+            'elapsed = (time.perf_counter() - start) * 1000\n'
+            f'print(json.dumps([elapsed, [name for name in {LAZY_DEPENDENCIES!r} if name in sys.modules]]))')
+    times = []
+    loaded: List[str] = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+        elapsed, loaded = json.loads(output.stdout)
+        times.append(elapsed)
+    return {'best_ms': min(times), 'median_ms': statistics.median(times), 'number': 1, 'loaded': loaded}
+
+def clear_caches() -> None:
+    """Drop the parsed YAML files, catalog indexes and derate fits of this process."""
+    catalog.invalidate()
+    derate_curve.fit_cache.clear()
+
+def _config_name(config_file: str) -> str:
+    return os.path.splitext(os.path.basename(config_file))[0]
+
+def benchmarks(data_dir: str) -> Dict[str, Callable[[], Dict[str, float]]]:
+    """Get the benchmarks to run against one carbon data directory."""
+    suite: Dict[str, Callable[[], Dict[str, float]]] = {}
+    for config_file in CONFIG_FILES:
+        name = _config_name(config_file)
+        build = lambda config_file=config_file: ServerCarbon(config_file, data_dir, print_out=False)
+        suite[f'construct_cold[{name}]'] = lambda build=build: measure(build, setup=clear_caches, repeat=3)
+        suite[f'construct_warm[{name}]'] = lambda build=build: measure(build)
+
+    derates = catalog.ComponentCatalog.for_dir(data_dir).cpu('AMD', 'Genoa', 80)['spec_derates']
+    suite['fit_cubic[uncached]'] = lambda: measure(lambda: derate_curve.fit_cubic(derates, cache=derate_curve.FitCache()))
+    suite['fit_cubic[cached]'] = lambda: measure(lambda: derate_curve.fit_cubic(derates))
+
+    lookups = {
+        'index_cpu_data': lambda: index_cpu_data('AMD', 'Genoa', 80, data_source=data_dir),
+        'index_memory_data': lambda: index_memory_data('DDR5', '4800MHz', '64GB', data_source=data_dir),
+        'index_ssd_data': lambda: index_ssd_data('E1.S', '2TB', data_source=data_dir),
+        'index_nic_data': lambda: index_nic_data('100G', data_source=data_dir),
+        'index_dc_data': lambda: index_dc_data('DC', data_source=data_dir),
+        'index_rack_data': lambda: index_rack_data('Rack', data_source=data_dir),
+        'index_server_data': lambda: index_server_data('Server-1U', data_source=data_dir),
+        'index_cxl_controller_data': lambda: index_cxl_controller_data('default', data_source=data_dir),
+    }
+    for name, lookup in lookups.items():
+        suite[name] = lambda lookup=lookup: measure(lookup)
+
+    config_file = os.path.join(FRAMEWORK_DIR, 'server_configs', 'Eval-Configs', 'GreenSKU-Full.yaml')
+    model = ServerCarbon(config_file, data_dir, print_out=False)
+    suite['get_info_dict'] = lambda: measure(model.get_info_dict)
+    suite['get_rack_carbon_df'] = lambda: measure(model.get_rack_carbon_df)
+    maintenance = ServerMaintenance(None, AFR_FILE, model=model)
+    suite['get_AFRs'] = lambda: measure(maintenance.get_AFRs)
+    suite['ServerMaintenance+get_AFRs'] = lambda: measure(lambda: ServerMaintenance(None, AFR_FILE, model=model).get_AFRs())
+
+    intensities = np.linspace(0.0, 1.0, 1000)
+    suite['ci_sweep_1k[with_params]'] = lambda: measure(
+        lambda: [model.with_params(emissions_factor=ci).get_carbon_per_sellable_core() for ci in intensities], repeat=3)
+    suite['ci_sweep_1k[carbon_curve]'] = lambda: measure(lambda: model.carbon_curve(intensities))
+    suite['ci_sweep_1k[batch]'] = lambda: measure(
+        lambda: evaluate_grid(config_file, {'emissions_factor': intensities}, data_dir))
+    return suite
+
+def run(scales: List[int], selected: Optional[List[str]]=None) -> Dict[str, Dict[str, float]]:
+    """Run the suite at each catalog scale.
+
+    Returns:
+        Results keyed by '<benchmark>@x<scale>'.
+    """
+    results = {}
+    # import times do not depend on the catalog, so they are only measured once
+    for module in IMPORT_MODULES:
+        key = f'import_cold[{module}]'
+        if selected and not any(pattern in key for pattern in selected):
+            continue
+        results[key] = measure_import(module)
+        print(f"{key:55s} {results[key]['best_ms']:10.4f} ms (median {results[key]['median_ms']:.4f} ms)")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in scales:
+            data_dir = DATA_DIR if scale == 1 else make_synthetic_catalog(DATA_DIR, os.path.join(tmp_dir, f'x{scale}'), scale)
+            clear_caches()
+            for name, bench in benchmarks(data_dir).items():
+                key = f'{name}@x{scale}'
+                if selected and not any(pattern in key for pattern in selected):
+                    continue
+                results[key] = bench()
+                print(f"{key:55s} {results[key]['best_ms']:10.4f} ms (median {results[key]['median_ms']:.4f} ms)")
+    return results
+
+def check(results: Dict[str, Dict[str, Any]], thresholds: Dict[str, float]) -> List[str]:
+    """Get the benchmarks whose best time is above their threshold, and imports that loaded lazy dependencies."""
+    failures = [f"{key}: {result['best_ms']:.4f} ms > {thresholds[key]} ms"
+                for key, result in results.items() if key in thresholds and result['best_ms'] > thresholds[key]]
+    failures += [f"{key}: loaded {', '.join(result['loaded'])}" for key, result in results.items() if result.get('loaded')]
+    return failures
+
+def main(argv: Optional[List[str]]=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the carbon model hot paths.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='catalog scale factors (1 is the shipped catalog)')
+    parser.add_argument('-k', '--select', nargs='+', default=None, help='only run benchmarks containing these strings')
+    parser.add_argument('-o', '--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--check', action='store_true', help='fail if a benchmark is slower than its threshold')
+    parser.add_argument('--thresholds', default=THRESHOLDS_FILE, help='regression thresholds JSON file')
+    parser.add_argument('--update-thresholds', type=float, default=None, metavar='FACTOR',
+                        help='rewrite the thresholds as FACTOR times the measured best times')
+    args = parser.parse_args(argv)
+
+    results = run(args.scales, args.select)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.update_thresholds is not None:
+        stored = {}
+        if os.path.exists(args.thresholds):
+            with open(args.thresholds) as f:
+                stored = json.load(f)
+        for key, result in results.items():
+            stored[key] = float(f"{max(result['best_ms'] * args.update_thresholds, THRESHOLD_FLOOR_MS):.3g}")
+        with open(args.thresholds, 'w') as f:
+            json.dump(dict(sorted(stored.items())), f, indent=2)
+            f.write('\n')
+    if args.check:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+        failures = check(results, thresholds)
+        for failure in failures:
+            print(f'REGRESSION {failure}')
+        if failures:
+            return 1
+        print(f'All {sum(key in thresholds for key in results)} benchmarks with thresholds passed')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import copy
+import os
+import shutil
+import sys
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from helpers import read_yaml_fast, write_yaml
+
+CATALOG_FILES = ['CPU.yaml', 'DRAM.yaml', 'SSD.yaml', 'SSD_reuse.yaml', 'NIC.yaml', 'CXL_controller.yaml',
+                 'server.yaml', 'rack.yaml', 'data_center.yaml']
+
+def _perturb(derates: Dict[Any, float], copy_index: int) -> Dict[Any, float]:
+    # slightly different derate tables, so that copies are fitted separately
+    return {spec: round(value * (1 + 1e-3 * copy_index), 6) for spec, value in derates.items()}
+
+def _scale_section(section: Any, copy_index: int) -> Any:
+    section = copy.deepcopy(section)
+    if isinstance(section, dict) and 'spec_derates' in section:
+        section['spec_derates'] = _perturb(section['spec_derates'], copy_index)
+    return section
+
+def _scale(yaml_name: str, data: Any, factor: int) -> Any:
+    data = copy.deepcopy(data)
+    for i in range(1, factor):
+        suffix = f'-x{i}'
+        if yaml_name == 'CPU.yaml':
+            for vendor in data:
+                vendor['types'] = vendor['types'] + [dict(_scale_section(t, i), type=t['type'] + suffix)
+                                                     for t in vendor['types'] if '-x' not in t['type']]
+        elif yaml_name == 'DRAM.yaml':
+            for memory_type in [t for t in list(data) if '-x' not in t]:
+                data[memory_type + suffix] = _scale_section(data[memory_type], i)
+        elif yaml_name == 'NIC.yaml':
+            data['bandwidths'] = data['bandwidths'] + [dict(b, bandwidth=b['bandwidth'] + suffix)
+                                                       for b in data['bandwidths'] if '-x' not in b['bandwidth']]
+        elif yaml_name == 'CXL_controller.yaml':
+            for controller in [t for t in list(data['types']) if '-x' not in t]:
+                data['types'][controller + suffix] = copy.deepcopy(data['types'][controller])
+        else:
+            # lists of {type: ..., ...} entries
+            data.extend([dict(_scale_section(entry, i), type=entry['type'] + suffix)
+                         for entry in list(data) if '-x' not in entry['type']])
+    return data
+
+def make_synthetic_catalog(data_source_dir: str, output_dir: str, factor: int) -> str:
+    """Write a copy of a carbon data directory with every catalog file scaled up.
+
+    Each component entry is repeated factor times (the copies get a '-x<i>'
+    suffix on their type and slightly different derate tables), so all
+    original lookup keys still resolve, but every file is factor times
+    larger to parse and index.
+
+    Args:
+        data_source_dir: The carbon data directory to scale.
+        output_dir: The directory to write the scaled catalog to.
+        factor: The number of copies of each entry.
+
+    Returns:
+        The output directory.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for file_name in os.listdir(data_source_dir):
+        source = os.path.join(data_source_dir, file_name)
+        target = os.path.join(output_dir, file_name)
+        if file_name in CATALOG_FILES:
+            write_yaml(target, _scale(file_name, read_yaml_fast(source), factor))
+        elif os.path.isfile(source):
+            shutil.copyfile(source, target)
+    return output_dir
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print('usage: python synthetic_catalog.py <data_source_dir> <output_dir> <factor>')
+        sys.exit(1)
+    make_synthetic_catalog(sys.argv[1], sys.argv[2], int(sys.argv[3]))
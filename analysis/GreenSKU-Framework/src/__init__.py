@@ -3,7 +3,8 @@ Source code for
 (1) carbon model (carbon_model.py), 
 (2) maintenance model (maintenance_model.py), 
 (3) derating curves calculation (derate_curve.py),
-(4) helper functions (helpers.py) are stored in the src directory. 
+(4) helper functions (helpers.py), 
+(5) carbon data catalog caching (catalog.py) are stored in the src directory. 
 
-The carbon model calculates the carbon emissions of a server configuration, the maintenance model calculates the annual failure rate (AFR) of a server configuration, the derating curve module inter/extrapolates derating curves based on provided data, and the helper functions provide utility functions for reading YAML files and other tasks.
+The carbon model calculates the carbon emissions of a server configuration, the maintenance model calculates the annual failure rate (AFR) of a server configuration, the derating curve module inter/extrapolates derating curves based on provided data, the helper functions provide utility functions for reading YAML files and other tasks, and the catalog module caches parsed carbon data so repeated model construction does not re-parse it.
 '''
\ No newline at end of file
@@ -0,0 +1,246 @@
+from typing import Any, Dict, Optional
+import numpy as np
+from carbon_model import ServerCarbon, strip_power
+
+AMORTIZED_COMPONENTS = ['server', 'rack', 'dc']
+
+class BatchServerCarbon:
+    """Evaluate one server configuration over arrays of model parameters at once.
+
+    The components, derate curves, capacities and sellable cores of a
+    configuration do not depend on the parameters in GRID_PARAMS, so they are
+    resolved once (by building a ServerCarbon). evaluate() then runs the
+    component power -> fan power -> component carbon -> server count -> rack
+    carbon -> rack count -> DC carbon pipeline of ServerCarbon as NumPy array
+    math over any number of parameter points.
+    """
+    GRID_PARAMS = ('emissions_factor', 'PUE', 'power_factor', 'lifetime', 'fan_slope',
+                   'PSU_efficiency', 'voltage_regulator_overhead', 'cpu_efficiency',
+                   '1U_server_base', '2U_server_base')
+
+    def __init__(self, config_file: str, data_source_dir: str="../data/carbon_data",
+                 overwrite_params: Optional[Dict[str, Any]]=None, model: Optional[ServerCarbon]=None) -> None:
+        """Initialize the batch model.
+
+        Args:
+            config_file: The YAML file containing the server configuration.
+            data_source_dir: The carbon data directory (or compiled catalog file).
+            overwrite_params: Parameters that override params.yaml for every point.
+            model: An already built ServerCarbon for the configuration to reuse
+                   instead of building one from config_file.
+        """
+        if model is None:
+            model = ServerCarbon(config_file, data_source_dir, overwrite_params=overwrite_params, print_out=False)
+        self.model = model
+        # emissions_factor is stored by the model in kgCO2e/kWMonth - keep kgCO2e/kWh here
+        self.base_params = dict(model.params)
+        if 'emissions_factor' in self.base_params:
+            self.base_params['emissions_factor'] /= 24 * 30
+        for key in ('1U_server_base', '2U_server_base'):
+            if key in self.base_params:
+                self.base_params[key] = strip_power(self.base_params[key])
+        curves = model.component_derate_curves
+        self.allocated_derates = {key: curve(model.allocated_spec) for key, curve in curves.items()}
+        self.provisioned_derates = {key: curve(model.provisioned_spec) for key, curve in curves.items()}
+
+    def _broadcast_params(self, params: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        for key in params:
+            if key not in self.base_params:
+                raise ValueError(f'Parameter {key} not found in params.yaml')
+            if key not in self.GRID_PARAMS:
+                raise ValueError(f'Parameter {key} cannot be varied in a batch (supported: {", ".join(self.GRID_PARAMS)})')
+        values = {key: params.get(key, self.base_params.get(key, np.nan)) for key in self.GRID_PARAMS}
+        arrays = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in values.values()])
+        return {key: np.atleast_1d(array) for key, array in zip(values, arrays)}
+
+    def _component_power(self, P: Dict[str, np.ndarray], fan_power: np.ndarray, derates: Dict[str, float]) -> Dict[str, np.ndarray]:
+        """Vectorized ServerCarbon._set_component_power for one spec (allocated or provisioned)."""
+        power = {}
+        for key, value in self.model.data.items():
+            factor = 1.0
+            if key in AMORTIZED_COMPONENTS:
+                total = 0.0
+                for _key, component in value.items():
+                    component_power = fan_power if key == 'server' and _key == 'fan' else component['power']
+                    total = total + component_power * component.get('number', 1) * derates[key] * factor
+                power[key] = total
+                continue
+            if key == 'cpu':
+                factor = factor * P['voltage_regulator_overhead']
+                factor = factor * P['cpu_efficiency']
+            power[key] = value['power'] * value.get('number', 1) * derates[key] * factor
+        return power
+
+    def _server_power(self, P: Dict[str, np.ndarray], component_power: Dict[str, np.ndarray], include_rack: bool=False) -> np.ndarray:
+        """Vectorized ServerCarbon.get_server_power (or get_rack_power with include_rack)."""
+        total = 0.0
+        for key in self.model.data:
+            if key == 'rack' and not include_rack:
+                continue
+            if key in ServerCarbon.per_socket:
+                total = total + component_power[key] * self.model.socket_count
+                continue
+            total = total + component_power[key]
+        return total * (1.0 + (1.0 - P['PSU_efficiency']))
+
+    def _fan_power(self, P: Dict[str, np.ndarray]) -> np.ndarray:
+        """Vectorized ServerCarbon._set_fan_power."""
+        model = self.model
+        base_fan_power = np.full(P['fan_slope'].shape, model.base_fan_power if model.base_fan_power is not None else 0.0)
+        if model.base_fan_power is None or not np.any(P['fan_slope'] > 0):
+            return base_fan_power
+        allocated = self._component_power(P, base_fan_power, self.allocated_derates)
+        used_power = self._server_power(P, allocated) * P['power_factor']
+        fan = model.data['server']['fan']
+        derated_fan_power = model.base_fan_power * fan.get('number', 1) * self.allocated_derates['fan'] * 1.0
+        server_power_no_fan = used_power - derated_fan_power * P['power_factor']
+        base_power = P['1U_server_base'] if model.config['form'] == '1U' else P['2U_server_base']
+        adjusted = model.base_fan_power + P['fan_slope'] * (server_power_no_fan - base_power)
+        return np.where(P['fan_slope'] > 0, adjusted, base_fan_power)
+
+    def evaluate(self, **params: Any) -> Dict[str, np.ndarray]:
+        """Evaluate the model over arrays of parameters.
+
+        Args:
+            params: Values for any of GRID_PARAMS, as scalars or arrays that
+                    broadcast against each other. Parameters that are not given
+                    keep the model's value. emissions_factor is in kgCO2e/kWh, as
+                    for ServerCarbon's overwrite_params.
+
+        Returns:
+            A dict of output name to array with one entry per parameter point.
+            Per-sellable-core values are not rounded (unlike the ServerCarbon
+            getters).
+        """
+        model = self.model
+        P = self._broadcast_params(params)
+        socket_count = model.socket_count
+        opex_rate = P['emissions_factor'] * 24 * 30
+        lifetime = P['lifetime']
+
+        fan_power = self._fan_power(P)
+        allocated = self._component_power(P, fan_power, self.allocated_derates)
+        provisioned = self._component_power(P, fan_power, self.provisioned_derates)
+
+        # component carbon
+        operational = {}
+        embodied = {}
+        for key, value in model.data.items():
+            factor = P['PUE'] * P['power_factor']
+            if key in AMORTIZED_COMPONENTS:
+                total_opex = 0.0
+                total_capex = 0.0
+                for _key, component in value.items():
+                    component_power = fan_power if key == 'server' and _key == 'fan' else component['power']
+                    number = component.get('number', 1)
+                    total_opex = total_opex + (component_power / 1000) * opex_rate * self.allocated_derates[_key] * lifetime * number * factor
+                    total_capex = total_capex + component['carbon'] * component.get('number', 1.0) * self._lifetime_factor(component, lifetime) * 1.0
+                operational[key] = total_opex
+                embodied[key] = total_capex
+                continue
+            if key == 'cpu':
+                factor = factor * P['voltage_regulator_overhead']
+                factor = factor * P['cpu_efficiency']
+            operational[key] = (value['power'] / 1000) * opex_rate * self.allocated_derates[key] * lifetime * value.get('number', 1) * factor
+            embodied[key] = value['carbon'] * value.get('number', 1.0) * self._lifetime_factor(value, lifetime) * factor
+
+        # server carbon (not amortized)
+        server_operational = 0.0
+        server_embodied = 0.0
+        for key in operational:
+            if key == 'rack' or key == 'dc':
+                continue
+            multiplier = socket_count if key in ServerCarbon.per_socket else 1
+            server_operational = server_operational + operational[key] * multiplier
+            server_embodied = server_embodied + embodied[key] * multiplier
+
+        server_provisioned_power = self._server_power(P, provisioned)
+        server_allocated_power = self._server_power(P, allocated)
+
+        # server count
+        rack_config = model.config['rack']
+        if 'num_servers' in rack_config and rack_config['num_servers'] is not None and rack_config['num_servers'] > 0:
+            server_count = np.full(lifetime.shape, float(rack_config['num_servers']))
+            power_limited = np.zeros(lifetime.shape, dtype=bool)
+        else:
+            rack_set_power = rack_config['power'] - provisioned['rack']
+            power_server_count = np.floor(rack_set_power / server_provisioned_power)
+            capacity_server_count = np.floor(model.get_rack_capacity() / model.get_server_form())
+            power_limited = power_server_count < capacity_server_count
+            server_count = np.where(power_limited, power_server_count, capacity_server_count)
+
+        # rack carbon
+        rack_operational = operational['rack'] + server_operational * server_count
+        rack_embodied = embodied['rack'] + server_embodied * server_count
+
+        # rack count
+        rack_provisioned_power = self._server_power(P, provisioned, include_rack=True)
+        power_rack_count = np.floor(model.get_dc_power_capacity() / rack_provisioned_power)
+        capacity_rack_count = model.get_dc_capacity()
+        dc_power_limited = power_rack_count < capacity_rack_count
+        rack_count = np.where(dc_power_limited, power_rack_count, capacity_rack_count)
+
+        # dc carbon
+        dc_operational = operational['dc'] + rack_operational * rack_count
+        dc_embodied = embodied['dc'] + rack_embodied * rack_count
+
+        rack_sellable_cores = model.get_server_sellable_cores() * server_count
+        dc_sellable_cores = rack_sellable_cores * rack_count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'server_count': server_count,
+                'power_limited': power_limited,
+                'rack_count': rack_count,
+                'dc_power_limited': dc_power_limited,
+                'server_design_power': server_provisioned_power,
+                'server_allocated_power': server_allocated_power,
+                'server_operational': server_operational,
+                'server_embodied': server_embodied,
+                'server_carbon': server_operational + server_embodied,
+                'rack_operational': rack_operational,
+                'rack_embodied': rack_embodied,
+                'rack_carbon': rack_operational + rack_embodied,
+                'dc_operational': dc_operational,
+                'dc_embodied': dc_embodied,
+                'dc_carbon': dc_operational + dc_embodied,
+                'per_server_carbon': (rack_operational + rack_embodied) / server_count,
+                'operational_per_sellable_core': rack_operational / rack_sellable_cores,
+                'embodied_per_sellable_core': rack_embodied / rack_sellable_cores,
+                'carbon_per_sellable_core': (rack_operational + rack_embodied) / rack_sellable_cores,
+                'carbon_per_sellable_core_dc': (dc_operational + dc_embodied) / dc_sellable_cores,
+            }
+
+    @staticmethod
+    def _lifetime_factor(component: Dict[str, Any], server_lifetime: np.ndarray) -> np.ndarray:
+        if 'lifetime' not in component:
+            return 1.0
+        return np.where(server_lifetime > 0, server_lifetime / component['lifetime'], 1.0)
+
+def param_grid(**axes: Any) -> Dict[str, np.ndarray]:
+    """Build the Cartesian product of parameter axes as flat arrays.
+
+    Args:
+        axes: Parameter name to the values to sweep for that parameter.
+
+    Returns:
+        Parameter name to a flat array, with one entry per grid point, that can
+        be passed to BatchServerCarbon.evaluate or evaluate_grid.
+    """
+    grids = np.meshgrid(*[np.asarray(values, dtype=float) for values in axes.values()], indexing='ij')
+    return {key: grid.ravel() for key, grid in zip(axes, grids)}
+
+def evaluate_grid(config_file: str, params_arrays: Dict[str, Any], data_source_dir: str="../data/carbon_data",
+                  overwrite_params: Optional[Dict[str, Any]]=None) -> Dict[str, np.ndarray]:
+    """Evaluate a server configuration over arrays of parameters in one call.
+
+    Args:
+        config_file: The YAML file containing the server configuration.
+        params_arrays: Parameter name to values (see BatchServerCarbon.evaluate).
+        data_source_dir: The carbon data directory (or compiled catalog file).
+        overwrite_params: Parameters that override params.yaml for every point.
+
+    Returns:
+        A dict of output name to array with one entry per parameter point.
+    """
+    batch = BatchServerCarbon(config_file, data_source_dir, overwrite_params=overwrite_params)
+    return batch.evaluate(**params_arrays)
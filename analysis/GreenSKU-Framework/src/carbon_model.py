@@ -1,10 +1,17 @@
-from typing import Dict, Any, List, Callable, Union, Tuple
-from derate_curve import fit_cubic
+from typing import Dict, Any, List, Union, Tuple, TYPE_CHECKING
+from derate_curve import fit_cubic, DerateCurve, NO_DERATE
 from math import ceil, floor
-import pandas as pd
+import copy
+import numpy as np
 from helpers import *
+from catalog import load_yaml_snapshot, freeze, thaw, copy_items, ComponentCatalog
+from carbon_result import CarbonResult
 
-def get_opex(power: float, spec: int=100, derate_curve: Callable=None, number: int=1, 
+if TYPE_CHECKING:
+    # pandas is only imported by the DataFrame getters, so that the model itself loads with NumPy only
+    import pandas as pd
+
+def get_opex(power: float, spec: int=100, derate_curve: DerateCurve=None, number: int=1, 
                   opex_rate: float=205.0, monthly_lifetime: int=72, 
                   factor: float=1.0) -> float:
     """Calculate the monthly opex cost of something that consumes power.
@@ -20,11 +27,11 @@ def get_opex(power: float, spec: int=100, derate_curve: Callable=None, number: i
         The monthly opex cost of the server.
     """
     if not derate_curve:
-        derate_curve = lambda x: 1
+        derate_curve = NO_DERATE
     # Calculate the monthly opex cost of the server
     return (power/1000) * opex_rate * derate_curve(spec) * monthly_lifetime * number * factor
 
-def get_opex_from_dict(component: Dict[str, Any], spec: int=100, derate_curve: Callable=None,
+def get_opex_from_dict(component: Dict[str, Any], spec: int=100, derate_curve: DerateCurve=None,
                             opex_rate: float=205.0, monthly_lifetime: int=72, factor: float=1.0) -> float:
     """Calculate the monthly opex cost of something that consumes power.
 
@@ -37,17 +44,15 @@ def get_opex_from_dict(component: Dict[str, Any], spec: int=100, derate_curve: C
         The monthly opex cost of the server.
     """
     # if no number is specified, assume there is only one
-    if 'number' not in component:
-        component['number'] = 1
     return get_opex(component['power'], 
                          spec, 
                          derate_curve, 
-                         component['number'], 
+                         component.get('number', 1), 
                          opex_rate, 
                          monthly_lifetime,
                          factor=factor)
 
-def get_dict_opex(components: Dict[str, Any], spec: int=100, derate_curve: Callable=None,
+def get_dict_opex(components: Dict[str, Any], spec: int=100, derate_curve: DerateCurve=None,
                   opex_rate: float=205.0, monthly_lifetime: int=72, factor: float=1.0) -> float:
     """Calculate the monthly opex cost of a component.
 
@@ -69,7 +74,7 @@ def get_dict_opex(components: Dict[str, Any], spec: int=100, derate_curve: Calla
                                               factor=factor)
     return total_opex
 
-def get_power_from_dict(component: Dict[str, Any], derate_curve: Callable, 
+def get_power_from_dict(component: Dict[str, Any], derate_curve: DerateCurve, 
                         spec: int=100, factor: float=1.0) -> float:
     """Calculate the power consumption of a component.
 
@@ -79,13 +84,11 @@ def get_power_from_dict(component: Dict[str, Any], derate_curve: Callable,
     Returns:
         The power consumption of the server.
     """
-    if 'number' not in component:
-        component['number'] = 1
     if not derate_curve:
-        derate_curve = lambda x: 1
-    return component['power'] * component['number'] * derate_curve(spec) * factor
+        derate_curve = NO_DERATE
+    return component['power'] * component.get('number', 1) * derate_curve(spec) * factor
 
-def get_dict_power(components: Dict[str, Any], derate_curve: Callable=None, 
+def get_dict_power(components: Dict[str, Any], derate_curve: DerateCurve=None, 
                    spec: int=100, factor: float=1.0, key_factors: Dict[str, float]={}) -> float:
     """Calculate the total power consumption of a component.
 
@@ -98,8 +101,6 @@ def get_dict_power(components: Dict[str, Any], derate_curve: Callable=None,
     total_power = 0
     for key, component in components.items():
         curr_factor = factor
-        if 'number' not in component:
-            component['number'] = 1
         if key in key_factors:
             curr_factor *= key_factors[key]
         total_power += get_power_from_dict(component, 
@@ -111,11 +112,9 @@ def get_dict_power(components: Dict[str, Any], derate_curve: Callable=None,
 def get_capex_from_dict(component: Dict[str, Any], cost='carbon', factor: float=1.0, 
                         server_lifetime: float=-1) -> float:
     lifetime_factor = 1.0
-    if 'number' not in component:
-        component['number'] = 1.0
     if 'lifetime' in component and server_lifetime > 0:
         lifetime_factor = server_lifetime / component['lifetime']
-    return component[cost] * component['number'] * lifetime_factor * factor
+    return component[cost] * component.get('number', 1.0) * lifetime_factor * factor
 
 def get_dict_capex(components: Dict[str, Any], cost='carbon', factor: float=1.0, 
                    server_lifetime: float=-1) -> float:
@@ -148,9 +147,7 @@ def get_list_capex(components: List[Dict[str, Any]]) -> float:
     total_capex = 0
     for component in components:
         # if no number is specified, assume there is only one
-        if 'number' not in component:
-            component['number'] = 1
-        total_capex += component['cost'] * component['number']
+        total_capex += component['cost'] * component.get('number', 1)
     return total_capex
 
 def index_cpu_data(vendor: str, cpu_type: str, core_count: int, data_source: str="data_sources") -> Dict[str, Any]:
@@ -165,28 +162,7 @@ def index_cpu_data(vendor: str, cpu_type: str, core_count: int, data_source: str
     Returns:
         A dictionary containing the CPU data.
     """
-    cpu_data = read_yaml(join_path(data_source, 'CPU.yaml'))
-    
-    data = None
-    spec_derates = None
-    for cpu_vendor in cpu_data:
-        if cpu_vendor['vendor'] != vendor:
-            continue
-        spec_derates = cpu_vendor['spec_derates']
-        for cpu_type_data in cpu_vendor['types']:
-            if cpu_type_data['type'] != cpu_type:
-                continue
-            for core_count_data in cpu_type_data['core_counts']:
-                if core_count_data['count'] != core_count:
-                    continue
-                data = core_count_data
-                data['spec_derates'] = spec_derates
-                if 'carbon' not in data:
-                    data['carbon'] = 0.0
-                if 'threads' not in data:
-                    data['threads'] = 2
-                return data
-    raise ValueError(f'Could not find CPU data for {vendor} {cpu_type} with {core_count} cores.')
+    return dict(ComponentCatalog.for_dir(data_source).cpu(vendor, cpu_type, core_count))
 
 def index_memory_data(memory_type: str, memory_frequency: Union[int, str],  memory_size: int,
                       data_source: str="data_sources") -> Dict[str, Any]:
@@ -201,129 +177,29 @@ def index_memory_data(memory_type: str, memory_frequency: Union[int, str],  memo
     Returns:
         A dictionary containing the memory data.
     """
-    memory_data = read_yaml(join_path(data_source, 'DRAM.yaml'))
     if isinstance(memory_frequency, int):
         memory_frequency = str(memory_frequency)
         memory_frequency = memory_frequency + 'MHz'
-    data = None
-    if memory_type in memory_data:
-        memory_type_data = memory_data[memory_type]
-        for freq_item in memory_type_data['frequencies']:
-            if freq_item['frequency'] != memory_frequency:
-                continue
-            sizes = freq_item['sizes']
-            for size_item in sizes:
-                if size_item['size'] != memory_size:
-                    continue
-                data = size_item
-                data['spec_derates'] = memory_type_data['spec_derates']
-                if 'carbon' not in data:
-                    data['carbon'] = 0.0
-                return data
-    raise ValueError(f'Memory data not found for {memory_type} {memory_frequency} {memory_size}')
+    return dict(ComponentCatalog.for_dir(data_source).memory(memory_type, memory_frequency, memory_size))
 
 def index_ssd_data(ssd_type: str, ssd_size: int, data_source: str="data_sources", reuse: bool=False) -> Dict[str, Any]:
-    yaml_file = 'SSD.yaml'
-    if reuse:
-        yaml_file = 'SSD_reuse.yaml'
-    ssd_data = read_yaml(join_path(data_source, yaml_file))
-    data = None
-    for ssd_type_data in ssd_data:
-        if ssd_type_data['type'] != ssd_type:
-            continue
-        for ssd_size_data in ssd_type_data['sizes']:
-            if ssd_size_data['size'] != ssd_size:
-                continue
-            data = ssd_size_data
-            # add any dict keys from ssd_type_data - except 'sizes'
-            for key in ssd_type_data:
-                if key != 'sizes':
-                    data[key] = ssd_type_data[key]
-            if 'carbon' not in data:
-                data['carbon'] = 0.0
-            return data
-    raise ValueError(f'SSD data not found for {ssd_type} {ssd_size}')
+    return dict(ComponentCatalog.for_dir(data_source).ssd(ssd_type, ssd_size, reuse=reuse))
 
 def index_nic_data(nic_bandwidth: str, data_source: str="data_sources") -> Dict[str, Any]:
-    nic_data = read_yaml(join_path(data_source, 'NIC.yaml'))
-    data = None
-    for nic_bandwidth_data in nic_data['bandwidths']:
-        if nic_bandwidth_data['bandwidth'] != nic_bandwidth:
-            continue
-        data = nic_bandwidth_data
-        data['spec_derates'] = nic_data['spec_derates']
-        if 'carbon' not in data:
-            data['carbon'] = 0.0
-        return data
-    raise ValueError(f'NIC data not found for {nic_bandwidth}')
+    return dict(ComponentCatalog.for_dir(data_source).nic(nic_bandwidth))
 
 def index_dc_data(dc_type: str, data_source: str="data_sources") -> Dict[str, Any]:
-    dc_data = read_yaml(join_path(data_source, 'data_center.yaml'))
-    data = None
-    for dc_type_data in dc_data:
-        if dc_type_data['type'] != dc_type:
-            continue
-        data = dc_type_data['items']
-        config_data = {key: dc_type_data[key] for key in dc_type_data if key != 'items'}
-        return data, config_data
-    raise ValueError(f'Data center data not found for {dc_type}')
+    data, config_data = ComponentCatalog.for_dir(data_source).dc(dc_type)
+    return copy_items(data), dict(config_data)
 
 def index_rack_data(rack_type: str, data_source: str="data_sources") -> Dict[str, Any]:
-    rack_data = read_yaml(join_path(data_source, 'rack.yaml'))
-    data = None
-    for rack_type_data in rack_data:
-        if rack_type_data['type'] != rack_type:
-            continue
-        data = rack_type_data['items']
-        return data
-    raise ValueError(f'Rack data not found for {rack_type}')
+    return copy_items(ComponentCatalog.for_dir(data_source).rack(rack_type))
 
 def index_server_data(server_type: str, data_source: str="data_sources") -> Dict[str, Any]:
-    server_data = read_yaml(join_path(data_source, 'server.yaml'))
-    data = None
-    for server_type_data in server_data:
-        if server_type_data['type'] != server_type:
-            continue
-        data = server_type_data['items']
-        return data
-    raise ValueError(f'Server data not found for {server_type}')
+    return copy_items(ComponentCatalog.for_dir(data_source).server(server_type))
 
 def index_cxl_controller_data(cxl_controller_type: str, data_source: str="data_sources") -> Dict[str, Any]:
-    cxl_controller_data = read_yaml(join_path(data_source, 'CXL_controller.yaml'))
-    data = None
-    if cxl_controller_type in cxl_controller_data['types']:
-        data = cxl_controller_data['types'][cxl_controller_type]
-        data['spec_derates'] = cxl_controller_data['spec_derates']
-        if 'carbon' not in data:
-            data['carbon'] = 0.0
-        return data
-
-    raise ValueError(f'CXL controller data not found for {cxl_controller_type}')
-
-def convert_units(data: Dict[str, Any]) -> Dict[str, Any]:
-    for key in data:
-        if not isinstance(data[key], str):
-            continue
-        if key == 'power':
-            data[key] = strip_power(data[key])
-        elif key == 'size':
-            if data[key].endswith('GB'):
-                data[key] = float(data[key].replace('GB', ''))
-            elif data[key].endswith('TB'):
-                data[key] = float(data[key].replace('TB', ''))*1000
-    return data
-
-def strip_power(s):
-    s = str(s)
-    if s.endswith('kW'):
-        s = float(s.replace('kW', ''))*1000
-    elif s.endswith('MW'):
-        s = float(s.replace('MW', ''))*1000000
-    elif s.endswith('GW'):
-        s = float(s.replace('GW', ''))*1000000000
-    elif s.endswith('W'):
-        s = float(s.replace('W', ''))
-    return float(s)
+    return dict(ComponentCatalog.for_dir(data_source).cxl_controller(cxl_controller_type))
 
 def strip_U(s):
     if isinstance(s, str):
@@ -341,20 +217,92 @@ def get_fan_power(base_server, base_fan, server_power, fan_slope):
         
 class ServerCarbon:
     per_socket = ['cpu', 'memory', 'ssd', 'cxl', 'cxl_controller', 'ssd_reuse']
-    def __init__(self, config_file: str, data_source_dir: str="../data/carbon_data",
-                 overwrite_params=None, print_out=True) -> None:
+
+    # stages of the model in the order they run, mapped to the stages whose
+    # results they read - each stage is computed by the method _set_<stage>
+    STAGE_DEPENDENCIES = {
+        'derate_curves': [],
+        'capacities': [],
+        'num_components': [],
+        'power': ['derate_curves'],
+        'component_carbon': ['derate_curves', 'power'],
+        'server_carbon': ['component_carbon'],
+        'server_count': ['power'],
+        'rack_carbon': ['server_carbon', 'server_count'],
+        'rack_count': ['power'],
+        'dc_carbon': ['rack_carbon', 'rack_count'],
+        'sellable_cores': ['capacities'],
+    }
+    STAGES = list(STAGE_DEPENDENCIES)
+    # attributes set by each stage
+    STAGE_OUTPUTS = {
+        'derate_curves': ['component_derate_curves', 'allocated_spec', 'provisioned_spec'],
+        'capacities': ['capacities'],
+        'num_components': ['num_components'],
+        'power': ['allocated_component_power', 'provisioned_component_power', 'server_power_no_fan'],
+        'component_carbon': ['component_operational', 'component_embodied', 'component_carbon'],
+        'server_carbon': ['component_server_operational', 'component_server_embodied', 'component_server_carbon',
+                          'server_carbon', 'server_embodied', 'server_operational'],
+        'server_count': ['server_count', 'power_limited'],
+        'rack_carbon': ['component_rack_operational', 'component_rack_embodied', 'component_rack_carbon',
+                        'rack_carbon', 'rack_embodied', 'rack_operational'],
+        'rack_count': ['rack_count', 'dc_power_limited'],
+        'dc_carbon': ['component_dc_operational', 'component_dc_embodied', 'component_dc_carbon',
+                      'dc_carbon', 'dc_embodied', 'dc_operational'],
+        'sellable_cores': ['sellable_cores', 'vCores'],
+    }
+    OUTPUT_STAGES = {output: stage for stage, outputs in STAGE_OUTPUTS.items() for output in outputs}
+    # model parameters mapped to the stages that read them directly - changing
+    # a parameter that is not listed here recomputes every stage
+    PARAM_STAGES = {
+        'voltage_regulator_overhead': ['power', 'component_carbon'],
+        'cpu_efficiency': ['power', 'component_carbon'],
+        'power_factor': ['power', 'component_carbon'],
+        'PSU_efficiency': ['power', 'server_count', 'rack_count'],
+        'fan_slope': ['power'],
+        '1U_server_base': ['power'],
+        '2U_server_base': ['power'],
+        'emissions_factor': ['component_carbon'],
+        'PUE': ['component_carbon'],
+        'lifetime': ['component_carbon'],
+    }
+
+    # metrics of carbon_curve mapped to their (operational, embodied, divisor) attributes
+    CURVE_METRICS = {
+        'server_carbon': ('server_operational', 'server_embodied', None),
+        'per_server_carbon': ('rack_operational', 'rack_embodied', 'server_count'),
+        'rack_carbon': ('rack_operational', 'rack_embodied', None),
+        'dc_carbon': ('dc_operational', 'dc_embodied', None),
+        'carbon_per_sellable_core': ('rack_operational', 'rack_embodied', 'rack_sellable_cores'),
+        'carbon_per_sellable_core_dc': ('dc_operational', 'dc_embodied', 'dc_sellable_cores'),
+    }
+
+    def __init__(self, config_file: Union[str, Dict[str, Any]], data_source_dir: str="../data/carbon_data",
+                 overwrite_params=None, print_out=True, lazy: bool=False) -> None:
         """Initialize the  class.
 
         Args:
-            config_file: The YAML file containing the server configuration.
-            params_file: The YAML file containing the server parameters.
+            config_file: The YAML file containing the server configuration, or its
+                         already loaded contents (a dict with a 'server' key).
+            data_source_dir: The carbon data directory (containing params.yaml), or a
+                             catalog file compiled from one with catalog.compile_catalog.
+            overwrite_params: Parameters that override the values in params.yaml.
+            print_out: Whether to print a summary of the model.
+            lazy: If True, only resolve the components up front, and compute each
+                  stage of the model the first time one of its results is used.
         """
         if data_source_dir is None:
             data_source_dir = "../data/carbon_data"
+        self.data_source_dir = data_source_dir
         self.print_out = print_out
-        self.config = read_yaml(config_file)['server']
-        params_file = join_path(data_source_dir, 'params.yaml')
-        self.params = read_yaml(params_file)
+        self.lazy = lazy
+        if isinstance(config_file, str):
+            self.source_config = load_yaml_snapshot(config_file)
+        else:
+            self.source_config = freeze(config_file)
+        self.config = thaw(self.source_config['server'])
+        self.overwrite_params = dict(overwrite_params) if overwrite_params is not None else {}
+        self.params = thaw(ComponentCatalog.for_dir(data_source_dir).params())
         
         if 'cpu_efficiency' not in self.params:
             self.params['cpu_efficiency'] = 1.0
@@ -372,21 +320,17 @@ class ServerCarbon:
         if self.print_out:
             print(f"Calculating SKU carbon for {self.config['name']}...")
 
-        if overwrite_params is not None:
-            for key, value in overwrite_params.items():
-                if key in self.params:
-                    self.params[key] = value
-                else:
-                    raise ValueError(f'Parameter {key} not found in params.yaml')
-        
         if 'emissions_factor' in self.params:
             # convert from kgCO2e/kWh to kgCO2e/kWMonth
             self.params['emissions_factor'] = self.params['emissions_factor']*24*30
+        self._overwrite_params(self.overwrite_params)
 
         # set the number of sockets based on number of CPUs
         self._set_socket_count()
 
-        # pull the data for the components
+        # pull the data for the components - each record is this model's own
+        # copy of the shared catalog record, so per-model fields (e.g. number,
+        # fan power) never leak into the catalog or other models
         self.data = {}
         self.data['cpu'] = index_cpu_data(self.config['cpu']['vendor'], 
                                           self.config['cpu']['type'], 
@@ -461,78 +405,147 @@ class ServerCarbon:
                 self.data['dc'][comp]['carbon'] = 0.0
             self.data['dc'][comp] = convert_units(self.data['dc'][comp])
 
-        # dicts with component keys, values are derate curves
-        self.component_derate_curves = {}
-        self._set_derate_curves()
-
-        # set resource capacities
-        self.capacities = {}
-        self._set_capacities()
-
-        # set the components per server
-        self.num_components = {}
-        self._set_num_components()
-
-        # per component power
-        self.allocated_component_power = {}
-        self.provisioned_component_power = {}
-        self._set_component_power()
+        # fan power from the catalog, before it is adjusted for the server power
+        self.base_fan_power = self.data['server']['fan']['power'] if 'fan' in self.data['server'] else None
 
-        # set fan power for the server
-        self.server_power_no_fan = None
-        self._set_fan_power()
-        # reset since fan power has changed
-        self._set_component_power()
-
-        # per component operational and embodied emissions
-        self.component_operational = {}
-        self.component_embodied = {}
-        self.component_carbon = {}
-        self._set_component_carbon()
+        # run every stage of the model, from the derate curves to the sellable cores
+        if not lazy:
+            self._run_stages(self.STAGES)
+        if print_out:
+            self.print_summary()
+    
+    def _overwrite_params(self, overwrite_params: Dict[str, Any]) -> None:
+        """Overwrite model parameters (emissions_factor given in kgCO2e/kWh)."""
+        for key, value in overwrite_params.items():
+            if key not in self.params:
+                raise ValueError(f'Parameter {key} not found in params.yaml')
+            if key == 'emissions_factor':
+                # convert from kgCO2e/kWh to kgCO2e/kWMonth
+                value = value*24*30
+            self.params[key] = value
+
+    def _run_stages(self, stages: List[str]) -> None:
+        """Run the given stages of the model (in STAGES order)."""
+        self.__dict__.pop('_result', None)
+        for stage in self.STAGES:
+            if stage in stages:
+                getattr(self, f'_set_{stage}')()
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for missing attributes - in lazy mode (or after invalidate),
+        # compute the stage that sets the attribute on first access
+        stage = ServerCarbon.OUTPUT_STAGES.get(name)
+        if stage is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        for dependency in self.STAGE_DEPENDENCIES[stage]:
+            self.ensure_stage(dependency)
+        getattr(self, f'_set_{stage}')()
+        return self.__dict__[name]
+
+    def is_stage_computed(self, stage: str) -> bool:
+        """Whether the results of a stage are currently available."""
+        return all(output in self.__dict__ for output in self.STAGE_OUTPUTS[stage])
+
+    def ensure_stage(self, stage: str) -> None:
+        """Compute a stage (and the stages it depends on) if it is not computed yet."""
+        if not self.is_stage_computed(stage):
+            getattr(self, self.STAGE_OUTPUTS[stage][0])
+
+    def invalidate(self, *stages: str) -> None:
+        """Drop the results of the given stages and every stage downstream of them.
+
+        The dropped results are recomputed the next time they are used.
+        """
+        self.__dict__.pop('_result', None)
+        for stage in self.get_downstream_stages(list(stages)):
+            for output in self.STAGE_OUTPUTS[stage]:
+                self.__dict__.pop(output, None)
+
+    def _update_stages(self, stages: List[str]) -> None:
+        """Recompute the given stages now, or just invalidate them in lazy mode."""
+        if self.lazy:
+            self.invalidate(*stages)
+        else:
+            self._run_stages(stages)
+
+    @classmethod
+    def get_downstream_stages(cls, stages: List[str]) -> List[str]:
+        """Get the given stages plus every stage that (transitively) reads their results, in STAGES order."""
+        affected = []
+        for stage in cls.STAGES:
+            if stage in stages or any(dep in affected for dep in cls.STAGE_DEPENDENCIES[stage]):
+                affected.append(stage)
+        return affected
+
+    @classmethod
+    def get_param_stages(cls, params: List[str]) -> List[str]:
+        """Get the stages that must be recomputed when the given parameters change."""
+        stages = []
+        for param in params:
+            stages.extend(cls.PARAM_STAGES.get(param, cls.STAGES))
+        return cls.get_downstream_stages(stages)
+
+    def _copy(self) -> 'ServerCarbon':
+        """Copy the model, sharing everything that its stages do not modify in place."""
+        new = copy.copy(self)
+        new.params = dict(self.params)
+        new.overwrite_params = dict(self.overwrite_params)
+        new.config = copy.deepcopy(self.config)
+        # the fan power is adjusted in place, so amortized components need their own records
+        new.data = {key: copy_items(value) if key in ('server', 'rack', 'dc') else dict(value)
+                    for key, value in self.data.items()}
+        return new
+
+    def with_params(self, **overrides: Any) -> 'ServerCarbon':
+        """Get a copy of the model with some parameters changed.
+
+        The components and derate curves are reused, and only the stages that
+        depend on the changed parameters are recomputed (see PARAM_STAGES). For
+        example, changing emissions_factor recomputes the carbon stages but not
+        the component power or the server and rack counts.
 
-        # get per-server operational and embodied emissions
-        self.component_server_operational = {}
-        self.component_server_embodied = {}
-        self.component_server_carbon = {}
-        self.server_carbon = 0
-        self.server_embodied = 0
-        self.server_operational = 0
-        self._set_server_carbon()
+        Args:
+            overrides: Parameters to change, as for overwrite_params (i.e.
+                       emissions_factor in kgCO2e/kWh).
 
-        # set the number of servers
-        self.server_count = 0
-        self.power_limited = False
-        self._set_server_count()
+        Returns:
+            The updated model. This model is left unchanged.
+        """
+        new = self._copy()
+        for key in ('1U_server_base', '2U_server_base'):
+            if key in overrides:
+                overrides[key] = strip_power(overrides[key])
+        new._overwrite_params(overrides)
+        new.overwrite_params.update(overrides)
+        if new.params['fan_slope'] > 0 and ('2U_server_base' not in new.params or '1U_server_base' not in new.params):
+            raise ValueError('Fan slope specified but no base server power specified')
+        new._update_stages(self.get_param_stages(list(overrides)))
+        return new
+
+    def with_config(self, **overrides: Any) -> 'ServerCarbon':
+        """Get a model of a modified server configuration with the same parameters.
+
+        Overrides are merged into the 'server' section of the configuration,
+        e.g. with_config(memory={'number': 16}) only changes the DIMM count. The
+        new model is built from the shared catalog and derate fit caches, so no
+        YAML is parsed and no curve is refitted.
 
-        # set the per-rack operational and embodied carbon
-        self.component_rack_operational = {}
-        self.component_rack_embodied = {}
-        self.component_rack_carbon = {}
-        self.rack_carbon = 0
-        self.rack_embodied = 0
-        self.rack_operational = 0
-        self._set_rack_carbon()
+        Args:
+            overrides: Configuration keys to change. Dict values are merged into
+                       the existing dict values.
 
-        # set the number of racks
-        self.rack_count = 0
-        self.dc_power_limited = False
-        self._set_rack_count()
+        Returns:
+            The new model. This model is left unchanged.
+        """
+        config = thaw(self.source_config)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(config['server'].get(key), dict):
+                config['server'][key].update(value)
+            else:
+                config['server'][key] = value
+        return ServerCarbon(config, self.data_source_dir, overwrite_params=self.overwrite_params,
+                            print_out=self.print_out, lazy=self.lazy)
 
-        # set the per-dc operational and embodied carbon
-        self.component_dc_operational = {}
-        self.component_dc_embodied = {}
-        self.component_dc_carbon = {}
-        self.dc_carbon = 0
-        self.dc_embodied = 0
-        self.dc_operational = 0
-        self._set_dc_carbon()
-
-        # set the sellable cores
-        self.sellable_cores = self.vCores = 0
-        self._set_sellable_cores()
-        if print_out:
-            self.print_summary()
-    
     def print_summary(self) -> None:
         print(f'Sellable cores: {self.sellable_cores:.2f}')
 
@@ -544,6 +557,8 @@ class ServerCarbon:
 
     def _set_derate_curves(self) -> None:
         """Set the derate curves for the server."""
+        # dicts with component keys, values are derate curves
+        self.component_derate_curves = {}
         self.allocated_spec = self.config['spec']
         if 'spec_allocation' in self.config['rack']:
             self.provisioned_spec = self.config['rack']['spec_allocation']
@@ -552,25 +567,25 @@ class ServerCarbon:
 
         for key, value in self.data.items():
             if 'spec_derates' not in value:
-                self.component_derate_curves[key] = lambda x: 1
+                self.component_derate_curves[key] = NO_DERATE
                 continue
             self.component_derate_curves[key] = fit_cubic(value['spec_derates'])
 
         for key, value in self.data['server'].items():
             if 'spec_derates' not in value:
-                self.component_derate_curves[key] = lambda x: 1
+                self.component_derate_curves[key] = NO_DERATE
                 continue
             self.component_derate_curves[key] = fit_cubic(value['spec_derates'])
 
         for key, value in self.data['rack'].items():
             if 'spec_derates' not in value:
-                self.component_derate_curves[key] = lambda x: 1
+                self.component_derate_curves[key] = NO_DERATE
                 continue
             self.component_derate_curves[key] = fit_cubic(value['spec_derates'])
         
         for key, value in self.data['dc'].items():
             if 'spec_derates' not in value:
-                self.component_derate_curves[key] = lambda x: 1
+                self.component_derate_curves[key] = NO_DERATE
                 continue
             self.component_derate_curves[key] = fit_cubic(value['spec_derates'])
 
@@ -612,12 +627,12 @@ class ServerCarbon:
         capacity_rack_count = self.get_dc_capacity()
         if power_rack_count < capacity_rack_count:
             self.rack_count = power_rack_count
-            self.power_limited = True
+            self.dc_power_limited = True
             if self.print_out:
                 print(f"DC is power limited to: {self.rack_count} racks (rather than space limited to {capacity_rack_count})")
         else:
             self.rack_count = capacity_rack_count
-            self.power_limited = False
+            self.dc_power_limited = False
             if self.print_out:
                 print(f"DC is space limited to: {self.rack_count} racks (rather than power limited to {power_rack_count})")
     
@@ -630,6 +645,7 @@ class ServerCarbon:
         # num_servers overrides rack power calculation
         if 'num_servers' in self.config['rack'] and self.config['rack']['num_servers'] > 0 and self.config['rack']['num_servers'] is not None:
             self.server_count = self.config['rack']['num_servers']
+            self.power_limited = False
         else:
             rack_set_power = self.config['rack']['power']
             rack_power = self.provisioned_component_power['rack']
@@ -698,8 +714,27 @@ class ServerCarbon:
         self.server_power_no_fan = used_power - used_fan_power
         return self.server_power_no_fan
 
+    def _set_power(self) -> None:
+        """Set the power for the server components, including the fan power feedback."""
+        # per component power
+        self.allocated_component_power = {}
+        self.provisioned_component_power = {}
+        if self.base_fan_power is not None:
+            self.data['server']['fan']['power'] = self.base_fan_power
+        self.server_power_no_fan = None
+        self._set_component_power()
+
+        # set fan power for the server
+        self._set_fan_power()
+        # reset since fan power has changed
+        self._set_component_power()
+
     def _set_component_carbon(self) -> None:
         """Set the emissions for the various components."""
+        # per component operational and embodied emissions
+        self.component_operational = {}
+        self.component_embodied = {}
+        self.component_carbon = {}
         amortized_components = ['server', 'rack', 'dc']
         for key, value in self.data.items():
             factor = self.params['PUE']
@@ -708,12 +743,10 @@ class ServerCarbon:
             if key in amortized_components:
                 total_opex = 0
                 for _key, component in value.items():
-                    if 'number' not in component:
-                        component['number'] = 1
                     total_opex +=  get_opex(component['power'], 
                                             self.allocated_spec,
                                             self.component_derate_curves[_key],
-                                            component['number'],
+                                            component.get('number', 1),
                                             self.params['emissions_factor'], 
                                             self.params['lifetime'],
                                             factor=factor)
@@ -1022,6 +1055,9 @@ class ServerCarbon:
 
     def _set_rack_carbon(self) -> None:
         """Set the carbon emissions for the rack. NOT amortized. (i.e., DC stuff is not included)"""
+        self.component_rack_operational = {}
+        self.component_rack_embodied = {}
+        self.component_rack_carbon = {}
         # set the per-rack carbon emissions for the components in the rack
         for key in self.component_server_carbon:
             if key == 'rack' or key == 'dc':
@@ -1040,6 +1076,9 @@ class ServerCarbon:
 
     def _set_dc_carbon(self) -> None:
         """Set the carbon emissions for the data center."""
+        self.component_dc_operational = {}
+        self.component_dc_embodied = {}
+        self.component_dc_carbon = {}
         # set the per-dc carbon emissions for the components in the data center
         for key in self.component_rack_carbon:
             if key == 'dc':
@@ -1064,107 +1103,74 @@ class ServerCarbon:
             return
         self.socket_count = self.config['sockets']
 
-    def get_server_carbon_df(self) -> pd.DataFrame:
+    @staticmethod
+    def _carbon_df(operational: Dict[str, float], embodied: Dict[str, float], carbon: Dict[str, float]) -> 'pd.DataFrame':
+        """Get per-component carbon, with a total row and percentages of the totals, as one dataframe."""
+        import pandas as pd
+        index = list(operational) + ['total']
+        columns = {}
+        for name, values in (('operational', operational), ('embodied', embodied), ('carbon', carbon)):
+            values = np.fromiter(values.values(), dtype=float, count=len(values))
+            values = np.append(values, values.sum())
+            with np.errstate(divide='ignore', invalid='ignore'):
+                columns[name] = values.round(2)
+                columns[f'perc of {name}'] = (values * 100 / values[-1]).round(2)
+        return pd.DataFrame(columns, index=index)
+
+    def get_server_carbon_df(self) -> 'pd.DataFrame':
         """Get the operational and embodied carbon for the server as a dataframe."""
-        operational = pd.DataFrame.from_dict(self.component_server_operational, orient='index', columns=['operational'])
-        embodied = pd.DataFrame.from_dict(self.component_server_embodied, orient='index', columns=['embodied'])
-        carbon = pd.DataFrame.from_dict(self.component_server_carbon, orient='index', columns=['carbon'])
-        # add totals
-        operational.loc['total'] = operational.sum()
-        embodied.loc['total'] = embodied.sum()
-        carbon.loc['total'] = carbon.sum()
-        # calculate percentages of total
-        operational['perc of operational'] = operational['operational'] * 100 / operational.loc['total', 'operational']
-        embodied['perc of embodied'] = embodied['embodied'] * 100 / embodied.loc['total', 'embodied']
-        carbon['perc of carbon'] = carbon * 100 / carbon.loc['total', 'carbon']
-        # round to 2 decimal places
-        operational = operational.round(2)
-        embodied = embodied.round(2)
-        carbon = carbon.round(2)
-        # concat them as columns
-        return pd.concat([operational, embodied, carbon], axis=1)
+        return self._carbon_df(self.component_server_operational, self.component_server_embodied,
+                               self.component_server_carbon)
     
-    def get_rack_carbon_df(self) -> pd.DataFrame:
+    def get_rack_carbon_df(self) -> 'pd.DataFrame':
         """Get the operational and embodied carbon for the rack as a dataframe."""
-        operational = pd.DataFrame.from_dict(self.component_rack_operational, orient='index', columns=['operational'])
-        embodied = pd.DataFrame.from_dict(self.component_rack_embodied, orient='index', columns=['embodied'])
-        carbon = pd.DataFrame.from_dict(self.component_rack_carbon, orient='index', columns=['carbon'])
-        # add totals
-        operational.loc['total'] = operational.sum()
-        embodied.loc['total'] = embodied.sum()
-        carbon.loc['total'] = carbon.sum()
-        # calculate percentages of total
-        operational['perc of operational'] = operational['operational'] * 100 / operational.loc['total', 'operational']
-        embodied['perc of embodied'] = embodied['embodied'] * 100 / embodied.loc['total', 'embodied']
-        carbon['perc of carbon'] = carbon * 100 / carbon.loc['total', 'carbon']
-        # round to 2 decimal places
-        operational = operational.round(2)
-        embodied = embodied.round(2)
-        carbon = carbon.round(2)
-        # concat them as columns
-        return pd.concat([operational, embodied, carbon], axis=1)
+        return self._carbon_df(self.component_rack_operational, self.component_rack_embodied,
+                               self.component_rack_carbon)
     
-    def get_dc_carbon_df(self) -> pd.DataFrame:
+    def get_dc_carbon_df(self) -> 'pd.DataFrame':
         """Get the operational and embodied carbon for the data center as a dataframe."""
-        operational = pd.DataFrame.from_dict(self.component_dc_operational, orient='index', columns=['operational'])
-        embodied = pd.DataFrame.from_dict(self.component_dc_embodied, orient='index', columns=['embodied'])
-        carbon = pd.DataFrame.from_dict(self.component_dc_carbon, orient='index', columns=['carbon'])
-        # add totals
-        operational.loc['total'] = operational.sum()
-        embodied.loc['total'] = embodied.sum()
-        carbon.loc['total'] = carbon.sum()
-        # calculate percentages of total
-        operational['perc of operational'] = operational['operational'] * 100 / operational.loc['total', 'operational']
-        embodied['perc of embodied'] = embodied['embodied'] * 100 / embodied.loc['total', 'embodied']
-        carbon['perc of carbon'] = carbon * 100 / carbon.loc['total', 'carbon']
-        # round to 2 decimal places
-        operational = operational.round(2)
-        embodied = embodied.round(2)
-        carbon = carbon.round(2)
-        # concat them as columns
-        return pd.concat([operational, embodied, carbon], axis=1)
+        return self._carbon_df(self.component_dc_operational, self.component_dc_embodied,
+                               self.component_dc_carbon)
     
-    def get_info_dict(self) -> Dict[str, Any]:
-        """Get the information about the server as a dictionary."""
-        info = {}
-
-        # add per-socket capacities
-        for component in self.capacities:
-            info[f'{component}_capacity'] = self.capacities[component]
+    def get_result(self) -> CarbonResult:
+        """Get the results of the model as a CarbonResult.
 
-        info['socket_count'] = self.socket_count
-        info['server_count'] = self.server_count
-        info['sellable_core_count'] = self.sellable_cores
-        info['constrained_by'] = "power" if self.power_limited else "space"
-
-        provisioned, allocated = self.get_server_power()
-        info['server_design_power'] = provisioned
-        info['server_allocated_power'] = allocated
-        
-        # add rack-level component operational, embodied, and carbon
-        for component in self.component_rack_operational:
-            info[f'{component}_operational'] = self.component_rack_operational[component]
-            info[f'{component}_embodied'] = self.component_rack_embodied[component]
-            info[f'{component}_carbon'] = self.component_rack_carbon[component]
-
-            info[f'{component}_operational_perc'] = self.component_rack_operational[component] * 100 / self.rack_operational
-            info[f'{component}_embodied_perc'] = self.component_rack_embodied[component] * 100 / self.rack_embodied
-            info[f'{component}_carbon_perc'] = self.component_rack_carbon[component] * 100 / self.rack_carbon
-
-        # add rack total operational and embodied carbon
-        info['total_rack_operational'] = self.rack_operational
-        info['total_rack_embodied'] = self.rack_embodied
-        info['total_rack_carbon'] = self.rack_carbon
-
-        # add per-sellable rack-level carbon
-        info['carbon_per_sellable_core'] = self.get_carbon_per_sellable_core()
+        The result is built once and reused until a stage is recomputed; use
+        carbon_result.results_table to stack the results of many models.
+        """
+        result = self.__dict__.get('_result')
+        if result is None:
+            provisioned, allocated, _ = self.get_server_power()
+            components = tuple(self.component_rack_operational)
+            result = CarbonResult(
+                name=self.config['name'],
+                capacities=dict(self.capacities),
+                socket_count=self.socket_count,
+                server_count=self.server_count,
+                rack_count=self.rack_count,
+                sellable_cores=self.sellable_cores,
+                vcores=self.vCores,
+                power_limited=self.power_limited,
+                server_design_power=provisioned,
+                server_allocated_power=allocated,
+                components=components,
+                component_operational=np.fromiter(self.component_rack_operational.values(), dtype=float,
+                                                  count=len(components)),
+                component_embodied=np.fromiter(self.component_rack_embodied.values(), dtype=float,
+                                               count=len(components)),
+                server_operational=self.server_operational,
+                server_embodied=self.server_embodied,
+                rack_operational=self.rack_operational,
+                rack_embodied=self.rack_embodied,
+                dc_operational=self.dc_operational,
+                dc_embodied=self.dc_embodied,
+            )
+            self.__dict__['_result'] = result
+        return result
 
-        # round all floats to 2 decimal places
-        for key in info:
-            if isinstance(info[key], float):
-                info[key] = round(info[key], 2)
-        
-        return info
+    def get_info_dict(self) -> Dict[str, Any]:
+        """Get the information about the server as a dictionary."""
+        return self.get_result().to_dict()
     
     def get_info_dict_small(self) -> Dict[str, Any]:
         """Get a small subset of the information about the server as a dictionary."""
@@ -1181,7 +1187,7 @@ class ServerCarbon:
         
         return info
     
-    def get_breakdown_df(self) -> pd.DataFrame:
+    def get_breakdown_df(self) -> 'pd.DataFrame':
         '''Get the breakdown of the carbon for each component in the yaml file.'''
         # get component breakdown
         # each will be a df - each row is a component, columns for percentage of carbon for each component
@@ -1214,4 +1220,85 @@ class ServerCarbon:
     
     def get_dc_perc_operational(self):
         """Get the percentage of operational carbon for the data center."""
-        return round(self.dc_operational * 100 / self.dc_carbon, 2)
\ No newline at end of file
+        return round(self.dc_operational * 100 / self.dc_carbon, 2)
+    
+    def get_carbon_coefficients(self, metric: str='carbon_per_sellable_core') -> Tuple[float, float]:
+        """Get a carbon metric as a linear function of the carbon intensity.
+
+        Power, server and rack counts, and lifetimes do not depend on
+        emissions_factor, so every carbon metric is embodied + operational,
+        where operational is proportional to the carbon intensity.
+
+        Args:
+            metric: One of CURVE_METRICS.
+
+        Returns:
+            (intercept, slope): the embodied carbon, and the operational carbon
+            per kgCO2e/kWh of carbon intensity. Values are not rounded.
+        """
+        if metric not in self.CURVE_METRICS:
+            raise ValueError(f'Unknown carbon metric {metric} (supported: {", ".join(self.CURVE_METRICS)})')
+        operational, embodied, divisor = self.CURVE_METRICS[metric]
+        # operational carbon at 1 kgCO2e/kWh - only the carbon stages are recomputed
+        unit = self.with_params(emissions_factor=1.0)
+        if divisor is None:
+            scale = 1.0
+        elif divisor == 'server_count':
+            scale = self.server_count
+        else:
+            scale = getattr(self, f'get_{divisor}')()
+        return getattr(self, embodied) / scale, getattr(unit, operational) / scale
+
+    def carbon_curve(self, carbon_intensities: Any, metric: str='carbon_per_sellable_core') -> np.ndarray:
+        """Evaluate a carbon metric over many carbon intensities without rebuilding the model.
+
+        Args:
+            carbon_intensities: Carbon intensities in kgCO2e/kWh (as for
+                                emissions_factor in overwrite_params).
+            metric: One of CURVE_METRICS.
+
+        Returns:
+            The (unrounded) metric at each carbon intensity.
+        """
+        intercept, slope = self.get_carbon_coefficients(metric)
+        return intercept + slope * np.asarray(carbon_intensities, dtype=float)
+
+def savings_curve(baseline: ServerCarbon, candidate: ServerCarbon, carbon_intensities: Any,
+                  metric: str='carbon_per_sellable_core') -> np.ndarray:
+    """Get the percentage of carbon saved by a candidate server over a baseline at many carbon intensities.
+
+    Args:
+        baseline: The baseline server model.
+        candidate: The candidate server model.
+        carbon_intensities: Carbon intensities in kgCO2e/kWh.
+        metric: One of ServerCarbon.CURVE_METRICS.
+
+    Returns:
+        (baseline - candidate) * 100 / baseline at each carbon intensity.
+    """
+    baseline_carbon = baseline.carbon_curve(carbon_intensities, metric)
+    candidate_carbon = candidate.carbon_curve(carbon_intensities, metric)
+    return (baseline_carbon - candidate_carbon) * 100 / baseline_carbon
+
+def break_even_intensity(baseline: ServerCarbon, candidate: ServerCarbon,
+                         metric: str='carbon_per_sellable_core') -> Union[float, None]:
+    """Get the carbon intensity at which a candidate server and a baseline emit the same carbon.
+
+    Args:
+        baseline: The baseline server model.
+        candidate: The candidate server model.
+        metric: One of ServerCarbon.CURVE_METRICS.
+
+    Returns:
+        The break-even carbon intensity in kgCO2e/kWh, or None if the lines
+        do not cross at a non-negative intensity (one server is better at
+        every intensity).
+    """
+    baseline_intercept, baseline_slope = baseline.get_carbon_coefficients(metric)
+    candidate_intercept, candidate_slope = candidate.get_carbon_coefficients(metric)
+    if baseline_slope == candidate_slope:
+        return None
+    intensity = (candidate_intercept - baseline_intercept) / (baseline_slope - candidate_slope)
+    if intensity < 0:
+        return None
+    return intensity
@@ -0,0 +1,198 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+class CarbonResult:
+    """The results of one ServerCarbon model, filled once by ServerCarbon.get_result().
+
+    Per-component rack-level carbon is stored as NumPy arrays aligned with
+    components (which includes 'rack'), so results are cheap to build and
+    many of them can be stacked into one columnar table with results_table.
+    """
+    __slots__ = ('name', 'capacities', 'socket_count', 'server_count', 'rack_count', 'sellable_cores', 'vcores',
+                 'power_limited', 'server_design_power', 'server_allocated_power', 'components',
+                 'component_operational', 'component_embodied', 'server_operational', 'server_embodied',
+                 'rack_operational', 'rack_embodied', 'dc_operational', 'dc_embodied')
+
+    def __init__(self, name: str, capacities: Dict[str, float], socket_count: int, server_count: int,
+                 rack_count: int, sellable_cores: float, vcores: float, power_limited: bool,
+                 server_design_power: float, server_allocated_power: float, components: Tuple[str, ...],
+                 component_operational: np.ndarray, component_embodied: np.ndarray,
+                 server_operational: float, server_embodied: float, rack_operational: float,
+                 rack_embodied: float, dc_operational: float, dc_embodied: float) -> None:
+        self.name = name
+        self.capacities = capacities
+        self.socket_count = socket_count
+        self.server_count = server_count
+        self.rack_count = rack_count
+        self.sellable_cores = sellable_cores
+        self.vcores = vcores
+        self.power_limited = power_limited
+        self.server_design_power = server_design_power
+        self.server_allocated_power = server_allocated_power
+        self.components = components
+        self.component_operational = component_operational
+        self.component_embodied = component_embodied
+        self.server_operational = server_operational
+        self.server_embodied = server_embodied
+        self.rack_operational = rack_operational
+        self.rack_embodied = rack_embodied
+        self.dc_operational = dc_operational
+        self.dc_embodied = dc_embodied
+
+    def __repr__(self) -> str:
+        return (f'CarbonResult({self.name!r}, rack_carbon={self.rack_carbon:.2f}, '
+                f'carbon_per_sellable_core={self.carbon_per_sellable_core:.2f})')
+
+    @property
+    def component_carbon(self) -> np.ndarray:
+        return self.component_operational + self.component_embodied
+
+    @property
+    def server_carbon(self) -> float:
+        return self.server_operational + self.server_embodied
+
+    @property
+    def rack_carbon(self) -> float:
+        return self.rack_operational + self.rack_embodied
+
+    @property
+    def dc_carbon(self) -> float:
+        return self.dc_operational + self.dc_embodied
+
+    @property
+    def rack_sellable_cores(self) -> float:
+        return self.sellable_cores * self.socket_count * self.server_count
+
+    @property
+    def carbon_per_sellable_core(self) -> float:
+        return self.rack_carbon / self.rack_sellable_cores
+
+    @property
+    def constrained_by(self) -> str:
+        return "power" if self.power_limited else "space"
+
+    def to_dict(self, decimals: Optional[int]=2) -> Dict[str, Any]:
+        """Get the result as a dictionary, with the keys of ServerCarbon.get_info_dict.
+
+        Args:
+            decimals: The number of decimal places to round floats to (None to not round).
+        """
+        info = {f'{component}_capacity': capacity for component, capacity in self.capacities.items()}
+        info['socket_count'] = self.socket_count
+        info['server_count'] = self.server_count
+        info['sellable_core_count'] = self.sellable_cores
+        info['constrained_by'] = self.constrained_by
+        info['server_design_power'] = self.server_design_power
+        info['server_allocated_power'] = self.server_allocated_power
+
+        operational = self.component_operational.tolist()
+        embodied = self.component_embodied.tolist()
+        for component, component_operational, component_embodied in zip(self.components, operational, embodied):
+            component_carbon = component_operational + component_embodied
+            info[f'{component}_operational'] = component_operational
+            info[f'{component}_embodied'] = component_embodied
+            info[f'{component}_carbon'] = component_carbon
+            info[f'{component}_operational_perc'] = _percentage(component_operational, self.rack_operational)
+            info[f'{component}_embodied_perc'] = _percentage(component_embodied, self.rack_embodied)
+            info[f'{component}_carbon_perc'] = _percentage(component_carbon, self.rack_carbon)
+
+        info['total_rack_operational'] = self.rack_operational
+        info['total_rack_embodied'] = self.rack_embodied
+        info['total_rack_carbon'] = self.rack_carbon
+        info['carbon_per_sellable_core'] = self.carbon_per_sellable_core
+
+        if decimals is not None:
+            for key in info:
+                if isinstance(info[key], float):
+                    info[key] = round(info[key], decimals)
+        return info
+
+def _percentage(part: float, total: float) -> float:
+    # 0 if the total is 0, e.g. operational carbon with a zero emissions factor
+    return part * 100 / total if total else 0.0
+
+def _union(names: Iterable[Sequence[str]]) -> List[str]:
+    union = {}
+    for sequence in names:
+        for name in sequence:
+            union.setdefault(name, None)
+    return list(union)
+
+def results_table(results: Sequence[CarbonResult], decimals: Optional[int]=None) -> Dict[str, np.ndarray]:
+    """Stack many results into one columnar table.
+
+    The columns are those of CarbonResult.to_dict (and ServerCarbon.get_info_dict),
+    plus name, rack_count, vcores and the server and DC totals. Components or
+    capacities that a result does not have are 0 in its row.
+
+    Args:
+        results: The results to stack.
+        decimals: The number of decimal places to round float columns to (None to not round).
+
+    Returns:
+        The columns, each an array with one entry per result.
+    """
+    count = len(results)
+    components = _union(result.components for result in results)
+    capacity_names = _union(result.capacities for result in results)
+
+    table = {'name': np.array([result.name for result in results], dtype=object)}
+    for capacity in capacity_names:
+        table[f'{capacity}_capacity'] = np.array([result.capacities.get(capacity, 0) for result in results])
+    table['socket_count'] = np.array([result.socket_count for result in results])
+    table['server_count'] = np.array([result.server_count for result in results])
+    table['sellable_core_count'] = np.array([result.sellable_cores for result in results])
+    table['rack_count'] = np.array([result.rack_count for result in results])
+    table['vcores'] = np.array([result.vcores for result in results])
+    table['constrained_by'] = np.array([result.constrained_by for result in results], dtype=object)
+    table['server_design_power'] = np.array([result.server_design_power for result in results], dtype=float)
+    table['server_allocated_power'] = np.array([result.server_allocated_power for result in results], dtype=float)
+
+    # scatter each result's component arrays into (results, components) matrices
+    column_index = {component: i for i, component in enumerate(components)}
+    operational = np.zeros((count, len(components)))
+    embodied = np.zeros((count, len(components)))
+    for row, result in enumerate(results):
+        columns = [column_index[component] for component in result.components]
+        operational[row, columns] = result.component_operational
+        embodied[row, columns] = result.component_embodied
+    totals = {}
+    for total in ('server_operational', 'server_embodied', 'rack_operational', 'rack_embodied',
+                  'dc_operational', 'dc_embodied'):
+        totals[total] = np.array([getattr(result, total) for result in results], dtype=float)
+    rack_carbon = totals['rack_operational'] + totals['rack_embodied']
+    carbon = operational + embodied
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = {
+            'operational': np.where(totals['rack_operational'][:, None] != 0,
+                                    operational * 100 / totals['rack_operational'][:, None], 0.0),
+            'embodied': np.where(totals['rack_embodied'][:, None] != 0,
+                                 embodied * 100 / totals['rack_embodied'][:, None], 0.0),
+            'carbon': np.where(rack_carbon[:, None] != 0, carbon * 100 / rack_carbon[:, None], 0.0),
+        }
+    for i, component in enumerate(components):
+        table[f'{component}_operational'] = operational[:, i]
+        table[f'{component}_embodied'] = embodied[:, i]
+        table[f'{component}_carbon'] = carbon[:, i]
+        table[f'{component}_operational_perc'] = shares['operational'][:, i]
+        table[f'{component}_embodied_perc'] = shares['embodied'][:, i]
+        table[f'{component}_carbon_perc'] = shares['carbon'][:, i]
+
+    table['total_rack_operational'] = totals['rack_operational']
+    table['total_rack_embodied'] = totals['rack_embodied']
+    table['total_rack_carbon'] = rack_carbon
+    table['carbon_per_sellable_core'] = rack_carbon / (table['sellable_core_count'] * table['socket_count'] * table['server_count'])
+    for total in ('server_operational', 'server_embodied', 'dc_operational', 'dc_embodied'):
+        table[f'total_{total}'] = totals[total]
+
+    if decimals is not None:
+        for column, values in table.items():
+            if values.dtype.kind == 'f':
+                table[column] = np.round(values, decimals)
+    return table
+
+def results_dataframe(results: Sequence[CarbonResult], decimals: Optional[int]=None) -> Any:
+    """Get results_table as a pandas DataFrame (built in one step from the columns)."""
+    import pandas as pd
+    return pd.DataFrame(results_table(results, decimals))
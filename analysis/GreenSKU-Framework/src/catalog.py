@@ -0,0 +1,452 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import argparse
+import difflib
+import os
+import pickle
+import threading
+from helpers import read_yaml_fast, join_path, open_path_dir, convert_units, strip_power
+
+class FrozenDict(Mapping):
+    """A read-only, picklable mapping used for cached catalog records."""
+    __slots__ = ('_data',)
+
+    def __init__(self, *args, **kwargs) -> None:
+        object.__setattr__(self, '_data', dict(*args, **kwargs))
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._data[key]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._data
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError('FrozenDict is immutable')
+
+    def __repr__(self) -> str:
+        return f'FrozenDict({self._data!r})'
+
+    def __reduce__(self):
+        return (FrozenDict, (self._data,))
+
+def freeze(obj: Any) -> Any:
+    """Recursively convert parsed YAML data into an immutable snapshot.
+
+    Mappings become FrozenDicts, sequences become tuples, and ruamel scalar
+    subclasses are converted to their plain Python equivalents.
+
+    Args:
+        obj: The parsed YAML data.
+
+    Returns:
+        An immutable copy of the data.
+    """
+    if isinstance(obj, Mapping):
+        return FrozenDict((freeze(key), freeze(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(item) for item in obj)
+    if isinstance(obj, bool) or obj is None:
+        return obj
+    if isinstance(obj, int):
+        return int(obj)
+    if isinstance(obj, float):
+        return float(obj)
+    if isinstance(obj, str):
+        return str(obj)
+    return obj
+
+def thaw(obj: Any) -> Any:
+    """Recursively convert a frozen snapshot back into mutable dicts and lists.
+
+    Args:
+        obj: The frozen data.
+
+    Returns:
+        A mutable deep copy of the data.
+    """
+    if isinstance(obj, Mapping):
+        return {key: thaw(value) for key, value in obj.items()}
+    if isinstance(obj, tuple):
+        return [thaw(item) for item in obj]
+    return obj
+
+# absolute path -> ((mtime_ns, size), frozen contents)
+_yaml_cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+_yaml_cache_lock = threading.Lock()
+_yaml_cache_stats = {'hits': 0, 'misses': 0}
+
+def _cache_key(yaml_file: str) -> str:
+    return os.path.normcase(os.path.abspath(yaml_file))
+
+def _file_signature(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def load_yaml_snapshot(yaml_file: str) -> Any:
+    """Read a YAML file through the process-wide cache.
+
+    The file is only parsed if it has not been seen before or if its
+    modification time or size has changed since it was last parsed.
+
+    Args:
+        yaml_file: The YAML file to read.
+
+    Returns:
+        An immutable snapshot of the YAML file's contents.
+    """
+    path = _cache_key(yaml_file)
+    signature = _file_signature(path)
+    with _yaml_cache_lock:
+        entry = _yaml_cache.get(path)
+        if entry is not None and entry[0] == signature:
+            _yaml_cache_stats['hits'] += 1
+            return entry[1]
+    snapshot = freeze(read_yaml_fast(path))
+    with _yaml_cache_lock:
+        _yaml_cache_stats['misses'] += 1
+        _yaml_cache[path] = (signature, snapshot)
+    return snapshot
+
+def read_yaml_cached(yaml_file: str) -> Any:
+    """Read a YAML file through the process-wide cache as mutable data.
+
+    Args:
+        yaml_file: The YAML file to read.
+
+    Returns:
+        A mutable copy of the YAML file's contents that the caller owns.
+    """
+    return thaw(load_yaml_snapshot(yaml_file))
+
+def invalidate(yaml_file: Optional[str]=None) -> None:
+    """Drop cached YAML snapshots.
+
+    Args:
+        yaml_file: The YAML file to drop. If None, the whole cache is cleared.
+    """
+    with _yaml_cache_lock:
+        if yaml_file is None:
+            _yaml_cache.clear()
+        else:
+            _yaml_cache.pop(_cache_key(yaml_file), None)
+
+def cache_info() -> Dict[str, int]:
+    """Get the hit/miss counters and current size of the YAML cache."""
+    with _yaml_cache_lock:
+        return {'hits': _yaml_cache_stats['hits'],
+                'misses': _yaml_cache_stats['misses'],
+                'size': len(_yaml_cache)}
+
+def copy_items(items: Mapping) -> Dict[str, Dict[str, Any]]:
+    """Copy a mapping of catalog records into per-caller overlay dicts.
+
+    Only the top two levels are copied; nested values such as spec_derates
+    stay shared with the (immutable) catalog.
+
+    Args:
+        items: A mapping of item name to catalog record.
+
+    Returns:
+        A dict of item name to a mutable dict copy of each record.
+    """
+    return {key: dict(record) for key, record in items.items()}
+
+def _format_key(key: Any) -> str:
+    if isinstance(key, tuple):
+        return ' '.join(str(part) for part in key)
+    return str(key)
+
+def _with_defaults(record: Mapping, **defaults: Any) -> FrozenDict:
+    merged = dict(record)
+    for key, value in defaults.items():
+        if key not in merged:
+            merged[key] = value
+    return FrozenDict(merged)
+
+class ComponentCatalog:
+    """Hash-indexed view of the component data in a carbon data directory.
+
+    Each YAML file is parsed (through the process-wide cache) and indexed into
+    dicts keyed by the fields the model looks components up by, e.g.
+    (vendor, type, core count) for CPUs. Indexes are built lazily per file and
+    rebuilt automatically if the underlying file changes.
+
+    A catalog can also be loaded from a file written by compile_catalog, in
+    which case all indexes are read at once and never rebuilt.
+    """
+    def __init__(self, data_source_dir: str) -> None:
+        self.data_source_dir = data_source_dir
+        # file name -> (snapshot the index was built from, index)
+        self._sections: Dict[str, Tuple[Any, Dict[Any, Any]]] = {}
+        self._params = None
+        self._compiled = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_dir(cls, data_source_dir: str) -> 'ComponentCatalog':
+        """Get the shared catalog for a carbon data directory or compiled catalog file."""
+        key = _cache_key(data_source_dir)
+        signature = _file_signature(key) if os.path.isfile(key) else None
+        with _catalogs_lock:
+            entry = _catalogs.get(key)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+        catalog = cls.load(data_source_dir) if signature is not None else cls(data_source_dir)
+        with _catalogs_lock:
+            _catalogs[key] = (signature, catalog)
+        return catalog
+
+    @classmethod
+    def load(cls, catalog_file: str) -> 'ComponentCatalog':
+        """Load a catalog written by compile_catalog.
+
+        The file is a pickle, so only load catalogs from trusted sources.
+
+        Args:
+            catalog_file: The compiled catalog file.
+
+        Returns:
+            The loaded catalog.
+        """
+        with open(catalog_file, 'rb') as f:
+            compiled = pickle.load(f)
+        if compiled.get('format') != COMPILED_CATALOG_FORMAT:
+            raise ValueError(f'{catalog_file} is not a compiled catalog (format {compiled.get("format")})')
+        catalog = cls(compiled['data_source_dir'])
+        catalog._sections = {name: (None, index) for name, index in compiled['sections'].items()}
+        catalog._params = compiled['params']
+        catalog._compiled = True
+        return catalog
+
+    def params(self) -> FrozenDict:
+        """Get the model parameters (params.yaml) that belong to this catalog."""
+        if self._compiled:
+            return self._params
+        return load_yaml_snapshot(join_path(self.data_source_dir, 'params.yaml'))
+
+    def preload(self) -> None:
+        """Build the indexes of every catalog file in the directory up front."""
+        self.params()
+        for yaml_name in _SECTION_BUILDERS:
+            if self._compiled or os.path.exists(join_path(self.data_source_dir, yaml_name)):
+                self._section(yaml_name)
+
+    def _section(self, yaml_name: str) -> Dict[Any, Any]:
+        if self._compiled:
+            if yaml_name not in self._sections:
+                raise FileNotFoundError(f'{yaml_name} was not compiled into the catalog for {self.data_source_dir}')
+            return self._sections[yaml_name][1]
+        snapshot = load_yaml_snapshot(join_path(self.data_source_dir, yaml_name))
+        entry = self._sections.get(yaml_name)
+        if entry is not None and entry[0] is snapshot:
+            return entry[1]
+        index = _SECTION_BUILDERS[yaml_name](snapshot)
+        with self._lock:
+            self._sections[yaml_name] = (snapshot, index)
+        return index
+
+    def _lookup(self, yaml_name: str, key: Any, description: str) -> Any:
+        index = self._section(yaml_name)
+        try:
+            return index[key]
+        except KeyError:
+            pass
+        candidates = {_format_key(k): k for k in index}
+        matches = difflib.get_close_matches(_format_key(key), list(candidates), n=3, cutoff=0.0)
+        message = f'{description} not found for {_format_key(key)}'
+        if matches:
+            message += f'. Did you mean: {", ".join(matches)}?'
+        raise ValueError(message)
+
+    def keys(self, yaml_name: str) -> List[Any]:
+        """Get the lookup keys indexed for one of the catalog YAML files."""
+        return list(self._section(yaml_name))
+
+    def cpu(self, vendor: str, cpu_type: str, core_count: int) -> FrozenDict:
+        """Look up a CPU by (vendor, type, core count)."""
+        return self._lookup('CPU.yaml', (vendor, cpu_type, core_count), 'CPU data')
+
+    def memory(self, memory_type: str, memory_frequency: str, memory_size: str) -> FrozenDict:
+        """Look up a DIMM by (type, frequency, size)."""
+        return self._lookup('DRAM.yaml', (memory_type, memory_frequency, memory_size), 'Memory data')
+
+    def ssd(self, ssd_type: str, ssd_size: str, reuse: bool=False) -> FrozenDict:
+        """Look up an SSD by (type, size)."""
+        yaml_name = 'SSD_reuse.yaml' if reuse else 'SSD.yaml'
+        return self._lookup(yaml_name, (ssd_type, ssd_size), 'SSD data')
+
+    def nic(self, nic_bandwidth: str) -> FrozenDict:
+        """Look up a NIC by bandwidth."""
+        return self._lookup('NIC.yaml', nic_bandwidth, 'NIC data')
+
+    def cxl_controller(self, cxl_controller_type: str) -> FrozenDict:
+        """Look up a CXL controller by type."""
+        return self._lookup('CXL_controller.yaml', cxl_controller_type, 'CXL controller data')
+
+    def dc(self, dc_type: str) -> Tuple[FrozenDict, FrozenDict]:
+        """Look up a data center's (items, config) by type."""
+        return self._lookup('data_center.yaml', dc_type, 'Data center data')
+
+    def rack(self, rack_type: str) -> FrozenDict:
+        """Look up a rack's items by type."""
+        return self._lookup('rack.yaml', rack_type, 'Rack data')
+
+    def server(self, server_type: str) -> FrozenDict:
+        """Look up a server chassis' items by type."""
+        return self._lookup('server.yaml', server_type, 'Server data')
+
+def _index_cpu(cpu_data: Any) -> Dict[Any, Any]:
+    index = {}
+    for cpu_vendor in cpu_data:
+        for cpu_type_data in cpu_vendor['types']:
+            for core_count_data in cpu_type_data['core_counts']:
+                key = (cpu_vendor['vendor'], cpu_type_data['type'], core_count_data['count'])
+                if key in index:
+                    continue
+                record = dict(core_count_data, spec_derates=cpu_vendor['spec_derates'])
+                index[key] = _with_defaults(record, carbon=0.0, threads=2)
+    return index
+
+def _index_memory(memory_data: Any) -> Dict[Any, Any]:
+    index = {}
+    for memory_type, memory_type_data in memory_data.items():
+        for freq_item in memory_type_data['frequencies']:
+            for size_item in freq_item['sizes']:
+                key = (memory_type, freq_item['frequency'], size_item['size'])
+                if key in index:
+                    continue
+                record = dict(size_item, spec_derates=memory_type_data['spec_derates'])
+                index[key] = _with_defaults(record, carbon=0.0)
+    return index
+
+def _index_ssd(ssd_data: Any) -> Dict[Any, Any]:
+    index = {}
+    for ssd_type_data in ssd_data:
+        for ssd_size_data in ssd_type_data['sizes']:
+            key = (ssd_type_data['type'], ssd_size_data['size'])
+            if key in index:
+                continue
+            record = dict(ssd_size_data)
+            # add any keys from the type entry - except 'sizes'
+            record.update((k, v) for k, v in ssd_type_data.items() if k != 'sizes')
+            index[key] = _with_defaults(record, carbon=0.0)
+    return index
+
+def _index_nic(nic_data: Any) -> Dict[Any, Any]:
+    index = {}
+    for nic_bandwidth_data in nic_data['bandwidths']:
+        key = nic_bandwidth_data['bandwidth']
+        if key in index:
+            continue
+        record = dict(nic_bandwidth_data, spec_derates=nic_data['spec_derates'])
+        index[key] = _with_defaults(record, carbon=0.0)
+    return index
+
+def _index_cxl_controller(cxl_controller_data: Any) -> Dict[Any, Any]:
+    index = {}
+    for key, controller in cxl_controller_data['types'].items():
+        record = dict(controller, spec_derates=cxl_controller_data['spec_derates'])
+        index[key] = _with_defaults(record, carbon=0.0)
+    return index
+
+def _index_dc(dc_data: Any) -> Dict[Any, Any]:
+    index = {}
+    for dc_type_data in dc_data:
+        if dc_type_data['type'] in index:
+            continue
+        config_data = FrozenDict((k, v) for k, v in dc_type_data.items() if k != 'items')
+        index[dc_type_data['type']] = (dc_type_data['items'], config_data)
+    return index
+
+def _index_items(type_data: Any) -> Dict[Any, Any]:
+    index = {}
+    for entry in type_data:
+        if entry['type'] not in index:
+            index[entry['type']] = entry['items']
+    return index
+
+_SECTION_BUILDERS = {
+    'CPU.yaml': _index_cpu,
+    'DRAM.yaml': _index_memory,
+    'SSD.yaml': _index_ssd,
+    'SSD_reuse.yaml': _index_ssd,
+    'NIC.yaml': _index_nic,
+    'CXL_controller.yaml': _index_cxl_controller,
+    'data_center.yaml': _index_dc,
+    'rack.yaml': _index_items,
+    'server.yaml': _index_items,
+}
+
+# absolute data directory or catalog file -> (file signature, shared ComponentCatalog)
+_catalogs: Dict[str, Tuple[Optional[Tuple[int, int]], ComponentCatalog]] = {}
+_catalogs_lock = threading.Lock()
+
+COMPILED_CATALOG_FORMAT = 'greensku-catalog-v1'
+
+def _normalize_record(record: Mapping) -> FrozenDict:
+    return FrozenDict(convert_units(record))
+
+def _normalize_items(items: Mapping) -> FrozenDict:
+    return FrozenDict((key, _normalize_record(record)) for key, record in items.items())
+
+def _normalize_section(yaml_name: str, index: Dict[Any, Any]) -> Dict[Any, Any]:
+    if yaml_name == 'data_center.yaml':
+        normalized = {}
+        for key, (items, config_data) in index.items():
+            config_data = dict(config_data)
+            config_data['power_capacity'] = strip_power(config_data['power_capacity'])
+            config_data['rack_capacity'] = float(config_data['rack_capacity'])
+            normalized[key] = (_normalize_items(items), FrozenDict(config_data))
+        return normalized
+    if yaml_name in ('rack.yaml', 'server.yaml'):
+        return {key: _normalize_items(items) for key, items in index.items()}
+    return {key: _normalize_record(record) for key, record in index.items()}
+
+def compile_catalog(data_source_dir: str, catalog_file: str) -> None:
+    """Compile a carbon data directory into a single pre-normalized catalog file.
+
+    All catalog YAML files in the directory are parsed, indexed, and have their
+    units converted (e.g. '290W' -> 290.0, '4TB' -> 4000.0), so that loading
+    the compiled file is a single read. The result can be passed anywhere a
+    carbon data directory is accepted, e.g. ServerCarbon's data_source_dir.
+
+    Args:
+        data_source_dir: The carbon data directory to compile.
+        catalog_file: The file to write the compiled catalog to.
+    """
+    sections = {}
+    for yaml_name, builder in _SECTION_BUILDERS.items():
+        yaml_file = join_path(data_source_dir, yaml_name)
+        if not os.path.exists(yaml_file):
+            continue
+        index = builder(freeze(read_yaml_fast(yaml_file)))
+        sections[yaml_name] = _normalize_section(yaml_name, index)
+    compiled = {
+        'format': COMPILED_CATALOG_FORMAT,
+        'data_source_dir': data_source_dir,
+        'sections': sections,
+        'params': freeze(read_yaml_fast(join_path(data_source_dir, 'params.yaml'))),
+    }
+    open_path_dir(catalog_file)
+    with open(catalog_file, 'wb') as f:
+        pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+if __name__ == '__main__':
+    # import through the module name so pickled records reference catalog.FrozenDict
+    from catalog import compile_catalog
+
+    parser = argparse.ArgumentParser(description='Carbon data catalog tools.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile-catalog',
+                                           help='compile a carbon data directory into a single catalog file')
+    compile_parser.add_argument('data_source_dir', help='the carbon data directory, e.g. ../data/carbon_data')
+    compile_parser.add_argument('catalog_file', help='the compiled catalog file to write')
+    args = parser.parse_args()
+    if args.command == 'compile-catalog':
+        compile_catalog(args.data_source_dir, args.catalog_file)
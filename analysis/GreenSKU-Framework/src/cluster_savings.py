@@ -0,0 +1,225 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+from batch_model import BatchServerCarbon
+from carbon_model import ServerCarbon
+from maintenance_model import ServerMaintenance
+
+CLUSTER_COLUMNS = ['OriginalClusterSize', 'NewClusterSize_Baseline', 'NewClusterSize_GreenSKU']
+
+# (baseline config, new config, params to overwrite)
+Scenario = Tuple[Union[str, Dict], Union[str, Dict], Dict[str, Any]]
+
+class _Models:
+    """Models for (config, params) pairs, built once per config and updated with with_params."""
+    def __init__(self, data_source_dir: str, afr_file: str) -> None:
+        self.data_source_dir = data_source_dir
+        self.afr_file = afr_file
+        self._base: Dict[Any, ServerCarbon] = {}
+        self._models: Dict[Any, ServerCarbon] = {}
+        self._afrs: Dict[Any, float] = {}
+
+    def _base_model(self, config: Union[str, Dict]) -> Tuple[Any, ServerCarbon]:
+        config_key = config if isinstance(config, str) else id(config)
+        if config_key not in self._base:
+            self._base[config_key] = ServerCarbon(config, self.data_source_dir, print_out=False)
+        return config_key, self._base[config_key]
+
+    def get(self, config: Union[str, Dict], params: Dict[str, Any]) -> ServerCarbon:
+        config_key, base = self._base_model(config)
+        key = (config_key, tuple(sorted(params.items())))
+        if key not in self._models:
+            self._models[key] = base.with_params(**params) if params else base
+        return self._models[key]
+
+    def afr(self, config: Union[str, Dict]) -> float:
+        # the AFR only depends on the component counts, not on the params
+        config_key, base = self._base_model(config)
+        if config_key not in self._afrs:
+            self._afrs[config_key] = ServerMaintenance(None, self.afr_file, model=base).get_AFRs()
+        return self._afrs[config_key]
+
+def scenario_constants(scenarios: Sequence[Scenario], data_source_dir: str="../data/carbon_data",
+                       afr_file: str="../data/AFR_data/afr_data.yaml") -> Dict[str, np.ndarray]:
+    """Get the per-server quantities the cluster calculation needs for each scenario.
+
+    Models are shared between scenarios with the same config and params, and
+    each config is only built once (other params are applied with with_params).
+
+    Args:
+        scenarios: (baseline config, new config, params) for each scenario.
+        data_source_dir: The carbon data directory (or compiled catalog file).
+        afr_file: The AFR data YAML file used for the maintenance overhead.
+
+    Returns:
+        Arrays with one entry per scenario: og/new_server_carbon (amortized
+        per-server carbon), og/new_maintenance_overhead (1 + AFR), and
+        og/new_vcores.
+    """
+    models = _Models(data_source_dir, afr_file)
+    constants: Dict[str, List[float]] = {key: [] for key in ('og_server_carbon', 'new_server_carbon',
+                                                             'og_maintenance_overhead', 'new_maintenance_overhead',
+                                                             'og_vcores', 'new_vcores')}
+    for og_config, new_config, params in scenarios:
+        for prefix, config in (('og', og_config), ('new', new_config)):
+            model = models.get(config, params)
+            constants[f'{prefix}_server_carbon'].append(model.get_per_server_carbon())
+            constants[f'{prefix}_maintenance_overhead'].append(1 + models.afr(config))
+            constants[f'{prefix}_vcores'].append(model.get_vcores())
+    return {key: np.array(values, dtype=float) for key, values in constants.items()}
+
+def cluster_carbon(original_size: np.ndarray, new_baseline_size: np.ndarray, new_greensku_size: np.ndarray,
+                   constants: Dict[str, np.ndarray], buffer: float=0.1) -> Dict[str, np.ndarray]:
+    """Calculate the cluster-level carbon of every scenario for every cluster.
+
+    The original cluster is all baseline servers plus a growth buffer of
+    ceil(buffer * size) servers. The new cluster mixes baseline and new
+    servers, and its (baseline) growth buffer is sized by the total number
+    of vcores. Every server count is scaled by its maintenance overhead.
+
+    Args:
+        original_size: The original (baseline-only) size of each cluster.
+        new_baseline_size: The number of baseline servers in each new cluster.
+        new_greensku_size: The number of new servers in each new cluster.
+        constants: The per-scenario arrays returned by scenario_constants.
+        buffer: The growth buffer as a fraction of the cluster size.
+
+    Returns:
+        start_og_carbon, total_carbon and perc_saved_carbon as arrays of shape
+        (scenarios, clusters).
+    """
+    original = np.asarray(original_size).astype(int).astype(float)[None, :]
+    baseline = np.asarray(new_baseline_size, dtype=float)[None, :]
+    greensku = np.asarray(new_greensku_size, dtype=float)[None, :]
+    og_carbon = constants['og_server_carbon'][:, None]
+    new_carbon = constants['new_server_carbon'][:, None]
+    og_overhead = constants['og_maintenance_overhead'][:, None]
+    new_overhead = constants['new_maintenance_overhead'][:, None]
+    og_vcores = constants['og_vcores'][:, None]
+    new_vcores = constants['new_vcores'][:, None]
+
+    num_og_buffer = np.ceil(original * buffer)
+    start_og_carbon = (original + num_og_buffer) * og_carbon * og_overhead
+    total_num_buffer = np.ceil((baseline * og_vcores + greensku * new_vcores) * buffer / og_vcores)
+    total_carbon = (baseline + total_num_buffer) * og_carbon * og_overhead + greensku * new_carbon * new_overhead
+    perc_saved_carbon = (start_og_carbon - total_carbon) * 100 / start_og_carbon
+    return {
+        'start_og_carbon': start_og_carbon,
+        'total_carbon': total_carbon,
+        'perc_saved_carbon': perc_saved_carbon,
+    }
+
+def grid_constants(og_config: str, new_config: str, params_arrays: Dict[str, Any],
+                   overwrite_params: Optional[Dict[str, Any]]=None, data_source_dir: str="../data/carbon_data",
+                   afr_file: str="../data/AFR_data/afr_data.yaml") -> Dict[str, np.ndarray]:
+    """Get the per-server quantities of scenario_constants over a grid of parameter points.
+
+    Each config is built once, and its per-server carbon is evaluated at every
+    point in one vectorized call (see batch_model.evaluate_grid). The
+    maintenance overhead and vcores do not depend on the parameters.
+
+    Args:
+        og_config: The original server configuration.
+        new_config: The new server configuration.
+        params_arrays: Parameter name to values (see BatchServerCarbon.evaluate),
+                       e.g. {'emissions_factor': carbon_intensities}.
+        overwrite_params: Parameters that override params.yaml for every point.
+        data_source_dir: The carbon data directory (or compiled catalog file).
+        afr_file: The AFR data YAML file used for the maintenance overhead.
+
+    Returns:
+        The arrays of scenario_constants, with one entry per parameter point.
+    """
+    constants = {}
+    for prefix, config in (('og', og_config), ('new', new_config)):
+        batch = BatchServerCarbon(config, data_source_dir, overwrite_params=overwrite_params)
+        server_carbon = batch.evaluate(**params_arrays)['per_server_carbon']
+        constants[f'{prefix}_server_carbon'] = server_carbon
+        afr = ServerMaintenance(None, afr_file, model=batch.model).get_AFRs()
+        constants[f'{prefix}_maintenance_overhead'] = np.full(server_carbon.shape, 1 + afr)
+        constants[f'{prefix}_vcores'] = np.full(server_carbon.shape, float(batch.model.get_vcores()))
+    return constants
+
+def average_savings(cluster_file: str, constants: Dict[str, np.ndarray], buffer: float=0.1,
+                    weight_cluster: bool=False, chunksize: int=65536) -> np.ndarray:
+    """Calculate the average cluster-level savings of every scenario in a set of per-server constants.
+
+    Args:
+        cluster_file: The CSV file with the cluster-level data.
+        constants: The per-scenario arrays returned by scenario_constants or grid_constants.
+        buffer: The growth buffer as a fraction of the cluster size.
+        weight_cluster: Whether to weight the savings by the original cluster size.
+        chunksize: The number of cluster rows to read at a time.
+
+    Returns:
+        The average percentage of carbon saved by each scenario.
+    """
+    savings_sum = np.zeros(len(constants['og_server_carbon']))
+    weight_sum = 0.0
+    for chunk in pd.read_csv(cluster_file, usecols=CLUSTER_COLUMNS, chunksize=chunksize):
+        original = chunk['OriginalClusterSize'].to_numpy().astype(int)
+        perc_saved = cluster_carbon(original, chunk['NewClusterSize_Baseline'].to_numpy(),
+                                    chunk['NewClusterSize_GreenSKU'].to_numpy(), constants, buffer)['perc_saved_carbon']
+        weights = original if weight_cluster else np.ones(len(original))
+        savings_sum += perc_saved @ weights
+        weight_sum += weights.sum()
+    if weight_sum == 0:
+        raise ValueError(f'No clusters to average over in {cluster_file}')
+    return savings_sum / weight_sum
+
+def cluster_savings(cluster_file: str, scenarios: Sequence[Scenario], buffer: float=0.1, weight_cluster: bool=False,
+                    data_source_dir: str="../data/carbon_data", afr_file: str="../data/AFR_data/afr_data.yaml",
+                    chunksize: int=65536) -> np.ndarray:
+    """Calculate the average cluster-level savings of many scenarios at once.
+
+    The cluster file is read in chunks of rows, so it can be much larger than
+    memory; each chunk is evaluated for all scenarios with array operations
+    (memory use is about scenarios x chunksize values).
+
+    Args:
+        cluster_file: The CSV file with the cluster-level data.
+        scenarios: (baseline config, new config, params) for each scenario,
+                   e.g. one per carbon intensity.
+        buffer: The growth buffer as a fraction of the cluster size.
+        weight_cluster: Whether to weight the savings by the original cluster size.
+        data_source_dir: The carbon data directory (or compiled catalog file).
+        afr_file: The AFR data YAML file used for the maintenance overhead.
+        chunksize: The number of cluster rows to read at a time.
+
+    Returns:
+        The average percentage of carbon saved by each scenario.
+    """
+    constants = scenario_constants(scenarios, data_source_dir, afr_file)
+    return average_savings(cluster_file, constants, buffer, weight_cluster, chunksize)
+
+def process_csv(csv_file: str, og_config: Union[str, Dict], new_config: Union[str, Dict], params: Dict[str, Any],
+                buffer: float=0.1, weight_cluster: bool=False, data_source_dir: str="../data/carbon_data",
+                afr_file: str="../data/AFR_data/afr_data.yaml") -> Tuple[pd.DataFrame, float]:
+    """Calculate the per-cluster carbon and average savings of one scenario.
+
+    Same interface as the process_csv function that notebooks/carbon_savings.ipynb used to define.
+
+    Args:
+        csv_file: The CSV file with the cluster-level data.
+        og_config: The original server configuration.
+        new_config: The new server configuration.
+        params: The parameters to overwrite.
+        buffer: The growth buffer as a fraction of the cluster size.
+        weight_cluster: Whether to weight the savings by the original cluster size.
+        data_source_dir: The carbon data directory (or compiled catalog file).
+        afr_file: The AFR data YAML file used for the maintenance overhead.
+
+    Returns:
+        The cluster data with the per-cluster results added, and the
+        (optionally weighted) average percentage of carbon saved.
+    """
+    df = pd.read_csv(csv_file)
+    constants = scenario_constants([(og_config, new_config, params)], data_source_dir, afr_file)
+    df['OriginalClusterSize'] = df['OriginalClusterSize'].astype(int)
+    results = cluster_carbon(df['OriginalClusterSize'].to_numpy(), df['NewClusterSize_Baseline'].to_numpy(),
+                             df['NewClusterSize_GreenSKU'].to_numpy(), constants, buffer)
+    for key, values in results.items():
+        df[key] = values[0]
+    if weight_cluster:
+        return df, np.average(df['perc_saved_carbon'], weights=df['OriginalClusterSize'])
+    return df, df['perc_saved_carbon'].mean()
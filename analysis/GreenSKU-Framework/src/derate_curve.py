@@ -1,10 +1,17 @@
 import numpy as np
-import scipy.optimize as opt
-import matplotlib.pyplot as plt
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+import hashlib
+import json
+import math
+import os
+import threading
 import warnings
-
-# ignore warnings
-warnings.filterwarnings("ignore")
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 def exponential_func(x, a, b, c):
     return a * np.exp(-b * x) + c
@@ -18,46 +25,252 @@ def quadratic_func(x, a, b, c):
 def cubic_func(x, a, b, c, d):
     return a * x**3 + b * x**2 + c * x + d
 
+FIT_FUNCS = {func.__name__: func for func in (exponential_func, linear_func, quadratic_func, cubic_func)}
+
+# functions that are polynomials in x (with parameters ordered from the highest
+# power down) can be fitted in closed form with linear least squares
+POLYNOMIAL_DEGREES = {linear_func.__name__: 1, quadratic_func.__name__: 2, cubic_func.__name__: 3}
+
+class DerateCurve:
+    """A fitted derate curve: its coefficients plus the spec domain it was fitted on.
+
+    Scalars evaluate to floats and NumPy arrays to arrays of the same shape,
+    with the same arithmetic in both cases. Curves are plain data (no closures)
+    so they can be pickled, cached to disk, or sent to worker processes.
+
+    Kinds:
+        constant: coefficients are (value,).
+        polynomial: coefficients are ordered from the highest power down, as for np.polyval.
+        exponential: coefficients are (a, b, c) of exponential_func.
+    """
+    __slots__ = ('kind', 'coefficients', 'domain')
+
+    def __init__(self, kind: str, coefficients, domain: Optional[Tuple[float, float]]=None) -> None:
+        if kind not in ('constant', 'polynomial', 'exponential'):
+            raise ValueError(f'Unknown derate curve kind {kind}')
+        self.kind = kind
+        self.coefficients = tuple(float(c) for c in coefficients)
+        self.domain = None if domain is None else (float(domain[0]), float(domain[1]))
+
+    @classmethod
+    def constant(cls, value: float, domain: Optional[Tuple[float, float]]=None) -> 'DerateCurve':
+        """A curve that is value everywhere (e.g. 1 for components without derates)."""
+        return cls('constant', (value,), domain)
+
+    def __call__(self, x):
+        if isinstance(x, (int, float)):
+            return self._eval_scalar(float(x))
+        x = np.asarray(x, dtype=float)
+        if self.kind == 'constant':
+            return np.full(x.shape, self.coefficients[0])
+        if self.kind == 'polynomial':
+            return np.polyval(self.coefficients, x)
+        a, b, c = self.coefficients
+        return a * np.exp(-b * x) + c
+
+    def _eval_scalar(self, x: float) -> float:
+        if self.kind == 'constant':
+            return self.coefficients[0]
+        if self.kind == 'polynomial':
+            # Horner's method, in the same order as np.polyval
+            y = 0.0
+            for coefficient in self.coefficients:
+                y = y * x + coefficient
+            return y
+        a, b, c = self.coefficients
+        return a * math.exp(-b * x) + c
+
+    def is_constant(self) -> bool:
+        """Whether the curve evaluates to the same value everywhere."""
+        return self.kind == 'constant'
+
+    def __reduce__(self):
+        return (DerateCurve, (self.kind, self.coefficients, self.domain))
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, DerateCurve):
+            return NotImplemented
+        return (self.kind, self.coefficients, self.domain) == (other.kind, other.coefficients, other.domain)
+
+    def __hash__(self) -> int:
+        return hash((self.kind, self.coefficients, self.domain))
+
+    def __repr__(self) -> str:
+        return f'DerateCurve({self.kind!r}, {list(self.coefficients)}, domain={self.domain})'
+
+# derate curve for components without derates
+NO_DERATE = DerateCurve.constant(1.0)
+
+def _domain(x_data) -> Tuple[float, float]:
+    return (min(x_data), max(x_data))
+
 # check if data forms horizontal line - if so, return horizontal line
 def check_horizontal(x_data, y_data):
     if len(set(y_data)) == 1:
-        # return function that works with both scalar and array inputs
-        return lambda x: np.ones(np.array(x).shape) * y_data[0]
+        return DerateCurve.constant(y_data[0], _domain(x_data))
     return None
 
-# fit function to data
-def fit(func, x_data, y_data, plot=False):
-    # popt: optimal values for the parameters
-    # pcov: covariance matrix
+def plot_fit(x_data, y_data, curve):
+    # matplotlib is only needed for plotting, so it is not imported with the module
+    import matplotlib.pyplot as plt
+    x_fit = np.linspace(x_data[0], x_data[-1], 100)
+    y_fit = curve(x_fit)
+    plt.plot(x_data, y_data, 'o', label='data')
+    plt.plot(x_fit, y_fit, label='fit')
+    plt.legend()
+    plt.show()
+
+# fit function to data and return the optimal parameters
+def fit_params(func, x_data, y_data):
     if isinstance(x_data, list):
         x_data = np.array(x_data)
     if isinstance(y_data, list):
         y_data = np.array(y_data)
-    popt, pcov = opt.curve_fit(func, x_data, y_data)
+    # fits of short derate tables can be poorly conditioned - ignore the warnings for the fit only
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        # polynomials are linear in their parameters - solve directly
+        if func.__name__ in POLYNOMIAL_DEGREES:
+            return np.polyfit(x_data, y_data, POLYNOMIAL_DEGREES[func.__name__])
+        # scipy is only needed for non-linear fits, so it is not imported with the module
+        import scipy.optimize as opt
+        # popt: optimal values for the parameters
+        # pcov: covariance matrix
+        popt, pcov = opt.curve_fit(func, x_data, y_data)
+    return popt
 
+# fit function to data
+def fit(func, x_data, y_data, plot=False):
+    popt = fit_params(func, x_data, y_data)
+    # func with optimal parameters
+    curve = curve_from_coefficients(func.__name__, popt, _domain(x_data))
     if plot:
-        x_fit = np.linspace(x_data[0], x_data[-1], 100)
-        y_fit = func(x_fit, *popt)
-        plt.plot(x_data, y_data, 'o', label='data')
-        plt.plot(x_fit, y_fit, label='fit')
-        plt.legend()
-        plt.show()
-    
-    # return func with optimal parameters
-    return lambda x: func(x, *popt)
-
-def fit_cubic(data_dict, plot=False):
+        plot_fit(x_data, y_data, curve)
+    return curve
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on a lock file, across processes."""
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class FitCache:
+    """Cache of fitted derate curve coefficients keyed by spec_derates content.
+
+    Fits are kept in memory and, if a path is given, also in a JSON file that
+    is read on creation and rewritten whenever a new fit is added, so that
+    other processes (or later sessions) can reuse them. The file is rewritten
+    under a lock and merged with the fits other processes have saved to it.
+    """
+    def __init__(self, path: Optional[str]=None) -> None:
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        # key -> (function name, coefficients)
+        self._fits: Dict[str, Tuple[str, List[float]]] = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                stored = json.load(f)
+            for key, value in stored.items():
+                self._fits[key] = (value['func'], value['coefficients'])
+
+    @staticmethod
+    def key(func_name: str, data_dict: Mapping[Any, Any]) -> str:
+        """Get the cache key for fitting func_name to a spec -> derate table."""
+        points = sorted((float(x), float(y)) for x, y in data_dict.items())
+        return hashlib.sha256(repr((func_name, points)).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, List[float]]]:
+        """Get the (function name, coefficients) stored for a key, counting hits and misses."""
+        with self._lock:
+            entry = self._fits.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, key: str, func_name: str, coefficients: List[float]) -> None:
+        """Store the coefficients of a fit (and persist them if the cache has a path)."""
+        with self._lock:
+            self._fits[key] = (func_name, [float(c) for c in coefficients])
+            if self.path is not None:
+                self._save()
+
+    def _save(self) -> None:
+        # other processes may have added fits to the file since it was read, so merge
+        # them in under a file lock before replacing it, rather than overwriting them
+        with _file_lock(f'{self.path}.lock'):
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    for key, value in json.load(f).items():
+                        self._fits.setdefault(key, (value['func'], value['coefficients']))
+            stored = {key: {'func': func_name, 'coefficients': coefficients}
+                      for key, (func_name, coefficients) in self._fits.items()}
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        """Drop all in-memory fits and reset the counters (the JSON file is left as is)."""
+        with self._lock:
+            self._fits.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Get the hit/miss counters and the number of cached fits."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._fits)}
+
+# process-wide cache used by fit_cubic unless another cache is passed in
+fit_cache = FitCache()
+
+def set_fit_cache(cache: FitCache) -> None:
+    """Replace the process-wide fit cache, e.g. with one backed by a JSON file."""
+    global fit_cache
+    fit_cache = cache
+
+def curve_from_coefficients(func_name: str, coefficients: List[float],
+                            domain: Optional[Tuple[float, float]]=None) -> DerateCurve:
+    """Build a derate curve from the fitted coefficients of one of the fitting functions."""
+    if func_name == 'horizontal':
+        return DerateCurve.constant(coefficients[0], domain)
+    if func_name in POLYNOMIAL_DEGREES:
+        return DerateCurve('polynomial', coefficients, domain)
+    if func_name == exponential_func.__name__:
+        return DerateCurve('exponential', coefficients, domain)
+    raise ValueError(f'Unknown fitting function {func_name}')
+
+def fit_cubic(data_dict, plot=False, cache: Optional[FitCache]=None):
+    if cache is None:
+        cache = fit_cache
     x_data = [float(x) for x in data_dict]
     y_data = [float(y) for y in data_dict.values()]
-    # check if data forms horizontal line - if so, return horizontal line
-    horizontal = check_horizontal(x_data, y_data)
-    if horizontal:
-        if plot:
-            x_fit = np.linspace(x_data[0], x_data[-1], 100)
-            y_fit = horizontal(x_fit)
-            plt.plot(x_data, y_data, 'o', label='data')
-            plt.plot(x_fit, y_fit, label='fit')
-            plt.legend()
-            plt.show()
-        return horizontal
-    return fit(cubic_func, x_data, y_data, plot)
+    key = FitCache.key(cubic_func.__name__, data_dict)
+    entry = cache.get(key)
+    if entry is None:
+        # check if data forms horizontal line - if so, return horizontal line
+        if check_horizontal(x_data, y_data):
+            entry = ('horizontal', [y_data[0]])
+        else:
+            entry = (cubic_func.__name__, list(fit_params(cubic_func, x_data, y_data)))
+        cache.put(key, *entry)
+    curve = curve_from_coefficients(*entry, domain=_domain(x_data))
+    if plot:
+        plot_fit(x_data, y_data, curve)
+    return curve
@@ -0,0 +1,419 @@
+import argparse
+import copy
+import csv
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil, floor
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+import numpy as np
+from helpers import *
+from catalog import ComponentCatalog, load_yaml_snapshot, thaw
+from carbon_model import ServerCarbon, strip_U
+from derate_curve import fit_cubic, NO_DERATE
+from sweep import init_worker, worker_state
+
+# options searched over when a space does not set them - None means every
+# matching entry in the catalog
+DEFAULT_SPACE = {
+    'cpu': None,
+    'cpu_number': [1],
+    'memory': None,
+    'memory_number': [4, 6, 8, 10, 12],
+    'cxl': None,
+    'cxl_number': [0, 4, 8],
+    'cxl_controller': None,
+    'ssd': None,
+    'ssd_number': [1, 2, 3, 4, 5, 6],
+    'ssd_reuse': None,
+    'ssd_reuse_number': [0, 6, 12],
+    'nic': None,
+    'nic_number': [1],
+    'form': ['1U', '2U'],
+}
+
+# component counts of a design - a design that needs at least as many of
+# each as another design with the same component types is never better
+COUNT_KEYS = ['memory_number', 'cxl_number', 'ssd_number', 'ssd_reuse_number', 'nic_number']
+
+CONSTRAINTS = ('min_memory_per_core', 'max_memory_per_core', 'min_ssd_per_core', 'max_ssd_per_core', 'max_server_power')
+
+def _size(size: str) -> float:
+    return convert_units({'size': size})['size']
+
+def _options(catalog: ComponentCatalog, space: Dict[str, Any], key: str, yaml_name: str) -> List[Any]:
+    if space.get(key) is not None:
+        return [tuple(option) if isinstance(option, list) else option for option in space[key]]
+    return catalog.keys(yaml_name)
+
+def enumerate_designs(catalog: ComponentCatalog, space: Optional[Dict[str, Any]]=None) -> Iterator[Dict[str, Any]]:
+    """Enumerate the component choices of a design space.
+
+    Args:
+        catalog: The catalog to take the component options from.
+        space: Options to search over (see DEFAULT_SPACE). Component options are
+               catalog keys, e.g. ('DDR5', '4800MHz', '64GB') for memory.
+
+    Returns:
+        An iterator of designs: dicts of the chosen catalog key and count for
+        each component, and the server form factor.
+    """
+    space = dict(DEFAULT_SPACE, **(space or {}))
+    cpus = _options(catalog, space, 'cpu', 'CPU.yaml')
+    memories = _options(catalog, space, 'memory', 'DRAM.yaml')
+    cxls = _options(catalog, space, 'cxl', 'DRAM.yaml')
+    controllers = _options(catalog, space, 'cxl_controller', 'CXL_controller.yaml')
+    ssds = _options(catalog, space, 'ssd', 'SSD.yaml')
+    reuse_ssds = _options(catalog, space, 'ssd_reuse', 'SSD_reuse.yaml')
+    nics = _options(catalog, space, 'nic', 'NIC.yaml')
+    servers = set(catalog.keys('server.yaml'))
+    forms = [form for form in space['form'] if f'Server-{form}' in servers]
+
+    # without CXL DIMMs (or reused SSDs) their type does not matter
+    cxl_choices = [(cxl, controller, number) for number in space['cxl_number']
+                   for cxl, controller in (itertools.product(cxls, controllers) if number > 0 else [(cxls[0], controllers[0])])]
+    reuse_choices = [(ssd, number) for number in space['ssd_reuse_number']
+                     for ssd in (reuse_ssds if number > 0 else [None])]
+    for cpu, cpu_number, memory, memory_number, (cxl, controller, cxl_number), ssd, ssd_number, \
+            (reuse_ssd, reuse_number), nic, nic_number, form in itertools.product(
+                cpus, space['cpu_number'], memories, space['memory_number'], cxl_choices, ssds, space['ssd_number'],
+                reuse_choices, nics, space['nic_number'], forms):
+        yield {
+            'cpu': cpu, 'cpu_number': cpu_number,
+            'memory': memory, 'memory_number': memory_number,
+            'cxl': cxl, 'cxl_number': cxl_number, 'cxl_controller': controller,
+            'ssd': ssd, 'ssd_number': ssd_number,
+            'ssd_reuse': reuse_ssd, 'ssd_reuse_number': reuse_number,
+            'nic': nic, 'nic_number': nic_number,
+            'form': form,
+        }
+
+def design_capacities(design: Dict[str, Any], catalog: ComponentCatalog) -> Dict[str, float]:
+    """Get the physical cores, memory (GB, including CXL) and storage (GB, including reused SSDs) of a design."""
+    vendor, cpu_type, core_count = design['cpu']
+    cores = catalog.cpu(vendor, cpu_type, core_count)['count'] * design['cpu_number']
+    memory = _size(design['memory'][2]) * design['memory_number'] + _size(design['cxl'][2]) * design['cxl_number']
+    storage = _size(design['ssd'][1]) * design['ssd_number']
+    if design['ssd_reuse'] is not None:
+        storage += _size(design['ssd_reuse'][1]) * design['ssd_reuse_number']
+    return {'cores': cores, 'memory': memory, 'storage': storage}
+
+def is_feasible(design: Dict[str, Any], catalog: ComponentCatalog, constraints: Dict[str, float]) -> bool:
+    """Check the capacity constraints of a design, which do not need a model."""
+    capacities = design_capacities(design, catalog)
+    memory_per_core = capacities['memory'] / capacities['cores']
+    ssd_per_core = capacities['storage'] / capacities['cores']
+    return (memory_per_core >= constraints.get('min_memory_per_core', 0.0)
+            and memory_per_core <= constraints.get('max_memory_per_core', float('inf'))
+            and ssd_per_core >= constraints.get('min_ssd_per_core', 0.0)
+            and ssd_per_core <= constraints.get('max_ssd_per_core', float('inf')))
+
+def prune_dominated(designs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop designs that need at least as many of every component as another design.
+
+    Among designs with the same component types and form factor, adding
+    components never lowers power or carbon per server, so it never raises
+    the servers (and sellable cores) per rack or lowers the carbon per
+    sellable core. Such designs can be dropped before building any model.
+    """
+    groups: Dict[Tuple, List[Dict[str, Any]]] = {}
+    for design in designs:
+        group = tuple((key, value) for key, value in design.items() if key not in COUNT_KEYS)
+        groups.setdefault(group, []).append(design)
+    survivors = []
+    for group in groups.values():
+        counts = np.array([[design[key] for key in COUNT_KEYS] for design in group])
+        # covers[i, j]: design j needs no more of any component than design i
+        covers = np.all(counts[:, None, :] >= counts[None, :, :], axis=2)
+        np.fill_diagonal(covers, False)
+        # keep one of any identical designs
+        identical = np.all(counts[None, :, :] == counts[:, None, :], axis=2)
+        earlier = np.tril(identical, k=-1).any(axis=1)
+        dominated = np.any(covers & ~identical, axis=1) | earlier
+        survivors.extend(design for design, drop in zip(group, dominated) if not drop)
+    return survivors
+
+def design_config(design: Dict[str, Any], template: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """Build a server configuration (as in server_configs/) for a design.
+
+    Args:
+        design: The component choices of the design.
+        template: A server configuration to take the rack, data center and
+                  other settings from.
+        name: The name of the configuration.
+
+    Returns:
+        The configuration, as a dict with a 'server' key.
+    """
+    server = copy.deepcopy(thaw(template['server']))
+    server['name'] = name
+    vendor, cpu_type, core_count = design['cpu']
+    # keep the template's other CPU settings, e.g. its sellable core overhead
+    server['cpu'] = dict(server.get('cpu', {}), vendor=vendor, type=cpu_type, number=design['cpu_number'],
+                         core_count=core_count)
+    memory_type, memory_frequency, memory_size = design['memory']
+    server['memory'] = {'type': memory_type, 'number': design['memory_number'], 'size': memory_size,
+                        'overhead': 0.0, 'frequency': memory_frequency}
+    cxl_type, cxl_frequency, cxl_size = design['cxl']
+    server['cxl'] = {'type': cxl_type, 'number': design['cxl_number'], 'size': cxl_size,
+                     'controller': design['cxl_controller'], 'frequency': cxl_frequency}
+    server['ssd'] = {'type': design['ssd'][0], 'number': design['ssd_number'], 'size': design['ssd'][1]}
+    if design['ssd_reuse'] is not None:
+        server['ssd_reuse'] = {'type': design['ssd_reuse'][0], 'number': design['ssd_reuse_number'],
+                               'size': design['ssd_reuse'][1]}
+    else:
+        server.pop('ssd_reuse', None)
+    server['nic'] = {'bandwidth': design['nic'], 'number': design['nic_number']}
+    server['type'] = f"Server-{design['form']}"
+    server['form'] = design['form']
+    return {'server': server}
+
+def design_params(catalog: ComponentCatalog, overwrite_params: Optional[Dict[str, Any]]=None) -> Dict[str, Any]:
+    """Get the model parameters used by design_bounds, with the defaults ServerCarbon fills in."""
+    params = thaw(catalog.params())
+    params.setdefault('cpu_efficiency', 1.0)
+    params.setdefault('power_factor', 1.0)
+    params.setdefault('fan_slope', -1.0)
+    params.update(overwrite_params or {})
+    return params
+
+def _derate_curve(record: Mapping) -> Any:
+    return fit_cubic(record['spec_derates']) if 'spec_derates' in record else NO_DERATE
+
+def _component_power(record: Mapping, number: float, spec: float, factor: float=1.0) -> float:
+    return convert_units(record)['power'] * number * _derate_curve(record)(spec) * factor
+
+def _items_power(items: Mapping, name: str, spec: float, fan_power: Optional[float]=None) -> float:
+    # as in ServerCarbon, a group of items takes the derate curve of its
+    # item with the same name, if that has one
+    curve = _derate_curve(items[name]) if name in items else NO_DERATE
+    power = 0.0
+    for key, record in items.items():
+        item_power = fan_power if key == 'fan' and fan_power is not None else convert_units(record)['power']
+        power += item_power * record.get('number', 1) * curve(spec)
+    return power
+
+def design_bounds(design: Dict[str, Any], template: Dict[str, Any], catalog: ComponentCatalog,
+                  params: Dict[str, Any]) -> Dict[str, float]:
+    """Bound the server power, servers per rack and racks per data center of a design from the catalog.
+
+    The power of the components is computed as in ServerCarbon, at the
+    rack's provisioned spec, except for the fan: its power depends on the
+    power of the rest of the server, so the lowest power the fan slope
+    allows is taken instead. The server power is therefore a lower bound,
+    and the server and rack counts are upper bounds, so a design that fails
+    them also fails in its model.
+
+    Args:
+        design: The component choices of the design.
+        template: The server configuration the design is built from.
+        catalog: The catalog to take the components from.
+        params: Model parameters (see design_params).
+
+    Returns:
+        A dict with 'server_power' (provisioned W), 'server_count' and 'rack_count'.
+    """
+    server = template['server']
+    rack = convert_units(server['rack'])
+    spec = rack.get('spec_allocation', server['spec'])
+    psu_factor = 1.0 + (1.0 - params['PSU_efficiency'])
+
+    vendor, cpu_type, core_count = design['cpu']
+    cpu_factor = params['voltage_regulator_overhead'] * params['cpu_efficiency']
+    socket_power = _component_power(catalog.cpu(vendor, cpu_type, core_count), design['cpu_number'], spec, cpu_factor)
+    socket_power += _component_power(catalog.memory(*design['memory']), design['memory_number'], spec)
+    socket_power += _component_power(catalog.memory(*design['cxl']), design['cxl_number'], spec)
+    if design['cxl_number'] > 0:
+        controller = catalog.cxl_controller(design['cxl_controller'])
+        controller_number = ceil(design['cxl_number'] / (controller['channels'] * controller['dimms_per_channel']))
+        socket_power += _component_power(controller, controller_number, spec)
+    socket_power += _component_power(catalog.ssd(*design['ssd']), design['ssd_number'], spec)
+    if design['ssd_reuse'] is not None:
+        socket_power += _component_power(catalog.ssd(*design['ssd_reuse'], reuse=True),
+                                         design['ssd_reuse_number'], spec)
+    power = socket_power * server.get('sockets', 1)
+    power += _component_power(catalog.nic(design['nic']), design['nic_number'], spec)
+
+    chassis = catalog.server(f"Server-{design['form']}")
+    fan_power = None
+    if params['fan_slope'] > 0 and 'fan' in chassis:
+        # the fan power grows with the server power from its base, which is never below 0 W
+        base_power = strip_power(params[f"{design['form']}_server_base"])
+        fan_power = convert_units(chassis['fan'])['power'] - params['fan_slope'] * base_power
+    power += _items_power(chassis, 'server', spec, fan_power)
+    dc_items, dc_config = catalog.dc(server['dc']['type'])
+    power += _items_power(dc_items, 'dc', spec)
+
+    rack_items = catalog.rack(rack['type'])
+    rack_power = _items_power(rack_items, 'rack', spec)
+    server_power = power * psu_factor
+    if rack.get('num_servers'):
+        server_count = rack['num_servers']
+    else:
+        rack_space = strip_U(rack['capacity']) - sum(strip_U(item['capacity']) * item['number']
+                                                     for item in rack_items.values())
+        server_count = floor(rack_space / strip_U(design['form']))
+        if server_power > 0:
+            server_count = min(server_count, floor((rack['power'] - rack_power) / server_power))
+    rack_count = float(dc_config['rack_capacity'])
+    rack_provisioned = (power + rack_power) * psu_factor
+    if rack_provisioned > 0:
+        rack_count = min(rack_count, floor(strip_power(dc_config['power_capacity']) / rack_provisioned))
+    return {'server_power': server_power, 'server_count': server_count, 'rack_count': rack_count}
+
+def within_bounds(bounds: Dict[str, float], max_server_power: Optional[float]) -> bool:
+    """Check whether design_bounds (or a model's exact values) fit max_server_power, a rack and the data center."""
+    return ((max_server_power is None or bounds['server_power'] <= max_server_power)
+            and bounds['server_count'] > 0 and bounds['rack_count'] > 0)
+
+def _evaluate_designs(configs: List[Dict[str, Any]], max_server_power: Optional[float]) -> List[Optional[Dict[str, Any]]]:
+    results = []
+    for config in configs:
+        model = ServerCarbon(config, worker_state['data_source_dir'], overwrite_params=worker_state['overwrite_params'],
+                             print_out=False, lazy=True)
+        # exact bounds first: these only need the power stage, not the carbon stages
+        server_power = model.get_server_power()[0]
+        bounds = {'server_power': server_power, 'server_count': model.get_server_count(),
+                  'rack_count': model.get_rack_count()}
+        if not within_bounds(bounds, max_server_power):
+            results.append(None)
+            continue
+        rack_sellable_cores = model.get_rack_sellable_cores()
+        results.append({
+            'server_design_power': server_power,
+            'server_count': model.get_server_count(),
+            'rack_count': model.get_rack_count(),
+            'sellable_cores_per_rack': rack_sellable_cores,
+            'carbon_per_sellable_core': model.rack_carbon / rack_sellable_cores,
+            'operational_per_sellable_core': model.rack_operational / rack_sellable_cores,
+            'embodied_per_sellable_core': model.rack_embodied / rack_sellable_cores,
+        })
+    return results
+
+def pareto_front(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Get the results with the lowest carbon per sellable core for their sellable cores per rack.
+
+    Args:
+        results: Evaluated designs.
+
+    Returns:
+        The non-dominated results, from the most to the fewest sellable cores per rack.
+    """
+    ordered = sorted(results, key=lambda result: (-result['sellable_cores_per_rack'], result['carbon_per_sellable_core']))
+    front = []
+    best = float('inf')
+    for result in ordered:
+        if result['carbon_per_sellable_core'] < best:
+            front.append(result)
+            best = result['carbon_per_sellable_core']
+    return front
+
+def search(template: Union[str, Dict[str, Any]], space: Optional[Dict[str, Any]]=None,
+           constraints: Optional[Dict[str, float]]=None, data_source_dir: str="../data/carbon_data",
+           overwrite_params: Optional[Dict[str, Any]]=None, workers: Optional[int]=1,
+           chunk_size: int=64) -> Dict[str, Any]:
+    """Search a design space for the Pareto front of carbon per sellable core vs. sellable cores per rack.
+
+    Designs are enumerated from the catalog, filtered by the capacity
+    constraints, pruned by component-count dominance, and filtered by the
+    power, rack and data center bounds of design_bounds without building any
+    model. The survivors are then built as lazy models, and designs that
+    exceed max_server_power or do not fit in a rack or the data center are
+    dropped before their carbon is computed.
+
+    Args:
+        template: A server configuration to take the rack, data center and
+                  other settings from (YAML file or dict).
+        space: Options to search over (see DEFAULT_SPACE).
+        constraints: Any of CONSTRAINTS - memory (GB, including CXL) and
+                     storage (GB, including reused SSDs) per physical core,
+                     and the server design power in W.
+        data_source_dir: The carbon data directory (or compiled catalog file).
+        overwrite_params: Parameters that override params.yaml.
+        workers: The number of worker processes, or None for one per CPU. With
+                 1, designs are evaluated in this process.
+        chunk_size: The number of designs per task.
+
+    Returns:
+        A dict with 'pareto' (the front), 'evaluated' (every evaluated
+        design) and 'stats' (the number of designs left after each step).
+        Each result holds its design, its configuration and its metrics.
+    """
+    constraints = dict(constraints or {})
+    for key in constraints:
+        if key not in CONSTRAINTS:
+            raise ValueError(f'Unknown constraint {key} (supported: {", ".join(CONSTRAINTS)})')
+    if isinstance(template, str):
+        template = load_yaml_snapshot(template)
+    catalog = ComponentCatalog.for_dir(data_source_dir)
+    stats = {'enumerated': 0, 'feasible': 0, 'undominated': 0, 'bounded': 0, 'evaluated': 0}
+    feasible = []
+    for design in enumerate_designs(catalog, space):
+        stats['enumerated'] += 1
+        if is_feasible(design, catalog, constraints):
+            feasible.append(design)
+    stats['feasible'] = len(feasible)
+    designs = prune_dominated(feasible)
+    stats['undominated'] = len(designs)
+    max_server_power = constraints.get('max_server_power')
+    params = design_params(catalog, overwrite_params)
+    designs = [design for design in designs
+               if within_bounds(design_bounds(design, template, catalog, params), max_server_power)]
+    stats['bounded'] = len(designs)
+    configs = [design_config(design, template, f'Design-{index}') for index, design in enumerate(designs)]
+    chunks = [configs[start:start + chunk_size] for start in range(0, len(configs), chunk_size)]
+    if workers == 1:
+        init_worker(data_source_dir, overwrite_params)
+        metrics = [result for chunk in chunks for result in _evaluate_designs(chunk, max_server_power)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(data_source_dir, overwrite_params)) as executor:
+            metrics = [result for results in executor.map(_evaluate_designs, chunks, itertools.repeat(max_server_power))
+                       for result in results]
+    evaluated = []
+    for design, config, result in zip(designs, configs, metrics):
+        if result is not None:
+            evaluated.append(dict(result, name=config['server']['name'], design=design, config=config))
+    stats['evaluated'] = len(evaluated)
+    return {'pareto': pareto_front(evaluated), 'evaluated': evaluated, 'stats': stats}
+
+def _design_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    row = {'name': result['name']}
+    for key, value in result['design'].items():
+        row[key] = '/'.join(str(v) for v in value) if isinstance(value, tuple) else value
+    row.update({key: value for key, value in result.items() if key not in ('name', 'design', 'config')})
+    return row
+
+def main(argv: Optional[List[str]]=None) -> None:
+    parser = argparse.ArgumentParser(description='Search the catalog for Pareto-optimal server designs.')
+    parser.add_argument('template', help='server configuration YAML to take the rack and data center from')
+    parser.add_argument('-o', '--output', required=True, help='output .csv file for the Pareto front')
+    parser.add_argument('--space', default=None, help='YAML file with options to search over (see DEFAULT_SPACE)')
+    parser.add_argument('--min-memory-per-core', type=float, default=None, help='GB of memory (incl. CXL) per core')
+    parser.add_argument('--max-memory-per-core', type=float, default=None, help='GB of memory (incl. CXL) per core')
+    parser.add_argument('--min-ssd-per-core', type=float, default=None, help='GB of storage per core')
+    parser.add_argument('--max-ssd-per-core', type=float, default=None, help='GB of storage per core')
+    parser.add_argument('--max-server-power', type=float, default=None, help='server design power in W')
+    parser.add_argument('--data-source-dir', default='../data/carbon_data',
+                        help='carbon data directory or compiled catalog file')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--write-configs', default=None, metavar='DIR',
+                        help='also write a server configuration YAML for each Pareto-optimal design')
+    args = parser.parse_args(argv)
+    space = thaw(load_yaml_snapshot(args.space)) if args.space else None
+    constraints = {key: getattr(args, key) for key in CONSTRAINTS if getattr(args, key) is not None}
+    results = search(args.template, space, constraints, args.data_source_dir, workers=args.workers)
+    rows = [_design_row(result) for result in results['pareto']]
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ['name'])
+        writer.writeheader()
+        writer.writerows(rows)
+    if args.write_configs:
+        for result in results['pareto']:
+            config_file = join_path(args.write_configs, f"{result['name']}.yaml")
+            open_path_dir(config_file)
+            write_yaml(config_file, result['config'])
+    print(', '.join(f'{key}: {value}' for key, value in results['stats'].items()))
+    print(f"Wrote {len(rows)} Pareto-optimal designs to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 import ruamel.yaml
-from typing import Any
+from typing import Any, Dict
 import os
 from pathlib import Path
 
 yaml = ruamel.yaml.YAML()
+# the safe loader builds plain dicts/lists and uses the C parser from
+# ruamel.yaml.clib when it is installed
+fast_yaml = ruamel.yaml.YAML(typ='safe')
 
 def read_yaml(yaml_file: str) -> dict:
     """Read a YAML file and return the contents as a dictionary.
@@ -16,6 +19,21 @@ def read_yaml(yaml_file: str) -> dict:
     """
     with open(yaml_file, 'r') as f:
         return yaml.load(f)
+
+def read_yaml_fast(yaml_file: str) -> Any:
+    """Read a YAML file with the (C-accelerated, if available) safe loader.
+
+    Unlike read_yaml, comments and formatting are not preserved, so the result
+    should not be written back with write_yaml.
+
+    Args:
+        yaml_file: The YAML file to read.
+
+    Returns:
+        The YAML file's contents as plain dicts and lists.
+    """
+    with open(yaml_file, 'r') as f:
+        return fast_yaml.load(f)
     
 def write_yaml(yaml_file: str, yaml_data: Any) -> None:
     """Write a dictionary to a YAML file.
@@ -42,6 +60,33 @@ def join_path(*paths: str) -> str:
     paths = [os.path.normpath(path) for path in paths]
     return os.path.join(*paths)
 
+def strip_power(s):
+    s = str(s)
+    if s.endswith('kW'):
+        s = float(s.replace('kW', ''))*1000
+    elif s.endswith('MW'):
+        s = float(s.replace('MW', ''))*1000000
+    elif s.endswith('GW'):
+        s = float(s.replace('GW', ''))*1000000000
+    elif s.endswith('W'):
+        s = float(s.replace('W', ''))
+    return float(s)
+
+def convert_units(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of a component record with power and size strings converted to numbers."""
+    converted = dict(data)
+    for key, value in data.items():
+        if not isinstance(value, str):
+            continue
+        if key == 'power':
+            converted[key] = strip_power(value)
+        elif key == 'size':
+            if value.endswith('GB'):
+                converted[key] = float(value.replace('GB', ''))
+            elif value.endswith('TB'):
+                converted[key] = float(value.replace('TB', ''))*1000
+    return converted
+
 # open last level directory
 def open_path_dir(path, file=True):
     path_obj = Path(path)
@@ -0,0 +1,172 @@
+import functools
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# instrumentation points: (module, attribute path, span name). Attributes are
+# patched where they are looked up, e.g. carbon_model.fit_cubic rather than
+# derate_curve.fit_cubic, since carbon_model imports the function by name.
+INSTRUMENTATION_POINTS: List[Tuple[str, str, str]] = [
+    ('catalog', 'read_yaml_fast', 'yaml_parse'),
+    ('catalog', 'load_yaml_snapshot', 'yaml_load'),
+    ('carbon_model', 'load_yaml_snapshot', 'yaml_load'),
+    ('carbon_model', 'index_cpu_data', 'index_cpu_data'),
+    ('carbon_model', 'index_memory_data', 'index_memory_data'),
+    ('carbon_model', 'index_ssd_data', 'index_ssd_data'),
+    ('carbon_model', 'index_nic_data', 'index_nic_data'),
+    ('carbon_model', 'index_dc_data', 'index_dc_data'),
+    ('carbon_model', 'index_rack_data', 'index_rack_data'),
+    ('carbon_model', 'index_server_data', 'index_server_data'),
+    ('carbon_model', 'index_cxl_controller_data', 'index_cxl_controller_data'),
+    ('carbon_model', 'fit_cubic', 'fit_cubic'),
+    ('derate_curve', 'fit_params', 'fit_params'),
+    ('carbon_model', 'ServerCarbon.__init__', 'ServerCarbon.__init__'),
+    ('carbon_model', 'ServerCarbon._set_derate_curves', 'stage:derate_curves'),
+    ('carbon_model', 'ServerCarbon._set_capacities', 'stage:capacities'),
+    ('carbon_model', 'ServerCarbon._set_num_components', 'stage:num_components'),
+    ('carbon_model', 'ServerCarbon._set_power', 'stage:power'),
+    ('carbon_model', 'ServerCarbon._set_component_power', '_set_component_power'),
+    ('carbon_model', 'ServerCarbon._set_fan_power', '_set_fan_power'),
+    ('carbon_model', 'ServerCarbon._set_component_carbon', 'stage:component_carbon'),
+    ('carbon_model', 'ServerCarbon._set_server_carbon', 'stage:server_carbon'),
+    ('carbon_model', 'ServerCarbon._set_server_count', 'stage:server_count'),
+    ('carbon_model', 'ServerCarbon._set_rack_carbon', 'stage:rack_carbon'),
+    ('carbon_model', 'ServerCarbon._set_rack_count', 'stage:rack_count'),
+    ('carbon_model', 'ServerCarbon._set_dc_carbon', 'stage:dc_carbon'),
+    ('carbon_model', 'ServerCarbon._set_sellable_cores', 'stage:sellable_cores'),
+    ('carbon_model', 'ServerCarbon.get_server_carbon_df', 'get_server_carbon_df'),
+    ('carbon_model', 'ServerCarbon.get_rack_carbon_df', 'get_rack_carbon_df'),
+    ('carbon_model', 'ServerCarbon.get_dc_carbon_df', 'get_dc_carbon_df'),
+    ('carbon_model', 'ServerCarbon.get_breakdown_df', 'get_breakdown_df'),
+    ('carbon_model', 'ServerCarbon.get_result', 'get_result'),
+    ('carbon_model', 'ServerCarbon.get_info_dict', 'get_info_dict'),
+]
+
+class Span(NamedTuple):
+    """One timed call: perf_counter() at its start and end, and how deeply it was nested in other spans."""
+    name: str
+    start: float
+    end: float
+    depth: int
+    thread: int
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+class Recorder:
+    """Collects the spans recorded while instrumentation is enabled."""
+    def __init__(self, keep_spans: bool=True, on_span: Optional[Callable[[Span], None]]=None) -> None:
+        self.keep_spans = keep_spans
+        self.on_span = on_span
+        self.spans: List[Span] = []
+        self._stats: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _record(self, span: Span) -> None:
+        with self._lock:
+            entry = self._stats.get(span.name)
+            if entry is None:
+                self._stats[span.name] = entry = [0, 0.0]
+            entry[0] += 1
+            entry[1] += span.duration
+            if self.keep_spans:
+                self.spans.append(span)
+        if self.on_span is not None:
+            self.on_span(span)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Get the call count and total wall time (in ms) of each span name, slowest first.
+
+        Nested spans are included in the time of the spans that contain them,
+        e.g. stage:power includes _set_component_power.
+        """
+        with self._lock:
+            ordered = sorted(self._stats.items(), key=lambda item: -item[1][1])
+            return {name: {'calls': calls, 'total_ms': total * 1000, 'mean_ms': total * 1000 / calls}
+                    for name, (calls, total) in ordered}
+
+    def reset(self) -> None:
+        """Drop the spans and counters recorded so far."""
+        with self._lock:
+            self.spans = []
+            self._stats = {}
+
+    def report(self) -> str:
+        """Get the stats as a text table."""
+        lines = [f"{'span':35s} {'calls':>8s} {'total ms':>12s} {'mean ms':>10s}"]
+        for name, entry in self.stats().items():
+            lines.append(f"{name:35s} {entry['calls']:8d} {entry['total_ms']:12.3f} {entry['mean_ms']:10.4f}")
+        return '\n'.join(lines)
+
+def _timed(func: Callable, name: str, recorder: Recorder) -> Callable:
+    local = recorder._local
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(local, 'depth', 0)
+        local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            local.depth = depth
+            recorder._record(Span(name, start, end, depth, threading.get_ident()))
+    return wrapper
+
+def _resolve(module_name: str, path: str) -> Tuple[Any, str]:
+    owner = importlib.import_module(module_name)
+    parts = path.split('.')
+    for part in parts[:-1]:
+        owner = getattr(owner, part)
+    return owner, parts[-1]
+
+_active_lock = threading.Lock()
+_active: Optional[Recorder] = None
+
+@contextmanager
+def instrument(keep_spans: bool=True, on_span: Optional[Callable[[Span], None]]=None,
+               points: Optional[List[Tuple[str, str, str]]]=None) -> Iterator[Recorder]:
+    """Time the catalog, derate fitting and ServerCarbon stages while the context is open.
+
+    The instrumentation points are wrapped with timers on entry and restored
+    on exit, so the model runs its original, unwrapped code whenever no
+    instrument() context is open. Only one context can be open at a time;
+    calls from all threads are recorded while it is.
+
+    Args:
+        keep_spans: Whether to keep every span (set False for long sweeps to
+                    only keep the per-name counters).
+        on_span: A hook called with each span as it finishes.
+        points: The instrumentation points (default: INSTRUMENTATION_POINTS).
+
+    Returns:
+        The recorder, whose stats() and spans hold the results.
+    """
+    global _active
+    recorder = Recorder(keep_spans, on_span)
+    with _active_lock:
+        if _active is not None:
+            raise RuntimeError('Instrumentation is already enabled')
+        _active = recorder
+    patched = []
+    try:
+        for module_name, path, name in (points if points is not None else INSTRUMENTATION_POINTS):
+            owner, attribute = _resolve(module_name, path)
+            original = owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)
+            setattr(owner, attribute, _timed(original, name, recorder))
+            patched.append((owner, attribute, original))
+        yield recorder
+    finally:
+        for owner, attribute, original in reversed(patched):
+            setattr(owner, attribute, original)
+        with _active_lock:
+            _active = None
+
+def is_enabled() -> bool:
+    """Whether an instrument() context is open."""
+    return _active is not None
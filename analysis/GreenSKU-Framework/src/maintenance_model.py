@@ -1,12 +1,34 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Mapping, Optional, Sequence, Tuple, Union
+import numpy as np
 from helpers import *
+from catalog import load_yaml_snapshot
 from carbon_model import ServerCarbon
 
 class ServerMaintenance:
-    def __init__(self, config_file: str, data_source: str, carbon_data_dir: str='../data/carbon_data/', overwrite_params: Dict[str, Any]={}):
-        self.maintenance_data = read_yaml(data_source)
-        self.server_carbon = ServerCarbon(config_file, carbon_data_dir, print_out=False, overwrite_params=overwrite_params)
-        self.num_components = self.server_carbon.get_num_components()
+    def __init__(self, config_file: Optional[Union[str, Dict]], data_source: str, carbon_data_dir: str='../data/carbon_data/',
+                 overwrite_params: Dict[str, Any]={}, model: Optional[ServerCarbon]=None,
+                 num_components: Optional[Mapping[str, int]]=None):
+        """Initialize the maintenance model.
+
+        Args:
+            config_file: The server configuration (YAML file or dict). Not used
+                         if model or num_components is given.
+            data_source: The AFR data YAML file. It is parsed once per process
+                         and shared by all maintenance models.
+            carbon_data_dir: The carbon data directory used to build the model.
+            overwrite_params: Parameters to overwrite when building the model.
+            model: An existing ServerCarbon for the configuration to take the
+                   component counts from, instead of building a new one.
+            num_components: The component counts (as returned by
+                            ServerCarbon.get_num_components) to use directly.
+        """
+        self.maintenance_data = load_yaml_snapshot(data_source)
+        if num_components is None:
+            if model is None:
+                model = ServerCarbon(config_file, carbon_data_dir, print_out=False, overwrite_params=overwrite_params, lazy=True)
+            num_components = model.get_num_components()
+        self.server_carbon = model
+        self.num_components = num_components
 
     def get_component_num(self, component: str, reuse: bool) -> int:
         if component == "DRAM":
@@ -29,21 +51,60 @@ class ServerMaintenance:
             return 1
         else:
             raise ValueError(f"Component {component} not found")
-        
 
-    def get_AFRs(self) -> float:
+    def get_AFR_terms(self) -> List[Tuple[str, bool, float]]:
         '''
-        Returns the AFR for the server configuration
+        Returns (component, reuse, AFR weighted by the non-FIP fraction) for each AFR in the data
         '''
-        total_afr = 0
+        terms = []
         for component in self.maintenance_data:
             fip_rate = 1
             if 'FIP_rate' in self.maintenance_data[component]:
                 fip_rate = 1 - self.maintenance_data[component]['FIP_rate']
             if 'AFR' in self.maintenance_data[component]:
-                component_number = self.get_component_num(component, False)
-                total_afr += self.maintenance_data[component]['AFR'] * component_number * fip_rate
+                terms.append((component, False, self.maintenance_data[component]['AFR'] * fip_rate))
             if 'reuse_AFR' in self.maintenance_data[component]:
-                component_number = self.get_component_num(component, True)
-                total_afr += self.maintenance_data[component]['reuse_AFR'] * component_number * fip_rate
-        return total_afr / 100
\ No newline at end of file
+                terms.append((component, True, self.maintenance_data[component]['reuse_AFR'] * fip_rate))
+        return terms
+
+    def get_AFRs(self) -> float:
+        '''
+        Returns the AFR for the server configuration
+        '''
+        total_afr = 0
+        for component, reuse, rate in self.get_AFR_terms():
+            total_afr += rate * self.get_component_num(component, reuse)
+        return total_afr / 100
+
+    @classmethod
+    def get_AFRs_batch(cls, configs: Sequence[Union[str, Dict, ServerCarbon, Mapping[str, int]]], data_source: str,
+                       carbon_data_dir: str='../data/carbon_data/', overwrite_params: Dict[str, Any]={}) -> np.ndarray:
+        '''
+        Returns the AFRs of many server configurations in one call
+
+        Args:
+            configs: Server configurations, each given as a YAML file, a config
+                     dict, a ServerCarbon, or a component-count mapping.
+            data_source: The AFR data YAML file.
+            carbon_data_dir: The carbon data directory used to build models.
+            overwrite_params: Parameters to overwrite when building models.
+
+        Returns:
+            The AFR of each configuration (same as get_AFRs).
+        '''
+        maintenances = []
+        for config in configs:
+            if isinstance(config, ServerCarbon):
+                maintenances.append(cls(None, data_source, model=config))
+            elif isinstance(config, Mapping) and 'server' not in config:
+                maintenances.append(cls(None, data_source, num_components=config))
+            else:
+                maintenances.append(cls(config, data_source, carbon_data_dir, overwrite_params))
+        if not maintenances:
+            return np.zeros(0)
+        # the AFR data is shared, so the AFRs are one (configs x terms) @ (terms) product
+        terms = maintenances[0].get_AFR_terms()
+        counts = np.array([[maintenance.get_component_num(component, reuse) for component, reuse, _ in terms]
+                           for maintenance in maintenances], dtype=float).reshape(len(maintenances), len(terms))
+        rates = np.array([rate for _, _, rate in terms], dtype=float)
+        return counts @ rates / 100
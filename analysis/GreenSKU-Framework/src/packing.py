@@ -0,0 +1,319 @@
+from math import ceil, floor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from carbon_model import ServerCarbon
+
+OBJECTIVES = ('sellable_cores', 'carbon_per_sellable_core')
+
+def sku_profile(model: ServerCarbon, name: Optional[str]=None) -> Dict[str, Any]:
+    """Get what the packing solver needs to know about one server SKU.
+
+    Args:
+        model: The server model.
+        name: The name of the SKU (default: the configuration name).
+
+    Returns:
+        The SKU's provisioned power (W), form factor (U), sellable cores, and
+        per-server operational, embodied and total carbon (not amortized).
+    """
+    provisioned, _, _ = model.get_server_power()
+    return {
+        'name': name if name is not None else model.config['name'],
+        'power': provisioned,
+        'form': model.get_server_form(),
+        'sellable_cores': model.get_server_sellable_cores(),
+        'operational': model.server_operational,
+        'embodied': model.server_embodied,
+        'carbon': model.server_carbon,
+    }
+
+def rack_limits(model: ServerCarbon) -> Dict[str, float]:
+    """Get the rack and data center limits and overheads of a model's rack.yaml and data_center.yaml entries.
+
+    Returns:
+        power: The rack power left for servers (W), as in ServerCarbon._set_server_count.
+        capacity: The rack space left for servers (U).
+        rack_power: The provisioned power of the rack's own components (W).
+        rack_carbon: The carbon of the rack's own components.
+        dc_power: The power capacity of the data center (W).
+        dc_racks: The rack capacity of the data center.
+        dc_carbon: The carbon of the data center building (not per rack).
+    """
+    rack_power = model.provisioned_component_power['rack']
+    return {
+        'power': model.config['rack']['power'] - rack_power,
+        'capacity': model.get_rack_capacity(),
+        'rack_power': rack_power,
+        'rack_carbon': model.component_carbon['rack'],
+        'dc_power': model.get_dc_power_capacity(),
+        'dc_racks': model.get_dc_capacity(),
+        'dc_carbon': model.component_carbon['dc'],
+    }
+
+def _knapsack_table(values: Sequence[float], forms: Sequence[int], powers: Sequence[int], capacity: int,
+                    power_limit: int, max_counts: Sequence[int]) -> Tuple[List[Tuple], np.ndarray, List[np.ndarray]]:
+    """Bounded knapsack over rack space and (discretized) power: the best value for every space and power budget."""
+    # split each SKU into 0/1 items of 1, 2, 4, ... servers
+    items = []
+    for index, (value, form, power, max_count) in enumerate(zip(values, forms, powers, max_counts)):
+        if value <= 0:
+            continue
+        if form > 0:
+            max_count = min(max_count, capacity // form)
+        if power > 0:
+            max_count = min(max_count, power_limit // power)
+        size = 1
+        while max_count > 0:
+            take = min(size, max_count)
+            items.append((index, take, take * value, take * form, take * power))
+            max_count -= take
+            size *= 2
+    # best[u, p]: the best value using at most u U and p power steps
+    best = np.zeros((capacity + 1, power_limit + 1))
+    taken = []
+    for _, _, value, form, power in items:
+        candidate = np.full(best.shape, -np.inf)
+        candidate[form:, power:] = best[:capacity + 1 - form, :power_limit + 1 - power] + value
+        take = candidate > best
+        best = np.where(take, candidate, best)
+        taken.append(take)
+    return items, best, taken
+
+def _knapsack_counts(items: List[Tuple], taken: List[np.ndarray], sku_count: int, u: int, p: int) -> List[int]:
+    """The counts of the best solution within u U and p power steps, from _knapsack_table."""
+    counts = [0] * sku_count
+    for (index, number, _, form, power), take in zip(reversed(items), reversed(taken)):
+        if take[u, p]:
+            counts[index] += number
+            u -= form
+            p -= power
+    return counts
+
+def _knapsack(values: Sequence[float], forms: Sequence[int], powers: Sequence[int], capacity: int,
+              power_limit: int, max_counts: Sequence[int]) -> List[int]:
+    """Bounded knapsack over rack space and (discretized) power: the counts maximizing the total value."""
+    items, _, taken = _knapsack_table(values, forms, powers, capacity, power_limit, max_counts)
+    return _knapsack_counts(items, taken, len(values), capacity, power_limit)
+
+def _rack(profiles: Sequence[Dict[str, Any]], counts: Sequence[int], limits: Dict[str, float]) -> Dict[str, Any]:
+    servers = sum(counts)
+    sellable_cores = sum(n * profile['sellable_cores'] for n, profile in zip(counts, profiles))
+    carbon = limits['rack_carbon'] + sum(n * profile['carbon'] for n, profile in zip(counts, profiles))
+    form_used = sum(n * profile['form'] for n, profile in zip(counts, profiles))
+    power_used = sum(n * profile['power'] for n, profile in zip(counts, profiles))
+    return {
+        'counts': {profile['name']: n for n, profile in zip(counts, profiles) if n > 0},
+        'servers': servers,
+        'sellable_cores': sellable_cores,
+        'carbon': carbon,
+        'carbon_per_sellable_core': carbon / sellable_cores if sellable_cores > 0 else float('inf'),
+        'form_used': form_used,
+        'power_used': power_used,
+        'space_utilization': form_used / limits['capacity'] if limits['capacity'] > 0 else 0.0,
+        'power_utilization': power_used / limits['power'] if limits['power'] > 0 else 0.0,
+    }
+
+def _greedy_counts(order: Sequence[int], profiles: Sequence[Dict[str, Any]], limits: Dict[str, float],
+                   max_counts: Sequence[int]) -> List[int]:
+    counts = [0] * len(profiles)
+    space, power = limits['capacity'], limits['power']
+    for index in order:
+        profile = profiles[index]
+        fit = max_counts[index]
+        if profile['form'] > 0:
+            fit = min(fit, floor(space / profile['form']))
+        if profile['power'] > 0:
+            fit = min(fit, floor(power / profile['power']))
+        counts[index] = max(fit, 0)
+        space -= counts[index] * profile['form']
+        power -= counts[index] * profile['power']
+    return counts
+
+def best_rack(profiles: Sequence[Dict[str, Any]], limits: Dict[str, float], objective: str='sellable_cores',
+              method: str='dp', max_counts: Optional[Sequence[int]]=None, power_step: float=1.0,
+              max_iterations: int=50) -> Dict[str, Any]:
+    """Find the mix of SKUs to put in one rack.
+
+    Args:
+        profiles: The SKUs that can be used (see sku_profile).
+        limits: The rack limits (see rack_limits).
+        objective: 'sellable_cores' to maximize the sellable cores of the rack,
+                   or 'carbon_per_sellable_core' to minimize its carbon
+                   (rack and servers) per sellable core.
+        method: 'dp' for an exact knapsack over rack space and power (power
+                is rounded up to power_step, so a solution never exceeds the
+                rack power), or 'greedy' to fill the rack with the best SKU per
+                U first, which is faster but not always optimal.
+        max_counts: The most servers of each SKU that may be used (default: no limit).
+        power_step: The power resolution of the knapsack in W.
+        max_iterations: The most knapsack solves for 'carbon_per_sellable_core'.
+
+    Returns:
+        The rack: the number of servers of each SKU ('counts'), its sellable
+        cores and carbon, and its space and power utilization.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f'Unknown objective {objective} (supported: {", ".join(OBJECTIVES)})')
+    if method not in ('dp', 'greedy'):
+        raise ValueError(f'Unknown packing method {method} (supported: dp, greedy)')
+    if max_counts is None:
+        max_counts = [int(limits['capacity'])] * len(profiles)
+    cores = [profile['sellable_cores'] for profile in profiles]
+    carbon = [profile['carbon'] for profile in profiles]
+
+    if method == 'greedy':
+        if objective == 'sellable_cores':
+            order = sorted(range(len(profiles)), key=lambda i: -cores[i] / max(profiles[i]['form'], 1e-9))
+        else:
+            order = sorted(range(len(profiles)), key=lambda i: carbon[i] / cores[i] if cores[i] > 0 else float('inf'))
+        return _rack(profiles, _greedy_counts(order, profiles, limits, max_counts), limits)
+
+    forms = [int(ceil(profile['form'])) for profile in profiles]
+    powers = [int(ceil(profile['power'] / power_step)) for profile in profiles]
+    capacity = int(floor(limits['capacity']))
+    power_limit = int(floor(limits['power'] / power_step))
+    counts = _knapsack(cores, forms, powers, capacity, power_limit, max_counts)
+    if objective == 'sellable_cores':
+        return _rack(profiles, counts, limits)
+    # Dinkelbach: minimize (rack carbon + carbon) / cores by repeatedly
+    # maximizing ratio * cores - carbon with the ratio of the last solution
+    rack = _rack(profiles, counts, limits)
+    for _ in range(max_iterations):
+        ratio = rack['carbon_per_sellable_core']
+        if not np.isfinite(ratio):
+            break
+        counts = _knapsack([ratio * c - k for c, k in zip(cores, carbon)], forms, powers, capacity, power_limit, max_counts)
+        candidate = _rack(profiles, counts, limits)
+        if candidate['carbon_per_sellable_core'] >= ratio * (1 - 1e-12):
+            break
+        rack = candidate
+    return rack
+
+def _dc_rack_count(rack: Dict[str, Any], limits: Dict[str, float]) -> Tuple[float, float]:
+    """The number of copies of a rack that fit in the data center, and the number its power allows."""
+    rack_power = rack['power_used'] + limits['rack_power']
+    power_rack_count = floor(limits['dc_power'] / rack_power) if rack_power > 0 else float('inf')
+    return min(power_rack_count, limits['dc_racks']), power_rack_count
+
+def _dc_cores_rack(profiles: Sequence[Dict[str, Any]], limits: Dict[str, float], method: str,
+                   max_counts: Optional[Sequence[int]]=None, power_step: float=1.0) -> Dict[str, Any]:
+    """Find the rack whose copies give the data center the most sellable cores, within its power and rack limits."""
+    if max_counts is None:
+        max_counts = [int(limits['capacity'])] * len(profiles)
+    cores = [profile['sellable_cores'] for profile in profiles]
+    if method == 'greedy':
+        # fill by cores per U (space bound) or per W (power bound), whichever fills the data center better
+        per_u = sorted(range(len(profiles)), key=lambda i: -cores[i] / max(profiles[i]['form'], 1e-9))
+        per_w = sorted(range(len(profiles)), key=lambda i: -cores[i] / max(profiles[i]['power'], 1e-9))
+        racks = [_rack(profiles, _greedy_counts(order, profiles, limits, max_counts), limits) for order in (per_u, per_w)]
+    else:
+        forms = [int(ceil(profile['form'])) for profile in profiles]
+        powers = [int(ceil(profile['power'] / power_step)) for profile in profiles]
+        capacity = int(floor(limits['capacity']))
+        power_limit = int(floor(limits['power'] / power_step))
+        items, best, taken = _knapsack_table(cores, forms, powers, capacity, power_limit, max_counts)
+        # a rack within p power steps uses at most p * power_step W, so its data center holds at least
+        # this many copies - pick the power budget with the most cores per data center
+        budgets = np.arange(power_limit + 1)
+        rack_power = budgets * power_step + limits['rack_power']
+        with np.errstate(divide='ignore'):
+            rack_count = np.minimum(np.floor(limits['dc_power'] / rack_power), limits['dc_racks'])
+        budget = int(np.argmax(best[capacity] * rack_count))
+        racks = [_rack(profiles, _knapsack_counts(items, taken, len(profiles), capacity, budget), limits),
+                 _rack(profiles, _knapsack_counts(items, taken, len(profiles), capacity, power_limit), limits)]
+    return max(racks, key=lambda rack: rack['sellable_cores'] * _dc_rack_count(rack, limits)[0])
+
+def pack_dc(profiles: Sequence[Dict[str, Any]], limits: Dict[str, float], objective: str='sellable_cores',
+            method: str='dp', **kwargs: Any) -> Dict[str, Any]:
+    """Fill a data center with copies of one rack.
+
+    For 'sellable_cores', the rack maximizes the data center's sellable
+    cores: when the data center power limits the number of racks, a rack
+    with fewer cores but less power can give more cores in total, so every
+    rack power budget is tried (with 'dp', to power_step resolution; with
+    'greedy', racks filled by cores per U and per W are compared). For
+    'carbon_per_sellable_core', the rack is the best_rack one, i.e. it
+    minimizes the carbon per sellable core of a rack, and the data center
+    building's carbon is not part of the choice.
+
+    Args:
+        profiles: The SKUs that can be used (see sku_profile).
+        limits: The rack and data center limits (see rack_limits).
+        objective: See best_rack.
+        method: See best_rack.
+        kwargs: Other best_rack arguments.
+
+    Returns:
+        The rack ('rack'), the number of racks, whether the data center is
+        power limited, and the data center's sellable cores, carbon and
+        utilization.
+    """
+    if objective == 'sellable_cores' and method in ('dp', 'greedy'):
+        options = {key: kwargs[key] for key in ('max_counts', 'power_step') if key in kwargs}
+        rack = _dc_cores_rack(profiles, limits, method, **options)
+    else:
+        rack = best_rack(profiles, limits, objective, method, **kwargs)
+    rack_power = rack['power_used'] + limits['rack_power']
+    rack_count, power_rack_count = _dc_rack_count(rack, limits)
+    sellable_cores = rack['sellable_cores'] * rack_count
+    carbon = limits['dc_carbon'] + rack['carbon'] * rack_count
+    return {
+        'rack': rack,
+        'rack_count': rack_count,
+        'dc_power_limited': power_rack_count < limits['dc_racks'],
+        'sellable_cores': sellable_cores,
+        'carbon': carbon,
+        'carbon_per_sellable_core': carbon / sellable_cores if sellable_cores > 0 else float('inf'),
+        'space_utilization': rack_count / limits['dc_racks'] if limits['dc_racks'] > 0 else 0.0,
+        'power_utilization': rack_count * rack_power / limits['dc_power'] if limits['dc_power'] > 0 else 0.0,
+    }
+
+def pack_fleet(profiles: Sequence[Dict[str, Any]], demand: Sequence[int], limits: Dict[str, float],
+               method: str='dp', power_step: float=1.0) -> Dict[str, Any]:
+    """Pack a fleet of servers into as few racks as possible.
+
+    Racks are built one pattern at a time: the rack that holds the most
+    sellable cores of the servers still to place is found (with best_rack)
+    and repeated as many times as the remaining demand allows. The number of
+    distinct rack patterns is small, so this scales to very large fleets.
+
+    Args:
+        profiles: The SKUs in the fleet (see sku_profile).
+        demand: The number of servers of each SKU to place.
+        limits: The rack and data center limits (see rack_limits).
+        method: 'dp' or 'greedy' (see best_rack).
+        power_step: The power resolution of the knapsack in W.
+
+    Returns:
+        The rack patterns ('racks', a list of (rack, number of racks)), the
+        total number of racks, whether they fit in the data center, and the
+        fleet's sellable cores, carbon and utilization.
+    """
+    remaining = [int(count) for count in demand]
+    patterns: List[Tuple[Dict[str, Any], int]] = []
+    while any(remaining):
+        rack = best_rack(profiles, limits, 'sellable_cores', method, max_counts=remaining, power_step=power_step)
+        counts = [rack['counts'].get(profile['name'], 0) for profile in profiles]
+        if not any(counts):
+            unplaced = ', '.join(profile['name'] for profile, count in zip(profiles, remaining) if count > 0)
+            raise ValueError(f'Servers of {unplaced} do not fit in an empty rack')
+        repeats = min(left // count for left, count in zip(remaining, counts) if count > 0)
+        patterns.append((rack, repeats))
+        remaining = [left - count * repeats for left, count in zip(remaining, counts)]
+
+    rack_count = sum(repeats for _, repeats in patterns)
+    power = sum((rack['power_used'] + limits['rack_power']) * repeats for rack, repeats in patterns)
+    sellable_cores = sum(rack['sellable_cores'] * repeats for rack, repeats in patterns)
+    carbon = limits['dc_carbon'] + sum(rack['carbon'] * repeats for rack, repeats in patterns)
+    return {
+        'racks': patterns,
+        'rack_count': rack_count,
+        'fits_dc': rack_count <= limits['dc_racks'] and power <= limits['dc_power'],
+        'sellable_cores': sellable_cores,
+        'carbon': carbon,
+        'carbon_per_sellable_core': carbon / sellable_cores if sellable_cores > 0 else float('inf'),
+        'rack_space_utilization': sum(rack['space_utilization'] * repeats for rack, repeats in patterns) / max(rack_count, 1),
+        'rack_power_utilization': sum(rack['power_utilization'] * repeats for rack, repeats in patterns) / max(rack_count, 1),
+        'dc_space_utilization': rack_count / limits['dc_racks'] if limits['dc_racks'] > 0 else 0.0,
+        'dc_power_utilization': power / limits['dc_power'] if limits['dc_power'] > 0 else 0.0,
+    }
@@ -0,0 +1,229 @@
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from catalog import ComponentCatalog
+from carbon_model import ServerCarbon
+
+# worker process state, set up once per worker by init_worker
+worker_state: Dict[str, Any] = {}
+
+def grid_points(grid: Dict[str, Sequence[Any]]) -> Iterator[Dict[str, Any]]:
+    """Iterate over the Cartesian product of parameter axes.
+
+    Args:
+        grid: Parameter name (any params.yaml key) to the values to sweep.
+
+    Returns:
+        An iterator of parameter dicts, one per grid point, in row-major order.
+    """
+    keys = list(grid)
+    for values in itertools.product(*[grid[key] for key in keys]):
+        yield dict(zip(keys, values))
+
+def _config_name(config_file: str) -> str:
+    return os.path.splitext(os.path.basename(config_file))[0]
+
+def init_worker(data_source_dir: str, overwrite_params: Optional[Dict[str, Any]]) -> None:
+    """Set up worker_state for a worker process (also used by design_search).
+
+    Args:
+        data_source_dir: The carbon data directory (or compiled catalog file).
+        overwrite_params: Parameters that override params.yaml.
+    """
+    # parse and index the catalog once per worker instead of once per model
+    ComponentCatalog.for_dir(data_source_dir).preload()
+    worker_state['data_source_dir'] = data_source_dir
+    worker_state['overwrite_params'] = overwrite_params
+    # config file -> base model that grid points are applied to with with_params
+    worker_state['models'] = {}
+
+def _base_model(config_file: str) -> ServerCarbon:
+    models = worker_state['models']
+    if config_file not in models:
+        models[config_file] = ServerCarbon(config_file, worker_state['data_source_dir'],
+                                           overwrite_params=worker_state['overwrite_params'], print_out=False)
+    return models[config_file]
+
+def _evaluate_chunk(config_file: str, points: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    base = _base_model(config_file)
+    name = _config_name(config_file)
+    rows = []
+    for index, params in points:
+        model = base.with_params(**params) if params else base
+        row = {'config': name, 'point': index}
+        row.update(params)
+        row.update(model.get_info_dict())
+        rows.append(row)
+    return rows
+
+def _chunks(config_files: Sequence[str], grid: Dict[str, Sequence[Any]],
+            chunk_size: int) -> Iterator[Tuple[str, List[Tuple[int, Dict[str, Any]]]]]:
+    # chunks never mix configurations so each worker reuses one base model per chunk
+    for config_file in config_files:
+        chunk = []
+        for index, params in enumerate(grid_points(grid)):
+            chunk.append((index, params))
+            if len(chunk) == chunk_size:
+                yield config_file, chunk
+                chunk = []
+        if chunk:
+            yield config_file, chunk
+
+def sweep_columns(config_files: Sequence[str], grid: Dict[str, Sequence[Any]],
+                  data_source_dir: str="../data/carbon_data",
+                  overwrite_params: Optional[Dict[str, Any]]=None) -> List[str]:
+    """Get the output columns of a sweep.
+
+    The get_info_dict keys depend on which components a configuration has
+    (not on the parameters), so they are taken from one model per config.
+    Configurations without a component leave its columns empty.
+    """
+    columns = ['config', 'point'] + list(grid)
+    for config_file in config_files:
+        model = ServerCarbon(config_file, data_source_dir, overwrite_params=overwrite_params, print_out=False, lazy=True)
+        for key in model.get_info_dict():
+            if key not in columns:
+                columns.append(key)
+    return columns
+
+class _CSVSink:
+    def __init__(self, output_file: str, columns: List[str]) -> None:
+        self._file = open(output_file, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=columns)
+        self._writer.writeheader()
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+class _ParquetSink:
+    def __init__(self, output_file: str, columns: List[str]) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Writing Parquet requires pyarrow - install it or write to a .csv file')
+        self._pa = pa
+        self._columns = columns
+        self._output_file = output_file
+        self._pq = pq
+        self._writer = None
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        pa = self._pa
+        table = pa.table({column: [row.get(column) for row in rows] for column in self._columns})
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._output_file, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+def _open_sink(output_file: str, columns: List[str]):
+    if output_file.endswith('.parquet'):
+        return _ParquetSink(output_file, columns)
+    return _CSVSink(output_file, columns)
+
+def run_sweep(config_files: Sequence[str], grid: Dict[str, Sequence[Any]], output_file: str,
+              data_source_dir: str="../data/carbon_data", overwrite_params: Optional[Dict[str, Any]]=None,
+              workers: Optional[int]=None, chunk_size: int=256) -> int:
+    """Evaluate server configurations over a parameter grid in parallel.
+
+    Every (config, grid point) pair is evaluated with ServerCarbon and written
+    as one get_info_dict row. Work is sent to a process pool in chunks; each
+    worker preloads the catalog once and applies grid points to one base model
+    per configuration with with_params. Rows are written as chunks finish and
+    only a bounded number of chunks is in flight, so memory use does not grow
+    with the size of the grid. Rows are written in completion order - sort by
+    (config, point) to restore the grid order.
+
+    Args:
+        config_files: The YAML files containing the server configurations.
+        grid: Parameter name (any params.yaml key) to the values to sweep,
+              as for overwrite_params (e.g. emissions_factor in kgCO2e/kWh).
+        output_file: The .csv or .parquet file to write (Parquet needs pyarrow).
+        data_source_dir: The carbon data directory (or compiled catalog file).
+        overwrite_params: Parameters that override params.yaml for every point.
+        workers: The number of worker processes (default: number of CPUs).
+        chunk_size: The number of grid points per task.
+
+    Returns:
+        The number of rows written.
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+    workers = workers or os.cpu_count() or 1
+    sink = _open_sink(output_file, sweep_columns(config_files, grid, data_source_dir, overwrite_params))
+    rows_written = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(data_source_dir, overwrite_params)) as executor:
+            pending = set()
+            max_pending = 2 * workers
+            for config_file, points in _chunks(config_files, grid, chunk_size):
+                pending.add(executor.submit(_evaluate_chunk, config_file, points))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rows = future.result()
+                        sink.write(rows)
+                        rows_written += len(rows)
+            for future in wait(pending).done:
+                rows = future.result()
+                sink.write(rows)
+                rows_written += len(rows)
+    finally:
+        sink.close()
+    return rows_written
+
+def parse_axis(spec: str) -> Tuple[str, List[Any]]:
+    """Parse a command line grid axis.
+
+    Args:
+        spec: Either 'name=v1,v2,...' or 'name=start:stop:num' (num evenly
+              spaced values including both ends).
+
+    Returns:
+        The parameter name and its values.
+    """
+    if '=' not in spec:
+        raise ValueError(f'Grid axis {spec} is not of the form name=values')
+    name, values = spec.split('=', 1)
+    if values.count(':') == 2:
+        start, stop, num = values.split(':')
+        return name, [float(v) for v in np.linspace(float(start), float(stop), int(num))]
+    parsed = []
+    for value in values.split(','):
+        try:
+            parsed.append(float(value))
+        except ValueError:
+            # e.g. '250W' for 1U_server_base
+            parsed.append(value)
+    return name, parsed
+
+def main(argv: Optional[List[str]]=None) -> None:
+    parser = argparse.ArgumentParser(description='Sweep server configurations over a grid of model parameters.')
+    parser.add_argument('configs', nargs='+', help='server configuration YAML files')
+    parser.add_argument('-p', '--param', action='append', default=[], metavar='NAME=VALUES',
+                        help='grid axis, as name=v1,v2,... or name=start:stop:num (repeatable)')
+    parser.add_argument('-o', '--output', required=True, help='output .csv or .parquet file')
+    parser.add_argument('--data-source-dir', default='../data/carbon_data',
+                        help='carbon data directory or compiled catalog file')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=256, help='grid points per task')
+    args = parser.parse_args(argv)
+    grid = dict(parse_axis(spec) for spec in args.param)
+    rows = run_sweep(args.configs, grid, args.output, args.data_source_dir,
+                     workers=args.workers, chunk_size=args.chunk_size)
+    print(f'Wrote {rows} rows to {args.output}')
+
+if __name__ == '__main__':
+    main()
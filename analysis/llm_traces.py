@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+TIMESTAMP_COLUMN = "TIMESTAMP"
+CACHE_VERSION = 1
+
+# fixed layout of "YYYY-MM-DD HH:MM:SS[.fffffffff][+HH:MM|Z]": separator positions and characters
+_SEPARATORS = {4: b"-", 7: b"-", 10: b" T", 13: b":", 16: b":"}
+_MAX_FRACTION_DIGITS = 9
+_NS_PER_SECOND = 1_000_000_000
+# days per month (index 0 unused), February in a common year
+_MONTH_DAYS = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+
+def _days_from_civil(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    # days since 1970-01-01 of a proleptic Gregorian date (Howard Hinnant's algorithm), vectorized
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def parse_timestamps(values: Union[Sequence[str], np.ndarray]) -> np.ndarray:
+    """Parse ISO-like timestamps into int64 nanoseconds since the Unix epoch.
+
+    Every value must have the layout 'YYYY-MM-DD HH:MM:SS' (or with a 'T'
+    separator), optionally followed by a fraction of up to 9 digits and a
+    UTC offset ('+HH:MM', '-HH:MM' or 'Z'). Rows may mix fraction lengths and
+    the presence of the offset, e.g. '2024-05-12 00:00:00.001163+00:00' and
+    '2024-05-12 00:00:00+00:00'. Values with an offset are converted to UTC.
+    The whole column is parsed with array arithmetic on its bytes, without
+    a per-row parse.
+
+    Args:
+        values: The timestamps, as strings or bytes.
+
+    Returns:
+        The timestamps in nanoseconds since 1970-01-01 00:00:00 (UTC).
+    """
+    raw = np.asarray(values)
+    if raw.dtype.kind != "S":
+        raw = raw.astype("S")
+    count = len(raw)
+    if not count:
+        return np.zeros(0, dtype=np.int64)
+    if raw.dtype.itemsize < 19:
+        raw = raw.astype("S19")
+    width = raw.dtype.itemsize
+    # one row per character position, so that every operation below runs over contiguous memory
+    chars = np.ascontiguousarray(np.ascontiguousarray(raw).view(np.uint8).reshape(count, width).T)
+    # digits as uint8, so non-digits (including NUL padding) wrap around to values above 9
+    digits = chars - np.uint8(ord("0"))
+
+    valid = np.ones(count, dtype=bool)
+    for position, allowed in _SEPARATORS.items():
+        valid &= np.logical_or.reduce([chars[position] == char for char in allowed])
+
+    def number(first: int, length: int) -> np.ndarray:
+        result = np.zeros(count, dtype=np.int64)
+        for position in range(first, first + length):
+            valid[:] &= digits[position] <= 9
+            result = result * 10 + digits[position]
+        return result
+
+    year, month, day = number(0, 4), number(5, 2), number(8, 2)
+    hour, minute, second = number(11, 2), number(14, 2), number(17, 2)
+    leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    month_days = _MONTH_DAYS[np.clip(month, 0, 12)] + ((month == 2) & leap)
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days) \
+        & (hour <= 23) & (minute <= 59) & (second <= 60)
+
+    # fraction: the digits after a '.', up to the first non-digit
+    has_fraction = chars[19] == ord(".") if width > 19 else np.zeros(count, dtype=bool)
+    fraction = np.zeros(count, dtype=np.int32)
+    fraction_digits = np.zeros(count, dtype=np.int8)
+    in_fraction = has_fraction.copy()
+    for i in range(min(_MAX_FRACTION_DIGITS, width - 20)):
+        in_fraction &= digits[20 + i] <= 9
+        fraction += (digits[20 + i] * in_fraction) * np.int32(10 ** (_MAX_FRACTION_DIGITS - 1 - i))
+        fraction_digits += in_fraction
+    valid &= ~has_fraction | (fraction_digits > 0)
+
+    # UTC offset, after the seconds and the fraction - rows are handled in groups with the same
+    # offset position, of which there are only a few (one per fraction length)
+    offset_start = 19 + np.where(has_fraction, fraction_digits + 1, 0)
+    tail = np.zeros((7, count), dtype=np.uint8)
+    for start in np.flatnonzero(np.bincount(offset_start)):
+        rows = offset_start == start
+        for i in range(min(7, width - start)):
+            np.copyto(tail[i], chars[start + i], where=rows)
+    sign = tail[0]
+    has_offset = (sign == ord("+")) | (sign == ord("-"))
+    offset_digits = tail[[1, 2, 4, 5]] - np.uint8(ord("0"))
+    offset_valid = (offset_digits <= 9).all(axis=0) & (tail[3] == ord(":")) & (tail[6] == 0)
+    offset_digits = offset_digits.astype(np.int64)
+    minutes = (offset_digits[0] * 10 + offset_digits[1]) * 60 + offset_digits[2] * 10 + offset_digits[3]
+    offset_minutes = np.where(has_offset, np.where(sign == ord("-"), -minutes, minutes), 0)
+    valid &= np.where(has_offset, offset_valid, (sign == 0) | ((sign == ord("Z")) & (tail[1] == 0)))
+
+    if not valid.all():
+        bad = int(np.flatnonzero(~valid)[0])
+        raise ValueError(f"Cannot parse timestamp {raw[bad]!r} (row {bad}) - "
+                         f"expected 'YYYY-MM-DD HH:MM:SS[.fffffffff][+HH:MM]'")
+
+    seconds = _days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second - offset_minutes * 60
+    return seconds * _NS_PER_SECOND + fraction.astype(np.int64)
+
+def _cache_dir(source: str, cache_dir: Optional[str]) -> str:
+    name = os.path.splitext(os.path.basename(source.rstrip("/")))[0]
+    if cache_dir is None:
+        if "://" in source:
+            raise ValueError("A cache_dir is needed to cache a trace read from a URL")
+        cache_dir = os.path.dirname(os.path.abspath(source))
+    # the source path is part of the name, so traces with the same file name do not collide
+    digest = hashlib.sha256(source.encode()).hexdigest()[:8]
+    return os.path.join(cache_dir, f"{name}.{digest}.npycache")
+
+def _source_signature(source: str) -> Dict[str, Union[str, int, float]]:
+    if "://" in source:
+        return {"source": source}
+    status = os.stat(source)
+    return {"source": os.path.abspath(source), "size": status.st_size, "mtime": status.st_mtime}
+
+def read_trace_csv(source: str, columns: Optional[Iterable[str]]=None) -> Dict[str, np.ndarray]:
+    """Read a trace CSV (a path or URL) into NumPy columns, with TIMESTAMP as int64 nanoseconds."""
+    import pandas as pd
+    usecols = list(columns) if columns is not None else None
+    data = pd.read_csv(source, usecols=usecols, dtype={TIMESTAMP_COLUMN: str})
+    trace = {}
+    for column in data.columns:
+        if column == TIMESTAMP_COLUMN:
+            trace[column] = parse_timestamps(data[column].to_numpy())
+        elif data[column].dtype.kind in "biuf":
+            trace[column] = data[column].to_numpy()
+        else:
+            trace[column] = data[column].to_numpy().astype(str)
+    return trace
+
+def write_cache(trace: Dict[str, np.ndarray], path: str, signature: Optional[Dict]=None) -> None:
+    """Write trace columns to a cache directory, one .npy file per column."""
+    os.makedirs(path, exist_ok=True)
+    for column, values in trace.items():
+        np.save(os.path.join(path, f"{column}.npy"), np.ascontiguousarray(values), allow_pickle=False)
+    # the metadata is written last, so an interrupted write is never read as a complete cache
+    meta = {"version": CACHE_VERSION, "columns": list(trace), "rows": len(next(iter(trace.values()), [])),
+            "signature": signature or {}}
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+def read_cache(path: str, columns: Optional[Iterable[str]]=None, mmap: bool=True) -> Dict[str, np.ndarray]:
+    """Open the columns of a cache directory (memory-mapped by default)."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    names = list(columns) if columns is not None else meta["columns"]
+    missing = set(names) - set(meta["columns"])
+    if missing:
+        raise ValueError(f"Columns {sorted(missing)} are not in the trace - the columns are {meta['columns']}")
+    return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+            for name in names}
+
+def _cache_is_current(path: str, signature: Dict) -> bool:
+    meta_file = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_file):
+        return False
+    with open(meta_file) as f:
+        meta = json.load(f)
+    return meta.get("version") == CACHE_VERSION and meta.get("signature") == signature
+
+def load_trace(source: str, columns: Optional[Iterable[str]]=None, cache: bool=True,
+               cache_dir: Optional[str]=None, mmap: bool=True) -> Dict[str, np.ndarray]:
+    """Load an LLM inference trace as NumPy columns, with TIMESTAMP in int64 nanoseconds.
+
+    The first load parses the CSV and writes a cache directory next to it
+    (or into cache_dir) with one .npy file per column. Later loads open
+    these files memory-mapped, which takes milliseconds. The cache is
+    rebuilt when the CSV's size or modification time changes. Traces read
+    from a URL are cached by URL, so they need a cache_dir.
+
+    Args:
+        source: The trace CSV file or URL.
+        columns: The columns to load (default: all).
+        cache: Whether to use (and create) the cache.
+        cache_dir: The directory for the cache (default: the CSV's directory).
+        mmap: Whether to memory-map the cached columns instead of reading them.
+
+    Returns:
+        The columns of the trace.
+    """
+    if not cache:
+        return read_trace_csv(source, columns)
+    path = _cache_dir(source, cache_dir)
+    signature = _source_signature(source)
+    if not _cache_is_current(path, signature):
+        write_cache(read_trace_csv(source), path, signature)
+    return read_cache(path, columns, mmap)
+
+def to_dataframe(trace: Dict[str, np.ndarray], utc: bool=False):
+    """Get trace columns as a pandas DataFrame, with TIMESTAMP as datetime64[ns] (UTC if utc=True)."""
+    import pandas as pd
+    data = {}
+    for column, values in trace.items():
+        if column == TIMESTAMP_COLUMN:
+            timestamps = pd.to_datetime(np.asarray(values).view("datetime64[ns]"))
+            data[column] = timestamps.tz_localize("UTC") if utc else timestamps
+        else:
+            data[column] = values
+    return pd.DataFrame(data)
+
+def main(argv: Optional[List[str]]=None) -> None:
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert LLM inference trace CSVs into .npy column caches.")
+    parser.add_argument("sources", nargs="+", help="trace CSV files or URLs")
+    parser.add_argument("--cache-dir", default=None, help="directory for the caches (default: next to each CSV)")
+    args = parser.parse_args(argv)
+    for source in args.sources:
+        trace = load_trace(source, cache_dir=args.cache_dir)
+        print(f"{source}: {len(trace[TIMESTAMP_COLUMN])} rows cached in {_cache_dir(source, args.cache_dir)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from trace_replay import HttpTarget, iter_requests, replay, serve_stub
+
+def _trace(timestamps):
+    return {"TIMESTAMP": np.asarray(timestamps, dtype=np.int64),
+            "ContextTokens": np.full(len(timestamps), 10), "GeneratedTokens": np.full(len(timestamps), 5)}
+
+def _replay_stub(chunked: bool, rows: int=20):
+    async def main():
+        server = await serve_stub(chunked=chunked)
+        # one connection, so every request after the first reuses a pooled connection
+        target = HttpTarget(f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/", connections=1)
+        try:
+            return await replay(iter_requests(_trace(np.arange(rows))), target)
+        finally:
+            await target.close()
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(main())
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_replay_reuses_connections(chunked):
+    result = _replay_stub(chunked)
+    assert len(result) == 20
+    assert not result.errors
+    assert result.ok.all()
+
+def test_response_without_length_is_read_to_eof():
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{\"done\": true}")
+        await writer.drain()
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        target = HttpTarget(f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/", connections=1)
+        try:
+            result = await replay(iter_requests(_trace(np.arange(5))), target)
+            return result, len(target._idle)
+        finally:
+            await target.close()
+            server.close()
+            await server.wait_closed()
+    result, idle = asyncio.run(main())
+    assert not result.errors and len(result) == 5
+    assert idle == 0
+
+def test_unsorted_across_chunks():
+    requests = iter_requests(_trace([0, 10, 20, 5, 30]), chunk_size=3)
+    with pytest.raises(ValueError, match="not sorted"):
+        list(requests)
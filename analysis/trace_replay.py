@@ -0,0 +1,433 @@
+import array
+import asyncio
+import inspect
+import json
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from llm_traces import TIMESTAMP_COLUMN, load_trace
+
+# rows are read from the (memory-mapped) trace columns this many at a time
+CHUNK_SIZE = 4096
+# requests due within this many seconds are sent without sleeping first
+SEND_AHEAD = 0.0002
+# the scheduler yields to the running requests after sending this many in a row
+MAX_BURST = 256
+
+class Request(NamedTuple):
+    """One request of a replay: its trace row, and when to send it (seconds after the replay start)."""
+    index: int
+    row: int
+    scheduled: float
+    context_tokens: int
+    generated_tokens: int
+
+Target = Callable[[Request], Awaitable[Any]]
+
+def iter_requests(trace: Dict[str, np.ndarray], speedup: float=1.0, rate_multiplier: float=1.0,
+                  limit: Optional[int]=None, duration: Optional[float]=None, seed: int=0,
+                  chunk_size: int=CHUNK_SIZE) -> Iterator[Request]:
+    """Turn trace rows into requests scheduled at their original inter-arrival offsets.
+
+    Rows are read lazily, chunk by chunk, so a memory-mapped trace is never
+    loaded as a whole.
+
+    Args:
+        trace: The trace columns, as returned by llm_traces.load_trace.
+        speedup: The factor to compress the trace's time by (e.g. 60 replays
+                 an hour in a minute).
+        rate_multiplier: The number of requests to send per trace row. Every
+                         row is sent int(rate_multiplier) times, plus once more
+                         with probability equal to the fractional part, so
+                         values below 1 thin the trace.
+        limit: The number of trace rows to replay (default: all).
+        duration: The number of seconds of (compressed) trace time to replay.
+        seed: The seed for the fractional part of rate_multiplier.
+        chunk_size: The number of rows to read at a time.
+
+    Returns:
+        The requests, in the order of their scheduled times.
+    """
+    if speedup <= 0 or rate_multiplier <= 0:
+        raise ValueError("speedup and rate_multiplier must be positive")
+    timestamps = trace[TIMESTAMP_COLUMN]
+    context_tokens = trace.get("ContextTokens")
+    generated_tokens = trace.get("GeneratedTokens")
+    rows = len(timestamps) if limit is None else min(limit, len(timestamps))
+    if not rows:
+        return
+    first = int(timestamps[0])
+    seconds_per_ns = 1e-9 / speedup
+    copies, fraction = divmod(rate_multiplier, 1)
+    rng = np.random.default_rng(seed)
+    index = 0
+    # the last offset of the previous chunk, so that rows going back in time across chunks are caught too
+    previous = 0.0
+    for begin in range(0, rows, chunk_size):
+        end = min(begin + chunk_size, rows)
+        offsets = (np.asarray(timestamps[begin:end]) - first) * seconds_per_ns
+        if np.any(np.diff(offsets) < 0) or offsets[0] < previous:
+            raise ValueError(f"The trace timestamps are not sorted (rows {max(begin - 1, 0)} to {end})")
+        previous = offsets[-1]
+        repeats = np.full(end - begin, int(copies), dtype=np.int64)
+        if fraction:
+            repeats += rng.random(end - begin) < fraction
+        selected = np.repeat(np.arange(begin, end), repeats)
+        if duration is not None:
+            selected = selected[offsets[selected - begin] <= duration]
+        contexts = (np.asarray(context_tokens[begin:end])[selected - begin].tolist()
+                    if context_tokens is not None else [0] * len(selected))
+        generated = (np.asarray(generated_tokens[begin:end])[selected - begin].tolist()
+                     if generated_tokens is not None else [0] * len(selected))
+        for row, scheduled, context, tokens in zip(selected.tolist(), offsets[selected - begin].tolist(),
+                                                   contexts, generated):
+            yield Request(index, row, scheduled, context, tokens)
+            index += 1
+        if duration is not None and offsets[-1] > duration:
+            return
+
+class ReplayResult:
+    """What happened to each request of a replay, as arrays in completion order.
+
+    Times are seconds after the replay start: scheduled is when a request
+    was due, sent when the target was called, and finished when it returned.
+    """
+    def __init__(self) -> None:
+        self._index = array.array("q")
+        self._scheduled = array.array("d")
+        self._sent = array.array("d")
+        self._finished = array.array("d")
+        self._ok = array.array("b")
+        self.errors: Counter = Counter()
+        self.elapsed = 0.0
+
+    def _add(self, request: Request, sent: float, finished: float, ok: bool) -> None:
+        self._index.append(request.index)
+        self._scheduled.append(request.scheduled)
+        self._sent.append(sent)
+        self._finished.append(finished)
+        self._ok.append(ok)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def index(self) -> np.ndarray:
+        return np.frombuffer(self._index, dtype=np.int64)
+
+    @property
+    def scheduled(self) -> np.ndarray:
+        return np.frombuffer(self._scheduled, dtype=np.float64)
+
+    @property
+    def sent(self) -> np.ndarray:
+        return np.frombuffer(self._sent, dtype=np.float64)
+
+    @property
+    def finished(self) -> np.ndarray:
+        return np.frombuffer(self._finished, dtype=np.float64)
+
+    @property
+    def ok(self) -> np.ndarray:
+        return np.frombuffer(self._ok, dtype=np.int8).astype(bool)
+
+    @property
+    def skew(self) -> np.ndarray:
+        """The achieved minus the scheduled send time of each request, in seconds."""
+        return self.sent - self.scheduled
+
+    @property
+    def latency(self) -> np.ndarray:
+        return self.finished - self.sent
+
+    def summary(self) -> Dict[str, float]:
+        """Get the achieved rate, and the send skew and latency percentiles (in ms).
+
+        The drift is the slope of the skew over the scheduled time (ms of skew
+        per second of replay). It is close to 0 when the replay keeps up with
+        the trace, and positive when the skew grows, i.e. the replay falls behind.
+        """
+        count = len(self)
+        summary: Dict[str, float] = {"requests": count, "errors": int(count - self.ok.sum()),
+                                     "elapsed_s": self.elapsed,
+                                     "achieved_rate": count / self.elapsed if self.elapsed else 0.0}
+        if not count:
+            return summary
+        skew = self.skew * 1000
+        latency = self.latency * 1000
+        for name, values in (("skew", skew), ("latency", latency)):
+            p50, p99, p999 = np.percentile(values, [50, 99, 99.9])
+            summary.update({f"{name}_mean_ms": float(values.mean()), f"{name}_p50_ms": float(p50),
+                            f"{name}_p99_ms": float(p99), f"{name}_p999_ms": float(p999),
+                            f"{name}_max_ms": float(values.max())})
+        scheduled = self.scheduled
+        span = scheduled.max() - scheduled.min()
+        summary["scheduled_rate"] = count / span if span else 0.0
+        summary["drift_ms_per_s"] = float(np.polyfit(scheduled, skew, 1)[0]) if span else 0.0
+        return summary
+
+async def replay(requests: Iterator[Request], target: Target, max_in_flight: Optional[int]=None,
+                 timeout: Optional[float]=None) -> ReplayResult:
+    """Send requests to a target at their scheduled times.
+
+    Send times are computed from one fixed start time, so a late request
+    does not delay the ones after it and no drift accumulates. Requests due
+    at the same time are sent in bursts without sleeping in between, which
+    keeps the scheduler ahead of traces with tens of thousands of requests
+    per second.
+
+    Args:
+        requests: The requests, sorted by scheduled time (e.g. from iter_requests).
+        target: An async callable called with each request.
+        max_in_flight: The maximum number of requests waiting for the target.
+                       When reached, sending pauses, which shows up as skew.
+        timeout: The number of seconds after which a request counts as failed.
+
+    Returns:
+        The send times, completion times and errors of the requests.
+    """
+    loop = asyncio.get_running_loop()
+    clock = loop.time
+    result = ReplayResult()
+    pending = set()
+    slots = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+    start = clock()
+
+    async def send(request: Request) -> None:
+        sent = clock() - start
+        ok = False
+        try:
+            if timeout is None:
+                await target(request)
+            else:
+                await asyncio.wait_for(target(request), timeout)
+            ok = True
+        except Exception as error:
+            result.errors[type(error).__name__] += 1
+        finally:
+            result._add(request, sent, clock() - start, ok)
+            if slots is not None:
+                slots.release()
+
+    burst = 0
+    for request in requests:
+        delay = request.scheduled - (clock() - start)
+        if delay > SEND_AHEAD:
+            await asyncio.sleep(delay)
+            burst = 0
+        elif burst >= MAX_BURST:
+            await asyncio.sleep(0)
+            burst = 0
+        if slots is not None:
+            await slots.acquire()
+        task = loop.create_task(send(request))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        burst += 1
+    if pending:
+        await asyncio.gather(*pending)
+    result.elapsed = clock() - start
+    return result
+
+def in_process_target(func: Callable[[Request], Any]) -> Target:
+    """Wrap a function (sync or async) of a request as a replay target."""
+    if inspect.iscoroutinefunction(func):
+        return func
+
+    async def target(request: Request) -> Any:
+        return func(request)
+    return target
+
+def simulated_target(seconds_per_token: float=0.0, seconds_per_context_token: float=0.0) -> Target:
+    """A target that takes as long as a server generating the request's tokens would (without doing any work)."""
+    async def target(request: Request) -> None:
+        await asyncio.sleep(request.generated_tokens * seconds_per_token
+                            + request.context_tokens * seconds_per_context_token)
+    return target
+
+async def null_target(request: Request) -> None:
+    """A target that returns immediately, for measuring the replayer itself."""
+
+class HttpTarget:
+    """Send each request as an HTTP/1.1 POST with a JSON body, over a pool of keep-alive connections.
+
+    The body is {"context_tokens": ..., "max_tokens": ...} by default; pass
+    body to send something else (e.g. a prompt of the request's length).
+    Responses with a status of 400 or above count as errors.
+    """
+    def __init__(self, url: str, connections: int=64,
+                 body: Optional[Callable[[Request], Dict[str, Any]]]=None) -> None:
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise ValueError(f"Only http:// URLs are supported, not {url!r}")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.body = body or (lambda request: {"context_tokens": request.context_tokens,
+                                              "max_tokens": request.generated_tokens})
+        self._idle: List[Any] = []
+        self._slots = asyncio.Semaphore(connections)
+
+    async def __call__(self, request: Request) -> int:
+        payload = json.dumps(self.body(request)).encode()
+        head = (f"POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n").encode()
+        async with self._slots:
+            reader, writer = self._idle.pop() if self._idle else await asyncio.open_connection(self.host, self.port)
+            try:
+                writer.write(head + payload)
+                status, keep_alive = await _read_response(reader)
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+        if status >= 400:
+            raise HttpError(status)
+        return status
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+            await writer.wait_closed()
+
+class HttpError(Exception):
+    def __init__(self, status: int) -> None:
+        super().__init__(f"HTTP status {status}")
+        self.status = status
+
+async def _read_headers(reader: asyncio.StreamReader) -> List[bytes]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    return head[:-4].split(b"\r\n")
+
+async def _read_chunked(reader: asyncio.StreamReader) -> None:
+    # chunks of "<hex size>[;extensions]\r\n<data>\r\n", ended by a 0-size chunk and optional trailers
+    while True:
+        size = int((await reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+        if not size:
+            break
+        await reader.readexactly(size + 2)
+    while await reader.readuntil(b"\r\n") != b"\r\n":
+        pass
+
+async def _read_response(reader: asyncio.StreamReader) -> tuple:
+    """Read a response, returning its status and whether the connection can be reused."""
+    lines = await _read_headers(reader)
+    status = int(lines[0].split(b" ", 2)[1])
+    headers = {key.strip(): value.strip() for key, value in (line.lower().split(b":", 1) for line in lines[1:])}
+    keep_alive = headers.get(b"connection") != b"close"
+    if b"chunked" in headers.get(b"transfer-encoding", b""):
+        await _read_chunked(reader)
+    elif b"content-length" in headers:
+        await reader.readexactly(int(headers[b"content-length"]))
+    elif status < 200 or status in (204, 304):
+        pass
+    else:
+        # the body ends when the server closes the connection
+        await reader.read()
+        keep_alive = False
+    return status, keep_alive
+
+async def serve_stub(host: str="127.0.0.1", port: int=0, seconds_per_token: float=0.0,
+                     chunked: bool=False) -> asyncio.AbstractServer:
+    """Start a local HTTP server that stands in for an inference server.
+
+    It answers every POST with 200 after sleeping for max_tokens times
+    seconds_per_token, so HttpTarget can be tried without a serving stack.
+    With chunked, the body is sent with Transfer-Encoding: chunked, as
+    streaming inference servers do. The port it listens on is
+    server.sockets[0].getsockname()[1].
+    """
+    if chunked:
+        response = (b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n"
+                    b"1\r\n{\r\n1\r\n}\r\n0\r\n\r\n")
+    else:
+        response = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}"
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                lines = await _read_headers(reader)
+                headers = dict(line.lower().split(b":", 1) for line in lines[1:])
+                payload = await reader.readexactly(int(headers.get(b"content-length", b"0")))
+                if seconds_per_token:
+                    await asyncio.sleep(json.loads(payload).get("max_tokens", 0) * seconds_per_token)
+                writer.write(response)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
+
+def run_replay(source: Union[str, Dict[str, np.ndarray]], target: Union[str, Target]="null",
+               speedup: float=1.0, rate_multiplier: float=1.0, limit: Optional[int]=None,
+               duration: Optional[float]=None, max_in_flight: Optional[int]=None,
+               timeout: Optional[float]=None, cache_dir: Optional[str]=None, seed: int=0) -> ReplayResult:
+    """Replay a trace against a target, e.g. run_replay("data/AzureLLMInferenceTrace_code.csv", "http://localhost:8000/").
+
+    Args:
+        source: A trace CSV file or URL (loaded with llm_traces.load_trace), or trace columns.
+        target: An async callable, an http:// URL, 'stub' (a local HTTP
+                stand-in started for the replay), or 'null' (returns at once).
+        speedup, rate_multiplier, limit, duration, seed: As for iter_requests.
+        max_in_flight, timeout: As for replay.
+        cache_dir: The cache directory for load_trace.
+
+    Returns:
+        The send times, completion times and errors of the requests.
+    """
+    trace = load_trace(source, columns=None, cache_dir=cache_dir) if isinstance(source, str) else source
+    requests = iter_requests(trace, speedup, rate_multiplier, limit, duration, seed)
+
+    async def main() -> ReplayResult:
+        server = None
+        replay_target = target
+        if target == "null":
+            replay_target = null_target
+        elif target == "stub":
+            server = await serve_stub()
+            replay_target = HttpTarget(f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/")
+        elif isinstance(target, str):
+            replay_target = HttpTarget(target)
+        try:
+            return await replay(requests, replay_target, max_in_flight, timeout)
+        finally:
+            if isinstance(replay_target, HttpTarget):
+                await replay_target.close()
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+    return asyncio.run(main())
+
+def main(argv: Optional[List[str]]=None) -> None:
+    import argparse
+    parser = argparse.ArgumentParser(description="Replay an LLM inference trace as a timed request stream.")
+    parser.add_argument("source", help="trace CSV file or URL")
+    parser.add_argument("--target", default="null",
+                        help="http:// URL to POST to, 'stub' for a local stand-in server, or 'null' (default)")
+    parser.add_argument("--speedup", type=float, default=1.0, help="factor to compress the trace's time by")
+    parser.add_argument("--rate-multiplier", type=float, default=1.0, help="requests to send per trace row")
+    parser.add_argument("--limit", type=int, default=None, help="number of trace rows to replay")
+    parser.add_argument("--duration", type=float, default=None, help="seconds of (compressed) trace to replay")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="maximum number of outstanding requests")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds after which a request fails")
+    parser.add_argument("--cache-dir", default=None, help="cache directory for the parsed trace")
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    result = run_replay(args.source, args.target, args.speedup, args.rate_multiplier, args.limit, args.duration,
+                        args.max_in_flight, args.timeout, args.cache_dir)
+    for key, value in result.summary().items():
+        print(f"{key:20s} {value:12.3f}")
+    if result.errors:
+        print("errors:", dict(result.errors))
+    print(f"{'wall_s':20s} {time.perf_counter() - started:12.3f}")
+
+if __name__ == "__main__":
+    main()
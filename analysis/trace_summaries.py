@@ -0,0 +1,185 @@
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+NS_PER_SECOND = 1_000_000_000
+# integer columns whose values span at most this many (or 2 per row) distinct values get exact CDFs
+MAX_EXACT_RANGE = 1 << 22
+MAX_POINTS = 2000
+
+def as_nanoseconds(timestamps) -> np.ndarray:
+    """Get timestamps as int64 nanoseconds since the epoch, without copying int64 input.
+
+    Args:
+        timestamps: int64 nanoseconds (e.g. the TIMESTAMP column of
+                    llm_traces.load_trace), a datetime64 array, or a pandas
+                    datetime Series or index (timezone-aware ones in UTC).
+    """
+    if hasattr(timestamps, "dt"):
+        timestamps = timestamps.array
+    if hasattr(timestamps, "as_unit"):
+        return np.asarray(timestamps.as_unit("ns").asi8)
+    values = np.asarray(timestamps)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").view(np.int64)
+    if values.dtype != np.int64:
+        raise ValueError(f"Expected int64 nanoseconds or datetimes, not {values.dtype}")
+    return values
+
+def _selected(values, where: Optional[np.ndarray]) -> np.ndarray:
+    values = np.asarray(values)
+    if values.dtype.kind == "b":
+        # as 0/1 integers, so that bool columns take the integer path (bools cannot be subtracted)
+        values = values.view(np.int8)
+    mask = np.isfinite(values) if values.dtype.kind == "f" else None
+    if where is not None:
+        where = np.asarray(where, dtype=bool)
+        mask = where if mask is None else mask & where
+    return values if mask is None or mask.all() else values[mask]
+
+def _downsample(x: np.ndarray, y: np.ndarray, max_points: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    # keep the points at evenly spaced CDF levels, so the curve is off by at most 100 / max_points percent
+    if max_points is None or len(x) <= max_points:
+        return x, y
+    keep = np.unique(np.searchsorted(y, np.linspace(y[0], y[-1], max_points - 1)))
+    keep = np.union1d(keep, [len(y) - 1])
+    return x[keep], y[keep]
+
+def cdf(values, where: Optional[np.ndarray]=None, max_points: Optional[int]=MAX_POINTS,
+        bins: int=MAX_POINTS, log: Optional[bool]=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the CDF of a column as plot-ready arrays, in O(n).
+
+    Integer columns with a limited range (e.g. token counts) are counted
+    with np.bincount. Their CDF is exact: it passes through the same points
+    as plotting the sorted values against 100 * rank / n, with two points
+    per distinct value instead of one per row. Other columns are counted
+    into a histogram of bins buckets, so their CDF is exact at the bucket
+    edges. NaNs are ignored.
+
+    Args:
+        values: The column (an array or a pandas Series).
+        where: A boolean mask of the rows to include, so that subsets need no
+               filtered copy of the data frame.
+        max_points: The maximum number of points to return (None for all).
+        bins: The number of histogram buckets for non-integer columns.
+        log: Whether to space the buckets logarithmically (default: when the
+             positive values span more than 3 orders of magnitude). Rows
+             that are not positive are then counted below the first bucket.
+
+    Returns:
+        The values, and the percentage of rows below each value.
+    """
+    values = _selected(values, where)
+    count = len(values)
+    if not count:
+        return np.zeros(0), np.zeros(0)
+    low, high = values.min(), values.max()
+
+    if values.dtype.kind in "iu" and int(high) - int(low) < max(MAX_EXACT_RANGE, 2 * count):
+        counts = np.bincount((values - low).astype(np.intp, copy=False))
+        distinct = np.flatnonzero(counts)
+        last = np.cumsum(counts[distinct])
+        # each distinct value spans the ranks [first, last - 1], a vertical step of the sorted-values plot
+        x = np.repeat(distinct + int(low), 2)
+        y = np.empty(len(x))
+        y[0::2] = last - counts[distinct]
+        y[1::2] = last - 1
+        return _downsample(x, y * (100.0 / count), max_points)
+
+    if count <= bins:
+        x = np.sort(values)
+        return _downsample(x, 100.0 * np.arange(count) / count, max_points)
+    positive = values > 0
+    positive_low = np.min(values, where=positive, initial=high) if high > 0 else None
+    if log is None:
+        log = bool(positive_low is not None and high > 1000 * positive_low)
+    if log and positive_low is not None:
+        # rows that are not positive get -inf, which is outside the histogram's range
+        logs = np.log(values, out=np.full(count, -np.inf), where=positive)
+        counts, edges = np.histogram(logs, bins=bins, range=(np.log(positive_low), np.log(high)))
+        edges = np.exp(edges)
+        offset = count - int(counts.sum())
+    else:
+        counts, edges = np.histogram(values, bins=bins)
+        offset = 0
+    below = np.concatenate(([offset], offset + np.cumsum(counts)))
+    return _downsample(edges, below * (100.0 / count), max_points)
+
+def quantiles(values, q: Union[float, Sequence[float]], where: Optional[np.ndarray]=None) -> np.ndarray:
+    """Get the smallest values with at least a fraction q of the rows at or below them, in O(n).
+
+    Args:
+        values: The column (an array or a pandas Series).
+        q: The fractions, between 0 and 1 (others raise a ValueError).
+        where: A boolean mask of the rows to include. NaNs are ignored.
+    """
+    q = np.asarray(q, dtype=float)
+    if not np.all((q >= 0) & (q <= 1)):
+        raise ValueError(f"Quantiles must be between 0 and 1, got {q}")
+    values = _selected(values, where)
+    if not len(values):
+        return np.full(q.shape, np.nan)
+    low, high = values.min(), values.max()
+    if values.dtype.kind in "iu" and int(high) - int(low) < max(MAX_EXACT_RANGE, 2 * len(values)):
+        cumulative = np.cumsum(np.bincount((values - low).astype(np.intp, copy=False)))
+        ranks = np.maximum(np.ceil(q * len(values)), 1)
+        return np.searchsorted(cumulative, ranks) + low
+    return np.quantile(values, q, method="inverted_cdf")
+
+def rate_series(timestamps, weights=None, where: Optional[np.ndarray]=None, groups: Optional[np.ndarray]=None,
+                group_count: Optional[int]=None, bucket_seconds: float=60, align: str="floor"
+                ) -> Tuple[np.ndarray, np.ndarray]:
+    """Count (or sum) rows per time bucket, e.g. invocations or tokens per minute, in O(n).
+
+    Buckets are aligned to the clock (e.g. whole minutes), and buckets
+    without rows are included as 0. The rows are binned with np.bincount,
+    so no data frame is copied, rounded or grouped.
+
+    Args:
+        timestamps: The timestamps, as for as_nanoseconds.
+        weights: The values to sum per bucket (default: count the rows).
+        where: A boolean mask of the rows to include.
+        groups: Integer codes in [0, group_count) to get one series per group,
+                e.g. (NumImages > 0) to split image and text requests.
+        group_count: The number of groups (default: the largest code + 1).
+        bucket_seconds: The width of the buckets.
+        align: 'floor' to put each row in the bucket it falls in, or 'round'
+               to put it in the bucket whose start is nearest, like
+               Series.dt.round (except that halfway rows round up, not to even).
+
+    Returns:
+        The start of each bucket in int64 nanoseconds (use
+        .view('datetime64[ns]') to plot them as dates), and the count or sum
+        per bucket, with shape (group_count, buckets) if groups are given.
+    """
+    timestamps = as_nanoseconds(timestamps)
+    width = int(round(bucket_seconds * NS_PER_SECOND))
+    if width <= 0:
+        raise ValueError("bucket_seconds must be positive")
+    if align not in ("floor", "round"):
+        raise ValueError(f"align must be 'floor' or 'round', not {align!r}")
+    buckets = (timestamps + width // 2) // width if align == "round" else timestamps // width
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+    if where is not None:
+        where = np.asarray(where, dtype=bool)
+        buckets = buckets[where]
+        weights = weights[where] if weights is not None else None
+        groups = np.asarray(groups)[where] if groups is not None else None
+    if not len(buckets):
+        shape = (group_count or 0, 0) if groups is not None else (0,)
+        return np.zeros(0, dtype=np.int64), np.zeros(shape)
+    first = buckets.min()
+    buckets -= first
+    length = int(buckets.max()) + 1
+    if groups is None:
+        values = np.bincount(buckets, weights, minlength=length)
+    else:
+        groups = np.asarray(groups, dtype=np.int64)
+        if group_count is None:
+            group_count = int(groups.max()) + 1
+        if len(groups) and (groups.min() < 0 or groups.max() >= group_count):
+            raise ValueError(f"Group codes must be in [0, {group_count})")
+        values = np.bincount(buckets * group_count + groups, weights,
+                             minlength=length * group_count).reshape(length, group_count).T
+    return (first + np.arange(length, dtype=np.int64)) * width, values
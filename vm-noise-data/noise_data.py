@@ -0,0 +1,184 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# hive-style partition keys, in the order they appear in the paths:
+# test_suite=<suite>/test_name=<name>/vm_lifespan=<lifespan>/vm_region=<region>/vm_sku=<sku>/unit=<unit>.csv
+PARTITION_KEYS = ["test_suite", "test_name", "vm_lifespan", "vm_region", "vm_sku", "unit"]
+DATA_COLUMNS = ["value", "runtime", "starttime", "VM_id"]
+DTYPES = {"value": np.float64, "runtime": np.float64, "starttime": str, "VM_id": np.int32}
+FORMATS = (".csv", ".parquet")
+
+# a filter is a value, a collection of values, or a predicate on the value
+Filter = Union[str, Iterable[str], Callable[[str], bool]]
+
+def parse_partition(path: str, root: str=".") -> Optional[Dict[str, str]]:
+    """Get the partition keys of a data file from its path.
+
+    Args:
+        path: The path of the file.
+        root: The root of the partitioned tree.
+
+    Returns:
+        The partition values keyed by PARTITION_KEYS, or None if the path
+        is not a data file of the tree.
+    """
+    parts = os.path.relpath(path, root).split(os.sep)
+    if len(parts) != len(PARTITION_KEYS):
+        return None
+    stem, extension = os.path.splitext(parts[-1])
+    if extension not in FORMATS:
+        return None
+    parts[-1] = stem
+    partition = {}
+    for key, part in zip(PARTITION_KEYS, parts):
+        name, _, value = part.partition("=")
+        if name != key:
+            return None
+        partition[key] = value
+    return partition
+
+def list_partitions(root: str=".", data_format: str=".csv") -> List[Tuple[str, Dict[str, str]]]:
+    """List the data files of a partitioned tree and their partition keys, without opening any file."""
+    files = []
+    for directory, subdirectories, file_names in os.walk(root):
+        subdirectories.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(data_format):
+                path = os.path.join(directory, file_name)
+                partition = parse_partition(path, root)
+                if partition is not None:
+                    files.append((path, partition))
+    return files
+
+def _matches(value: str, condition: Filter) -> bool:
+    if callable(condition):
+        return condition(value)
+    if isinstance(condition, str):
+        return value == condition
+    return value in condition
+
+def select_partitions(files: Sequence[Tuple[str, Dict[str, str]]],
+                      filters: Optional[Mapping[str, Filter]]=None) -> List[Tuple[str, Dict[str, str]]]:
+    """Prune data files by their partition keys.
+
+    Args:
+        files: The (path, partition) pairs, as returned by list_partitions.
+        filters: Partition keys mapped to the value to keep, a collection of
+                 values to keep, or a predicate on the value.
+
+    Returns:
+        The files whose partitions match every filter.
+    """
+    filters = dict(filters or {})
+    unknown = set(filters) - set(PARTITION_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown partition keys {sorted(unknown)} - the partition keys are {PARTITION_KEYS}")
+    return [(path, partition) for path, partition in files
+            if all(_matches(partition[key], condition) for key, condition in filters.items())]
+
+def _read_file(path: str, columns: Sequence[str]) -> pd.DataFrame:
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=list(columns)).to_pandas()
+    return pd.read_csv(path, usecols=list(columns), dtype={column: DTYPES[column] for column in columns})
+
+def load(root: str=".", filters: Optional[Mapping[str, Filter]]=None, columns: Optional[Sequence[str]]=None,
+         workers: int=8, parse_dates: bool=False, data_format: str=".csv") -> pd.DataFrame:
+    """Load the measurements of the partitions that match some filters.
+
+    Only the files whose partition keys match the filters are opened. They
+    are read in a thread pool, and the partition keys are added as
+    categorical columns, so no per-row strings are created for them.
+
+    Args:
+        root: The root of the partitioned tree (e.g. the vm-noise-data directory).
+        filters: Filters on the partition keys, as for select_partitions, e.g.
+                 {'test_suite': 'PostgreSQL', 'vm_sku': ['B8ms']}.
+        columns: The data columns to read (default: all of DATA_COLUMNS).
+        workers: The number of reader threads.
+        parse_dates: Whether to parse starttime into datetimes.
+        data_format: '.csv' to read the original tree, or '.parquet' to read a
+                     tree written by convert_to_parquet.
+
+    Returns:
+        The measurements, with one column per partition key and data column.
+    """
+    columns = list(columns) if columns is not None else list(DATA_COLUMNS)
+    unknown = set(columns) - set(DATA_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns {sorted(unknown)} - the data columns are {DATA_COLUMNS}")
+    files = select_partitions(list_partitions(root, data_format), filters)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        frames = list(executor.map(lambda file: _read_file(file[0], columns), files))
+    lengths = np.array([len(frame) for frame in frames], dtype=np.int64)
+    if frames:
+        data = pd.concat(frames, ignore_index=True)
+    else:
+        data = pd.DataFrame({column: pd.Series(dtype=DTYPES[column]) for column in columns})
+
+    # partition columns: one code per file, repeated over its rows
+    partition_columns = {}
+    for key in PARTITION_KEYS:
+        values = [partition[key] for _, partition in files]
+        categories = sorted(set(values))
+        index = {category: i for i, category in enumerate(categories)}
+        codes = np.repeat(np.array([index[value] for value in values], dtype=np.int32), lengths)
+        partition_columns[key] = pd.Categorical.from_codes(codes, categories=categories)
+    data = pd.concat([pd.DataFrame(partition_columns), data], axis=1)
+    if parse_dates and "starttime" in data:
+        data["starttime"] = pd.to_datetime(data["starttime"], format="ISO8601")
+    return data
+
+def convert_to_parquet(root: str, output_dir: str, workers: int=8) -> int:
+    """Convert the CSV tree into a Parquet tree with the same partition layout.
+
+    The Parquet tree is read with load(output_dir, data_format='.parquet').
+    It is not updated when the CSV files change, so re-run the conversion
+    after updating the data.
+
+    Args:
+        root: The root of the CSV tree.
+        output_dir: The directory to write the Parquet tree to.
+        workers: The number of converter threads.
+
+    Returns:
+        The number of files converted.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Converting to Parquet requires pyarrow - install it or read the CSV files')
+    schema = pa.schema([("value", pa.float64()), ("runtime", pa.float64()), ("starttime", pa.string()),
+                        ("VM_id", pa.int32())])
+    convert_options = pa_csv.ConvertOptions(column_types=schema)
+
+    def convert(file: Tuple[str, Dict[str, str]]) -> None:
+        path, _ = file
+        target = os.path.join(output_dir, os.path.splitext(os.path.relpath(path, root))[0] + ".parquet")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        pq.write_table(pa_csv.read_csv(path, convert_options=convert_options), target)
+
+    files = list_partitions(root)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(convert, files))
+    return len(files)
+
+def main(argv: Optional[List[str]]=None) -> None:
+    parser = argparse.ArgumentParser(description="Convert the VM noise CSV tree into a Parquet tree.")
+    parser.add_argument("root", help="root of the CSV tree (the vm-noise-data directory)")
+    parser.add_argument("output_dir", help="directory to write the Parquet tree to")
+    parser.add_argument("--workers", type=int, default=8, help="number of converter threads")
+    args = parser.parse_args(argv)
+    count = convert_to_parquet(args.root, args.output_dir, args.workers)
+    print(f"Converted {count} files to {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
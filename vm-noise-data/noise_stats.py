@@ -0,0 +1,369 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from noise_data import PARTITION_KEYS, Filter, list_partitions, select_partitions
+
+# group levels: per VM (VM_id is unique within a partition), and per partition,
+# i.e. per (sku, region, lifespan) of each test and unit
+GROUP_BY = {"vm": PARTITION_KEYS + ["VM_id"], "partition": list(PARTITION_KEYS)}
+COLUMNS = ("value", "runtime")
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+# group keys are (partition id << 32 | VM_id), and sketch bins are (group key << code bits | bin code),
+# with as many code bits as the sketch needs for its accuracy and value range
+_VM_BITS = 32
+_MAX_CODE_BITS = 63 - _VM_BITS - 1
+
+class _Sketch:
+    """Log-spaced buckets with a relative accuracy bound (as in DDSketch).
+
+    A value x is counted in bucket ceil(log(|x|) / log(gamma)), so every value
+    in a bucket is within relative_accuracy of the bucket's representative
+    value. Bucket counts of the same group are simply added, so sketches
+    merge exactly, and each group holds at most one count per occupied bucket.
+    Magnitudes up to min_value count as zero, and the codes are sized to hold
+    every bucket up to max_value.
+    """
+    def __init__(self, relative_accuracy: float, min_value: float=1e-9, max_value: float=1e15) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy must be between 0 and 1, got {relative_accuracy}")
+        if not 0 < min_value < max_value:
+            raise ValueError(f"Need 0 < min_value < max_value, got {min_value} and {max_value}")
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.min_value = min_value
+        self.max_value = max_value
+        # bucket keys of magnitudes in (min_value, max_value] lie in [-key_limit, key_limit]
+        self.key_limit = int(np.ceil(max(abs(np.log(min_value)), abs(np.log(max_value))) / self.log_gamma)) + 1
+        # codes: 0 for zero, zero_code -/+ (key + key_limit + 1) for negative/positive values
+        self.zero_code = 2 * self.key_limit + 2
+        self.code_bits = (2 * self.zero_code - 1).bit_length()
+        if self.code_bits > _MAX_CODE_BITS:
+            raise ValueError(f"relative_accuracy {relative_accuracy} needs {self.code_bits}-bit bucket codes "
+                             f"for values up to {max_value}, at most {_MAX_CODE_BITS} fit")
+
+    def codes(self, values: np.ndarray) -> np.ndarray:
+        # codes sort in the same order as the values: negative buckets below zero, positive above
+        magnitude = np.abs(values)
+        if len(values) and magnitude.max() > self.max_value:
+            raise ValueError(f"Value {magnitude.max()} is above the sketch's max_value {self.max_value}")
+        nonzero = magnitude > self.min_value
+        keys = np.zeros(len(values), dtype=np.int64)
+        keys[nonzero] = np.ceil(np.log(magnitude[nonzero]) / self.log_gamma)
+        codes = np.full(len(values), self.zero_code, dtype=np.int64)
+        signs = np.sign(values[nonzero]).astype(np.int64)
+        codes[nonzero] = self.zero_code + signs * (keys[nonzero] + self.key_limit + 1)
+        return codes
+
+    def values(self, codes: np.ndarray) -> np.ndarray:
+        offsets = codes - self.zero_code
+        keys = np.abs(offsets) - self.key_limit - 1
+        magnitude = 2 * np.power(self.gamma, keys.astype(float)) / (self.gamma + 1)
+        return np.where(offsets == 0, 0.0, np.sign(offsets) * magnitude)
+
+def _reduce_moments(keys: np.ndarray, count: np.ndarray, mean: np.ndarray, m2: np.ndarray,
+                    minimum: np.ndarray, maximum: np.ndarray) -> Tuple[np.ndarray, ...]:
+    # combine partial moments with equal keys: M2 = sum(M2_i + n_i * (mean_i - mean)^2)
+    if not len(keys):
+        return keys, count, mean, m2, minimum, maximum
+    order = np.argsort(keys, kind="stable")
+    keys, count, mean, m2 = keys[order], count[order], mean[order], m2[order]
+    minimum, maximum = minimum[order], maximum[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    total = np.add.reduceat(count, starts)
+    total_mean = np.add.reduceat(count * mean, starts) / total
+    segment = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(keys)]))
+    total_m2 = np.add.reduceat(m2 + count * (mean - total_mean[segment]) ** 2, starts)
+    return (keys[starts], total, total_mean, total_m2,
+            np.minimum.reduceat(minimum, starts), np.maximum.reduceat(maximum, starts))
+
+def _reduce_bins(keys: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+
+class NoiseStats:
+    """Streaming, mergeable dispersion statistics of noise measurements per group.
+
+    Rows are added chunk by chunk with update(). For each group and column,
+    the count, mean and variance (merged with the parallel Welford update),
+    minimum and maximum are exact, and quantiles come from a log-bucket
+    sketch. Each sketched value is within relative_accuracy of the exact
+    one, so quantiles (interpolated between neighbouring ranks as in pandas)
+    are too, for groups whose values share a sign. The bucket codes are sized
+    for magnitudes up to max_value, and larger values raise a ValueError. The
+    state grows with the number of groups (and occupied buckets), not with
+    the number of rows, and two NoiseStats built from different files are
+    combined with merge().
+    """
+    def __init__(self, group_by: Union[str, Sequence[str]]="vm", columns: Sequence[str]=COLUMNS,
+                 relative_accuracy: float=0.01, compact_rows: int=1_000_000, max_value: float=1e15) -> None:
+        group_by = GROUP_BY[group_by] if isinstance(group_by, str) else list(group_by)
+        unknown = set(group_by) - set(GROUP_BY["vm"])
+        if unknown:
+            raise ValueError(f"Cannot group by {sorted(unknown)} - the group keys are {GROUP_BY['vm']}")
+        self.group_by = group_by
+        self.partition_keys = [key for key in group_by if key != "VM_id"]
+        self.columns = list(columns)
+        self.relative_accuracy = relative_accuracy
+        self.compact_rows = compact_rows
+        self.max_value = max_value
+        self._sketch = _Sketch(relative_accuracy, max_value=max_value)
+        # partition key values of the group -> partition id
+        self._partitions: Dict[Tuple[str, ...], int] = {}
+        empty = np.zeros(0, dtype=np.int64)
+        self._moments = {column: (empty,) + (np.zeros(0),) * 5 for column in self.columns}
+        self._bins = {column: (empty, empty) for column in self.columns}
+        self._pending: Dict[str, List[Tuple[np.ndarray, ...]]] = {column: [] for column in self.columns}
+        self._pending_bins: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {column: [] for column in self.columns}
+        self._pending_rows = 0
+
+    def _partition_id(self, values: Tuple[str, ...]) -> int:
+        partition_id = self._partitions.get(values)
+        if partition_id is None:
+            partition_id = self._partitions[values] = len(self._partitions)
+            if partition_id >= 1 << (63 - _VM_BITS - self._sketch.code_bits):
+                raise ValueError(f"Too many groups for {self._sketch.code_bits}-bit bucket codes - "
+                                 f"use a larger relative_accuracy or max_value")
+        return partition_id
+
+    def update(self, partition: Mapping[str, str], chunk: pd.DataFrame) -> None:
+        """Add a chunk of rows from one partition file.
+
+        Args:
+            partition: The partition keys of the file, as returned by noise_data.parse_partition.
+            chunk: Rows of the file, with the statistics columns (and VM_id if grouping by VM).
+        """
+        base = np.int64(self._partition_id(tuple(partition[key] for key in self.partition_keys)) << _VM_BITS)
+        if "VM_id" in self.group_by:
+            keys = base | chunk["VM_id"].to_numpy(dtype=np.int64)
+        else:
+            keys = np.full(len(chunk), base, dtype=np.int64)
+        for column in self.columns:
+            values = chunk[column].to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            column_keys, values = keys[valid], values[valid]
+            # each row is a partial result of one value, reduced when the state is compacted
+            self._pending[column].append((column_keys, np.ones(len(values)), values, np.zeros(len(values)),
+                                          values, values))
+            self._pending_bins[column].append(((column_keys << self._sketch.code_bits) | self._sketch.codes(values),
+                                               np.ones(len(values), dtype=np.int64)))
+        self._pending_rows += len(chunk)
+        if self._pending_rows >= self.compact_rows:
+            self.compact()
+
+    def compact(self) -> None:
+        """Fold the pending rows into the per-group state."""
+        for column in self.columns:
+            if self._pending[column]:
+                parts = [self._moments[column]] + self._pending[column]
+                self._moments[column] = _reduce_moments(*(np.concatenate(arrays) for arrays in zip(*parts)))
+                parts = [self._bins[column]] + self._pending_bins[column]
+                self._bins[column] = _reduce_bins(*(np.concatenate(arrays) for arrays in zip(*parts)))
+            self._pending[column] = []
+            self._pending_bins[column] = []
+        self._pending_rows = 0
+
+    def merge(self, other: 'NoiseStats') -> 'NoiseStats':
+        """Add the statistics of another NoiseStats (with the same groups and columns) to this one.
+
+        Returns:
+            This NoiseStats.
+        """
+        if other.group_by != self.group_by or other.columns != self.columns \
+                or other.relative_accuracy != self.relative_accuracy or other.max_value != self.max_value:
+            raise ValueError("Can only merge NoiseStats with the same groups, columns, accuracy and max_value")
+        other.compact()
+        # partition ids are assigned per NoiseStats, so map the other's ids to ours
+        mapping = np.zeros(max(len(other._partitions), 1), dtype=np.int64)
+        for values, partition_id in other._partitions.items():
+            mapping[partition_id] = self._partition_id(values)
+        vm_mask = np.int64((1 << _VM_BITS) - 1)
+        code_bits = self._sketch.code_bits
+        for column in self.columns:
+            keys, *moments = other._moments[column]
+            keys = (mapping[keys >> _VM_BITS] << _VM_BITS) | (keys & vm_mask)
+            self._pending[column].append((keys, *moments))
+            bins, counts = other._bins[column]
+            groups = bins >> code_bits
+            groups = (mapping[groups >> _VM_BITS] << _VM_BITS) | (groups & vm_mask)
+            self._pending_bins[column].append(((groups << code_bits) | (bins & ((1 << code_bits) - 1)), counts))
+            self._pending_rows += len(keys)
+        self.compact()
+        return self
+
+    @property
+    def group_count(self) -> int:
+        """The number of groups seen so far."""
+        self.compact()
+        return len(np.unique(np.concatenate([self._moments[column][0] for column in self.columns])))
+
+    def _column_summary(self, column: str, keys: np.ndarray, quantiles: Sequence[float]) -> Dict[str, np.ndarray]:
+        state_keys, count, mean, m2, minimum, maximum = self._moments[column]
+        rows = np.searchsorted(state_keys, keys)
+        present = (rows < len(state_keys)) & (state_keys[np.minimum(rows, len(state_keys) - 1)] == keys) \
+            if len(state_keys) else np.zeros(len(keys), dtype=bool)
+        rows = np.where(present, rows, 0)
+
+        def per_group(values: np.ndarray, missing: float=np.nan) -> np.ndarray:
+            return np.where(present, values[rows], missing) if len(values) else np.full(len(keys), missing)
+
+        n = per_group(count, 0.0)
+        group_mean = per_group(mean)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std = np.where(n > 1, np.sqrt(per_group(m2) / (n - 1)), np.nan)
+            summary = {f"{column}_count": n.astype(np.int64), f"{column}_mean": group_mean, f"{column}_std": std,
+                       f"{column}_cov": std / np.abs(group_mean),
+                       f"{column}_min": per_group(minimum), f"{column}_max": per_group(maximum)}
+
+        # quantiles: the buckets holding ranks floor(q * (n - 1)) and ceil(q * (n - 1)) of each group, from
+        # the running bucket counts, interpolated linearly between them as pandas does
+        bins, counts = self._bins[column]
+        code_bits = self._sketch.code_bits
+        bin_groups = bins >> code_bits
+        bin_values = self._sketch.values(bins & ((1 << code_bits) - 1))
+        cumulative = np.cumsum(counts)
+        first = np.searchsorted(bin_groups, keys)
+        before = np.where(first > 0, cumulative[np.maximum(first - 1, 0)], 0) if len(bins) else np.zeros(len(keys))
+        group_min, group_max = summary[f"{column}_min"], summary[f"{column}_max"]
+
+        def ranked(rank: np.ndarray) -> np.ndarray:
+            index = np.minimum(np.searchsorted(cumulative, before + rank, side="right"), len(bins) - 1)
+            return np.clip(bin_values[index], group_min, group_max)
+
+        def quantile(q: float) -> np.ndarray:
+            if not len(bins):
+                return np.full(len(keys), np.nan)
+            rank = q * np.maximum(n - 1, 0)
+            lower = np.floor(rank)
+            low_value, high_value = ranked(lower), ranked(np.ceil(rank))
+            return np.where(present, low_value + (rank - lower) * (high_value - low_value), np.nan)
+
+        for q in quantiles:
+            summary[f"{column}_p{q * 100:g}"] = quantile(q)
+
+        # Tukey outliers: values outside [q1 - 1.5 IQR, q3 + 1.5 IQR], counted at bucket resolution
+        q1, q3 = quantile(0.25), quantile(0.75)
+        low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        if len(bins):
+            group_index = np.searchsorted(keys, bin_groups)
+            outside = (bin_values < low[group_index]) | (bin_values > high[group_index])
+            outliers = np.bincount(group_index, weights=counts * outside, minlength=len(keys))
+        else:
+            outliers = np.zeros(len(keys))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            summary[f"{column}_outlier_rate"] = np.where(n > 0, outliers / n, np.nan)
+        return summary
+
+    def summary(self, quantiles: Sequence[float]=QUANTILES) -> pd.DataFrame:
+        """Get the statistics of every group.
+
+        Args:
+            quantiles: The quantiles to estimate (e.g. 0.99 gives the columns <column>_p99).
+
+        Returns:
+            One row per group: the group keys, then for each column its count,
+            mean, std (sample), cov (std / |mean|), min, max, quantiles and
+            Tukey outlier rate.
+        """
+        self.compact()
+        keys = np.unique(np.concatenate([self._moments[column][0] for column in self.columns]))
+        partitions = [None] * len(self._partitions)
+        for values, partition_id in self._partitions.items():
+            partitions[partition_id] = values
+        partition_ids = keys >> _VM_BITS
+        table = {}
+        for i, key in enumerate(self.partition_keys):
+            categories = sorted({values[i] for values in partitions})
+            index = {category: code for code, category in enumerate(categories)}
+            codes = np.array([index[values[i]] for values in partitions], dtype=np.int32)
+            table[key] = pd.Categorical.from_codes(codes[partition_ids] if len(keys) else codes[:0],
+                                                   categories=categories)
+        if "VM_id" in self.group_by:
+            table["VM_id"] = (keys & ((1 << _VM_BITS) - 1)).astype(np.int32)
+        for column in self.columns:
+            table.update(self._column_summary(column, keys, quantiles))
+        return pd.DataFrame(table)
+
+def _collect_files(files: Sequence[Tuple[str, Dict[str, str]]], group_by: Union[str, Sequence[str]],
+                   columns: Sequence[str], relative_accuracy: float, chunksize: int, max_value: float) -> NoiseStats:
+    stats = NoiseStats(group_by, columns, relative_accuracy, max_value=max_value)
+    usecols = list(columns) + (["VM_id"] if "VM_id" in stats.group_by else [])
+    for path, partition in files:
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+            stats.update(partition, chunk)
+    stats.compact()
+    return stats
+
+def _batches(files: List[Tuple[str, Dict[str, str]]], count: int) -> List[List[Tuple[str, Dict[str, str]]]]:
+    # spread the files over the batches by size, largest first
+    batches: List[List[Tuple[str, Dict[str, str]]]] = [[] for _ in range(count)]
+    sizes = [0] * count
+    for file in sorted(files, key=lambda file: -os.path.getsize(file[0])):
+        smallest = sizes.index(min(sizes))
+        batches[smallest].append(file)
+        sizes[smallest] += os.path.getsize(file[0])
+    return [batch for batch in batches if batch]
+
+def collect_stats(root: str=".", filters: Optional[Mapping[str, Filter]]=None,
+                  group_by: Union[str, Sequence[str]]="vm", columns: Sequence[str]=COLUMNS,
+                  relative_accuracy: float=0.01, workers: Optional[int]=None, chunksize: int=100_000,
+                  max_value: float=1e15) -> NoiseStats:
+    """Compute the noise statistics of the partition files that match some filters in one pass.
+
+    Files are read chunk by chunk in a process pool; each worker keeps a
+    NoiseStats for its files, and the results are merged.
+
+    Args:
+        root: The root of the partitioned CSV tree (e.g. the vm-noise-data directory).
+        filters: Filters on the partition keys, as for noise_data.select_partitions.
+        group_by: 'vm', 'partition', or a list of partition keys (and optionally VM_id).
+        columns: The columns to summarize.
+        relative_accuracy: The relative accuracy of the quantiles.
+        workers: The number of worker processes (default: the number of CPUs; 1 runs in this process).
+        chunksize: The number of rows read at a time.
+        max_value: The largest magnitude the quantile sketch accepts - larger values raise a ValueError.
+
+    Returns:
+        The merged statistics - call summary() for a table.
+    """
+    files = select_partitions(list_partitions(root), filters)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(files) <= 1:
+        return _collect_files(files, group_by, columns, relative_accuracy, chunksize, max_value)
+    stats = NoiseStats(group_by, columns, relative_accuracy, max_value=max_value)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_collect_files, batch, group_by, columns, relative_accuracy, chunksize, max_value)
+                   for batch in _batches(files, workers * 4)]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
+def main(argv: Optional[List[str]]=None) -> None:
+    parser = argparse.ArgumentParser(description="Compute per-group noise statistics of the VM noise dataset.")
+    parser.add_argument("root", help="root of the CSV tree (the vm-noise-data directory)")
+    parser.add_argument("output_file", help="CSV file to write the statistics to")
+    parser.add_argument("--group-by", default="vm", help="'vm', 'partition', or comma-separated group keys")
+    parser.add_argument("--filter", action="append", default=[], metavar="KEY=VALUE[,VALUE...]",
+                        help="only read partitions with one of these values of a key (repeatable)")
+    parser.add_argument("--relative-accuracy", type=float, default=0.01, help="relative accuracy of the quantiles")
+    parser.add_argument("--max-value", type=float, default=1e15,
+                        help="largest magnitude the quantile sketch accepts")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    filters = {}
+    for item in args.filter:
+        key, _, values = item.partition("=")
+        filters[key] = values.split(",")
+    group_by = args.group_by if args.group_by in GROUP_BY else args.group_by.split(",")
+    stats = collect_stats(args.root, filters, group_by, relative_accuracy=args.relative_accuracy,
+                          workers=args.workers, max_value=args.max_value)
+    stats.summary().to_csv(args.output_file, index=False)
+
+if __name__ == "__main__":
+    main()